@@ -0,0 +1,133 @@
+"""
+Synthetic git repositories for the benchmarks.
+
+Each scenario has a `setup` that builds the first commit and a `change`
+that edits the working tree for one measured round. Contents derive
+from the round number only, so runs are reproducible. Sizes are
+multiplied by `scale` to get quick runs (`--scale 0.01`) out of the
+same scenarios.
+"""
+import os
+import random
+import subprocess
+from dataclasses import dataclass
+
+LINE = 'value_{index} = "{round}" * {index}  # synthetic line for the benchmarks\n'
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    setup: object
+    change: object
+
+
+def git(argv, cwd):
+    subprocess.run(['git', *argv], cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def scaled(count, scale):
+    return max(1, int(count * scale))
+
+
+def write_text(path, lines, round_number, start=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.writelines(LINE.format(index=start + index, round=round_number) for index in range(lines))
+
+
+def create_repo(root, name, scenario, scale):
+    """
+    Create `<root>/<name>` with the scenario's first commit pushed to a
+    bare `<root>/<name>.git`, which acts as `origin`.
+
+    Returns:
+        str: The path of the working repository.
+    """
+    origin = os.path.join(root, f'{name}.git')
+    repo = os.path.join(root, name)
+    git(['init', '-q', '--bare', '-b', 'main', origin], root)
+    git(['init', '-q', '-b', 'main', repo], root)
+    for key, value in (('user.email', 'bench@example.com'), ('user.name', 'bench'), ('commit.gpgsign', 'false')):
+        git(['config', key, value], repo)
+    git(['remote', 'add', 'origin', origin], repo)
+    scenario.setup(repo, scale)
+    git(['add', '.'], repo)
+    git(['commit', '-q', '--allow-empty', '-m', 'init'], repo)
+    git(['push', '-q', '-u', 'origin', 'main'], repo)
+    return repo
+
+
+def module_path(repo, index):
+    return os.path.join(repo, 'src', f'package_{index % 100}', f'module_{index}.py')
+
+
+def setup_small(repo, scale):
+    for index in range(10):
+        write_text(module_path(repo, index), 20, 0)
+
+
+def change_small(repo, scale, round_number):
+    for index in range(10):
+        write_text(module_path(repo, index), 25, round_number)
+
+
+def setup_many_files(repo, scale):
+    for index in range(scaled(10000, scale)):
+        write_text(module_path(repo, index), 5, 0)
+
+
+def change_many_files(repo, scale, round_number):
+    for index in range(scaled(10000, scale)):
+        write_text(module_path(repo, index), 6, round_number)
+
+
+def setup_large_diff(repo, scale):
+    os.makedirs(os.path.join(repo, 'data'), exist_ok=True)
+
+
+def change_large_diff(repo, scale, round_number):
+    # About 100 MB of changed lines across ten files
+    lines = scaled(100 * 1024 * 1024 // len(LINE) // 10, scale)
+    for index in range(10):
+        write_text(os.path.join(repo, 'data', f'table_{index}.py'), lines, round_number, start=index * lines)
+
+
+def setup_renames(repo, scale):
+    for index in range(scaled(1000, scale)):
+        write_text(os.path.join(repo, 'round_0', f'file_{index}.py'), 20, index)
+
+
+def change_renames(repo, scale, round_number):
+    # Move every file to a new directory and touch one line, so git sees renames
+    source = next(name for name in sorted(os.listdir(repo)) if name.startswith('round_'))
+    target = os.path.join(repo, f'round_{round_number}')
+    os.rename(os.path.join(repo, source), target)
+    for index in range(0, scaled(1000, scale), 10):
+        with open(os.path.join(target, f'file_{index}.py'), 'a') as f:
+            f.write(f'renamed = {round_number}\n')
+
+
+def setup_binary(repo, scale):
+    os.makedirs(os.path.join(repo, 'assets'), exist_ok=True)
+
+
+def change_binary(repo, scale, round_number):
+    generator = random.Random(round_number)
+    size = scaled(1024 * 1024, scale)
+    for index in range(20):
+        with open(os.path.join(repo, 'assets', f'blob_{index}.bin'), 'wb') as f:
+            f.write(generator.randbytes(size))
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario('small', '10 modified files', setup_small, change_small),
+        Scenario('many-files', '10k modified files', setup_many_files, change_many_files),
+        Scenario('large-diff', 'about 100 MB of added lines', setup_large_diff, change_large_diff),
+        Scenario('renames', '1k renamed files', setup_renames, change_renames),
+        Scenario('binary', '20 binary blobs of 1 MB', setup_binary, change_binary),
+    )
+}
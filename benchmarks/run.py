@@ -0,0 +1,275 @@
+"""
+Benchmarks for mrkt against synthetic repositories.
+
+Usage:
+    python -m benchmarks.run [--scenarios small,renames] [--scale 0.1]
+                             [--output benchmark.json] [--compare baseline.json]
+
+Every scenario gets a throwaway repository with a local bare `origin`
+and the stub `copilot`/`codex` CLIs from `benchmarks/stubs` on PATH, so
+nothing touches the network. Each round times the phases in process
+(`get_git_status_info`, `get_ai_commit_message`,
+`generate_simple_commit_message`) and then `save` and `update` end to
+end, including the spans they record. Results are written as JSON; pass
+an earlier file to `--compare` to report regressions between revisions.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from src import trace
+from src.git import get_git_status_info, get_staged_snapshot
+from src.main import load_config, main
+from src.message import get_ai_commit_message, generate_simple_commit_message
+
+from .repos import SCENARIOS, create_repo, git
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'stubs')
+DEFAULT_OUTPUT = 'benchmark.json'
+DEFAULT_THRESHOLD = 1.2
+# Differences below this many seconds are noise, whatever the ratio
+NOISE_FLOOR = 0.005
+
+
+@contextmanager
+def stub_agents(latency, output=None):
+    """
+    Put the stub agent CLIs first on PATH for the enclosed block.
+    """
+    values = {
+        'PATH': STUBS_DIR + os.pathsep + os.environ.get('PATH', ''),
+        'MRKT_STUB_LATENCY': str(latency),
+        'MRKT_STUB_OUTPUT': output or '',
+    }
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def silenced_stdout():
+    """
+    Send stdout, including git's own output, to /dev/null.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def timed(call):
+    start = time.perf_counter()
+    value = call()
+    return value, time.perf_counter() - start
+
+
+def span_totals(command):
+    """
+    Sum the recorded span durations by name, prefixed with `command`.
+    """
+    totals = {}
+    for record in trace.get_spans():
+        if record['parent'] is None:
+            continue
+        name = f"{command} > {record['name']}"
+        totals[name] = totals.get(name, 0.0) + record['duration']
+    return totals
+
+
+def run_command(command, config):
+    trace.clear_spans()
+    with silenced_stdout(), trace.span(command):
+        code, duration = timed(lambda: main([command, '--no-cache', '--quiet'], config))
+    if code != 0:
+        raise RuntimeError(f"mrkt {command} exited with {code}")
+    return {command: duration, **span_totals(command)}
+
+
+def run_round(scenario, repo, scale, round_number, config):
+    """
+    Time one round of a scenario: the phases on freshly staged changes,
+    `save` on them, then `update` on a second set of changes.
+
+    Returns:
+        tuple: (dict of phase name to seconds, staged file count, patch bytes)
+    """
+    timings = {}
+    scenario.change(repo, scale, round_number * 2)
+    git(['add', '.'], repo)
+    _, timings['get_git_status_info'] = timed(get_git_status_info)
+    snapshot, timings['get_staged_snapshot'] = timed(get_staged_snapshot)
+    _, timings['get_ai_commit_message'] = timed(
+        lambda: get_ai_commit_message(config, quiet=True, use_cache=False, snapshot=snapshot)
+    )
+    _, timings['generate_simple_commit_message'] = timed(
+        lambda: generate_simple_commit_message(snapshot.iter_diff_chunks())
+    )
+    files, size = snapshot.total_files, snapshot.size
+    timings.update(run_command('save', config))
+    scenario.change(repo, scale, round_number * 2 + 1)
+    timings.update(run_command('update', config))
+    return timings, files, size
+
+
+def summarize(runs):
+    return {
+        'runs': [round(value, 6) for value in runs],
+        'median': round(statistics.median(runs), 6),
+        'min': round(min(runs), 6),
+    }
+
+
+def run_scenario(scenario, root, scale, repeat, agent):
+    """
+    Build the scenario repository under `root` and time `repeat` rounds.
+    """
+    repo = create_repo(root, scenario.name, scenario, scale)
+    config = load_config(repo, environ={})
+    config.update({'MRKT_AGENT': agent, 'MRKT_ALWAYS_QUIET': 'true'})
+    phases = {}
+    with working_directory(repo):
+        for round_number in range(1, repeat + 1):
+            timings, files, size = run_round(scenario, repo, scale, round_number, config)
+            for name, duration in timings.items():
+                phases.setdefault(name, []).append(duration)
+    return {
+        'description': scenario.description,
+        'files': files,
+        'patch_bytes': size,
+        'phases': {name: summarize(runs) for name, runs in phases.items()},
+    }
+
+
+def get_revision():
+    result = subprocess.run(
+        ['git', 'describe', '--always', '--dirty'], cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def run_benchmarks(names, scale=1.0, repeat=3, agent='copilot', latency=0.05, workdir=None):
+    root = workdir or tempfile.mkdtemp(prefix='mrkt-bench-')
+    os.makedirs(root, exist_ok=True)
+    results = {
+        'revision': get_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'scale': scale, 'repeat': repeat, 'agent': agent, 'latency': latency},
+        'scenarios': {},
+    }
+    try:
+        with stub_agents(latency):
+            for name in names:
+                print(f"Running {name}...", file=sys.stderr)
+                results['scenarios'][name] = run_scenario(SCENARIOS[name], root, scale, repeat, agent)
+    finally:
+        if not workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def compare_results(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the median of every phase present in both result sets.
+
+    Returns:
+        list: (scenario, phase, baseline median, median, ratio, regressed) rows.
+    """
+    rows = []
+    for name, scenario in results['scenarios'].items():
+        old_phases = baseline.get('scenarios', {}).get(name, {}).get('phases', {})
+        for phase, summary in scenario['phases'].items():
+            if phase not in old_phases:
+                continue
+            old, new = old_phases[phase]['median'], summary['median']
+            ratio = new / old if old else float('inf')
+            regressed = ratio > threshold and new - old > NOISE_FLOOR
+            rows.append((name, phase, old, new, ratio, regressed))
+    return rows
+
+
+def print_results(results):
+    for name, scenario in results['scenarios'].items():
+        print(f"\n{name}: {scenario['description']} ({scenario['files']} files, {scenario['patch_bytes']} bytes)")
+        for phase, summary in scenario['phases'].items():
+            print(f"  {phase:<48} {summary['median'] * 1000:10.1f} ms  (min {summary['min'] * 1000:.1f})")
+
+
+def print_comparison(rows, baseline):
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    for name, phase, old, new, ratio, regressed in rows:
+        marker = '  REGRESSION' if regressed else ''
+        print(f"  {name:<12} {phase:<48} {old * 1000:10.1f} -> {new * 1000:10.1f} ms  x{ratio:.2f}{marker}")
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Benchmark mrkt on synthetic repositories')
+    parser.add_argument('--scenarios', type=str, default=','.join(SCENARIOS), help=f"Comma separated scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply file counts and sizes, e.g. 0.01 for a quick run')
+    parser.add_argument('--repeat', type=int, default=3, help='Rounds per scenario')
+    parser.add_argument('--agent', choices=['copilot', 'codex'], default='copilot', help='Stub agent to call')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stub agent waits before answering')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='JSON file the results are written to')
+    parser.add_argument('--compare', type=str, help='Earlier results to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Slowdown ratio reported as a regression')
+    parser.add_argument('--workdir', type=str, help='Keep the generated repositories in this directory')
+    return parser
+
+
+def run(argv=None):
+    args = create_parser().parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Error: Unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 1
+    results = run_benchmarks(names, args.scale, args.repeat, args.agent, args.latency, args.workdir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"\nResults written to {args.output}")
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    rows = compare_results(baseline, results, args.threshold)
+    print_comparison(rows, baseline)
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
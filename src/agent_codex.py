@@ -5,39 +5,52 @@ This agent reuses the shared prompt and parsing utilities in `src.prompt`.
 It calls the `codex` CLI (instead of `copilot`) and returns the parsed
 conventional commit message when available.
 """
-import subprocess
+from .runner import run_agent_process
+from .prompt import REFERENCE_FILE, prompt, build_prompt, parse_output_message
 
-from .prompt import prompt, parse_output_message
 
-
-def generate_commit_message_with_codex(story_file=None):
+def run_codex(command_prompt, cancel=None, timeout=None):
     """
-    Generate a commit message using a Codex CLI.
+    Run the Codex CLI with a prompt.
 
     Args:
-        story_file (str, optional): Path to the story file for context.
+        command_prompt (str): The prompt passed to `codex`.
+        cancel (threading.Event, optional): Kills the CLI when set.
+        timeout (float, optional): Deadline in seconds for the CLI.
 
     Returns:
-        str or None: The generated commit message, or None if failed.
+        str or None: The raw CLI output, or None if failed.
     """
-    command_prompt = prompt
-    if story_file:
-        command_prompt = f"{command_prompt} Also, uses as context reference the story on @{story_file}"
-
     try:
-        result = subprocess.run(
-            f'codex "{command_prompt}"',
-            shell=True,
-            capture_output=True,
-            text=True,
+        result = run_agent_process(
+            ['codex', command_prompt],
+            cancel=cancel,
+            timeout=timeout,
         )
 
-        if result.returncode == 0 and result.stdout.strip():
-            parsed = parse_output_message(result.stdout)
-            if parsed:
-                return parsed
-            return None
+        if result and result.ok and result.text.strip():
+            return result.text
     except Exception:
         pass
 
     return None
+
+
+def generate_commit_message_with_codex(story_file=None, reference_file=REFERENCE_FILE, base_prompt=None, cancel=None, timeout=None):
+    """
+    Generate a commit message using a Codex CLI.
+
+    Args:
+        story_file (str, optional): Path to the story file for context.
+        reference_file (str, optional): File holding the changes to describe.
+        base_prompt (str, optional): Prompt to use instead of the shared one.
+        cancel (threading.Event, optional): Kills the CLI when set.
+        timeout (float, optional): Deadline in seconds for the CLI.
+
+    Returns:
+        str or None: The generated commit message, or None if failed.
+    """
+    command_prompt = build_prompt(story_file, reference_file, base_prompt or prompt)
+
+    output = run_codex(command_prompt, cancel, timeout)
+    return parse_output_message(output) if output else None
@@ -6,44 +6,80 @@ This module now delegates shared prompt text and parsing logic to
 `copilot` CLI with the shared prompt and uses the shared parser to
 extract a conventional commit message.
 """
-import subprocess
+import os
+import re
 
-from .prompt import prompt, parse_output_message
+from .runner import run_agent_process
+from .prompt import REFERENCE_FILE, prompt, build_prompt, parse_output_message
 
+# Absolute paths named with `@` in a prompt: references and story excerpts
+PROMPT_PATH_PATTERN = re.compile(r'@(/\S+)')
 
-def generate_commit_message_with_copilot(story_file=None):
+
+def build_copilot_command(command_prompt):
     """
-    Generate a commit message using GitHub Copilot CLI.
+    Return the `copilot` argv for a prompt.
+
+    In `-p` mode copilot only reads files under the working directory, and
+    the private references of `src.transport` live elsewhere, so the
+    directory of every absolute path in the prompt is added with `--add-dir`.
+    """
+    argv = ['copilot', '-p', command_prompt, '--allow-all-tools']
+    cwd = os.getcwd()
+    directories = dict.fromkeys(os.path.dirname(path) for path in PROMPT_PATH_PATTERN.findall(command_prompt))
+    for directory in directories:
+        if os.path.commonpath([cwd, directory]) != cwd:
+            argv += ['--add-dir', directory]
+    return argv
+
+
+def run_copilot(command_prompt, cancel=None, timeout=None):
+    """
+    Run the Copilot CLI with a prompt.
 
     Args:
-        story_file (str, optional): Path to the story file for context.
+        command_prompt (str): The prompt passed to `copilot -p`.
+        cancel (threading.Event, optional): Kills the CLI when set.
+        timeout (float, optional): Deadline in seconds for the CLI.
 
     Returns:
-        str or None: The generated commit message, or None if failed.
+        str or None: The raw CLI output, or None if failed.
     """
-    # Build the command prompt from the shared base prompt. Do not mutate
-    # the imported `prompt` variable; extend it into a new string when
-    # additional context is provided.
-    command_prompt = prompt
-    if story_file:
-        command_prompt = f"{command_prompt} Also, uses as context reference the story on @{story_file}"
-
     try:
-        result = subprocess.run(
-            f'copilot -p "{command_prompt}" --allow-all-tools',
-            shell=True,
-            capture_output=True,
-            text=True,
+        result = run_agent_process(
+            build_copilot_command(command_prompt),
+            cancel=cancel,
+            timeout=timeout,
         )
 
-        if result.returncode == 0 and result.stdout.strip():
-            parsed = parse_output_message(result.stdout)
-            if parsed:
-                return parsed
-            return None
+        if result and result.ok and result.text.strip():
+            return result.text
     except Exception:
         # Fail silently and return None on any exception to preserve
         # the original behavior of falling back to non-AI message.
         pass
 
     return None
+
+
+def generate_commit_message_with_copilot(story_file=None, reference_file=REFERENCE_FILE, base_prompt=None, cancel=None, timeout=None):
+    """
+    Generate a commit message using GitHub Copilot CLI.
+
+    Args:
+        story_file (str, optional): Path to the story file for context.
+        reference_file (str, optional): File holding the changes to describe.
+        base_prompt (str, optional): Prompt to use instead of the shared one.
+        cancel (threading.Event, optional): Kills the CLI when set.
+        timeout (float, optional): Deadline in seconds for the CLI.
+
+    Returns:
+        str or None: The generated commit message, or None if failed.
+    """
+    # Build the command prompt from the shared base prompt. Do not mutate
+    # the imported `prompt` variable; extend it into a new string when
+    # additional context is provided.
+    command_prompt = build_prompt(story_file, reference_file, base_prompt or prompt)
+
+    output = run_copilot(command_prompt, cancel, timeout)
+    return parse_output_message(output) if output else None
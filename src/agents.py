@@ -0,0 +1,106 @@
+"""
+Registry of AI agent backends.
+
+Each backend is declared with an `AgentSpec` and its module is imported
+only when the agent is selected, so adding backends does not slow down
+start-up. Besides the built-in agents, backends can be registered by:
+
+- a `.meerkatrc` entry `MRKT_AGENT_PLUGIN_<NAME>=package.module:function`
+- an installed package exposing a `mrkt.agents` entry point
+
+Any other name is run as a generic CLI (`<agent> -p "<prompt>"`, with the
+changes on stdin).
+"""
+import importlib
+from dataclasses import dataclass
+from typing import Optional
+
+ENTRY_POINT_GROUP = 'mrkt.agents'
+
+
+@dataclass(frozen=True)
+class AgentSpec:
+    """
+    Metadata describing how to call an agent.
+
+    `transport` is `reference_file` when the agent reads the diff from a
+    private reference path (see `src.transport`), or `stdin` when the diff
+    is written to the CLI's stdin. `prompt_style` is `conventional` when
+    the output is parsed with `parse_output_message`, or `raw` when used
+    as is. `sentinel` is the prefix of the line the CLI prints once the
+    message is complete (e.g. a usage footer), where it is stopped.
+    """
+    name: str
+    module: str = ''
+    generate: str = ''
+    run: str = ''
+    transport: str = 'reference_file'
+    timeout: Optional[float] = None
+    prompt_style: str = 'conventional'
+    sentinel: str = ''
+
+
+BUILTIN_AGENTS = {
+    'copilot': AgentSpec(
+        name='copilot',
+        module='.agent_copilot',
+        generate='generate_commit_message_with_copilot',
+        run='run_copilot',
+        sentinel='Total usage est:',
+    ),
+    'codex': AgentSpec(
+        name='codex',
+        module='.agent_codex',
+        generate='generate_commit_message_with_codex',
+        run='run_codex',
+        sentinel='tokens used',
+    ),
+}
+
+
+def spec_from_target(name, target):
+    module, _, generate = target.partition(':')
+    return AgentSpec(name=name, module=module.strip(), generate=generate.strip() or 'generate_commit_message')
+
+
+def find_config_plugin(config, name):
+    key = f"MRKT_AGENT_PLUGIN_{name.upper().replace('-', '_')}"
+    target = config.get(key)
+    return spec_from_target(name, target) if target else None
+
+
+def find_entry_point(name):
+    try:
+        from importlib.metadata import entry_points
+
+        matches = entry_points(group=ENTRY_POINT_GROUP, name=name)
+    except Exception:
+        return None
+    for entry_point in matches:
+        loaded = entry_point.load()
+        if isinstance(loaded, AgentSpec):
+            return loaded
+        return spec_from_target(name, entry_point.value)
+    return None
+
+
+def get_agent_spec(config, name):
+    """
+    Resolve an agent name to its spec without importing its module.
+    """
+    if name in BUILTIN_AGENTS:
+        return BUILTIN_AGENTS[name]
+    spec = find_config_plugin(config, name) or find_entry_point(name)
+    if spec:
+        return spec
+    return AgentSpec(name=name, transport='stdin', prompt_style='raw')
+
+
+def load_agent_function(spec, attribute):
+    """
+    Import the agent's module on first use and return one of its functions.
+    """
+    if not spec.module or not attribute:
+        return None
+    module = importlib.import_module(spec.module, package=__package__)
+    return getattr(module, attribute, None)
@@ -0,0 +1,144 @@
+"""
+On-disk cache for AI generated commit messages.
+
+Entries are stored in `.git/mrkt/message_cache.json` and keyed by the
+stable patch id of the staged diff, the agent name and a hash of the
+story file. The same change therefore hits the cache again after a
+rebase, an aborted commit or a cherry-pick onto another branch.
+
+`--split` and `--repos` read and update the cache from several threads
+and processes, so every read-modify-write holds a thread lock and an
+exclusive `flock` on `message_cache.json.lock`.
+"""
+import fcntl
+import hashlib
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+
+from .runner import stream
+from .state import get_state_path, load_json, save_json
+
+CACHE_FILE_NAME = 'message_cache.json'
+DEFAULT_CACHE_SIZE = 200
+PATCH_ID_COMMAND = ['git', 'patch-id', '--stable']
+
+_lock = threading.Lock()
+
+
+def get_cache_path():
+    return get_state_path(CACHE_FILE_NAME)
+
+
+def get_cache_size(config):
+    try:
+        return max(0, int(config.get('MRKT_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+    except ValueError:
+        return DEFAULT_CACHE_SIZE
+
+
+def compute_patch_id(diff):
+    """
+    Return the `git patch-id --stable` of a diff.
+
+    `diff` is either the patch text or an iterable of bytes chunks, which
+    are streamed to git one at a time. Falls back to a sha1 of the raw
+    diff when git cannot compute it.
+    """
+    chunks = [diff.encode('utf-8')] if isinstance(diff, str) else diff
+    digest = hashlib.sha1()
+    try:
+        with stream(PATCH_ID_COMMAND, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            for chunk in chunks:
+                digest.update(chunk)
+                write_to_process(process, chunk)
+            patch_id = read_patch_id(process)
+    except OSError:
+        patch_id = None
+        for chunk in chunks:
+            digest.update(chunk)
+    return patch_id or digest.hexdigest()
+
+
+def write_to_process(process, chunk):
+    try:
+        process.stdin.write(chunk)
+    except (BrokenPipeError, ValueError):
+        pass
+
+
+def read_patch_id(process):
+    try:
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    output = process.stdout.read().decode('utf-8', 'replace')
+    process.wait()
+    if process.returncode != 0 or not output.strip():
+        return None
+    return output.split()[0]
+
+
+def hash_story_file(story_file):
+    if not story_file or not os.path.exists(story_file):
+        return ''
+    digest = hashlib.sha1()
+    with open(story_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_cache_key(diff, agent_name, story_file=None, excluded=''):
+    """
+    `excluded` is the summary of the files left out of `diff`, whose line
+    counts are part of the prompt.
+    """
+    patch_id = compute_patch_id(diff)
+    story_hash = hash_story_file(story_file)
+    key = f"{patch_id}:{agent_name}:{story_hash}"
+    if excluded:
+        key += ':' + hashlib.sha1(excluded.encode('utf-8')).hexdigest()
+    return key
+
+
+@contextmanager
+def locked_entries(path):
+    """
+    Load the cache entries under the cache lock, and save them when the
+    block ends.
+    """
+    with _lock, open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        entries = load_json(path)
+        yield entries
+        save_json(path, entries)
+
+
+def get_cached_message(key, path=None):
+    """
+    Return the cached message for `key` and mark it as recently used.
+    """
+    path = path or get_cache_path()
+    if not path or key not in load_json(path):
+        return None
+    with locked_entries(path) as entries:
+        message = entries.pop(key, None)
+        if message is not None:
+            entries[key] = message
+    return message
+
+
+def store_cached_message(key, message, max_entries=DEFAULT_CACHE_SIZE, path=None):
+    """
+    Store a message, evicting the least recently used entries over `max_entries`.
+    """
+    path = path or get_cache_path()
+    if not path or max_entries <= 0:
+        return
+    with locked_entries(path) as entries:
+        entries.pop(key, None)
+        entries[key] = message
+        for stale_key in list(entries)[:max(0, len(entries) - max_entries)]:
+            del entries[stale_key]
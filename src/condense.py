@@ -0,0 +1,228 @@
+"""
+Token-budgeted condenser for the diff sent to AI agents.
+
+Diffs larger than `MRKT_MAX_PROMPT_TOKENS` are reduced before reaching the
+agent: files are ranked by how informative they are, repetitive hunks are
+collapsed, hunk bodies are trimmed down to their headers and signature
+lines, and files that still do not fit are replaced by a one-line numstat
+summary. The patch is read twice from the snapshot (once to measure, once
+to render) so memory stays bounded by the budget, not by the diff size.
+"""
+import hashlib
+import re
+from itertools import groupby
+from operator import itemgetter
+
+from .exclude import DEFAULT_EXCLUDES, compile_rules
+
+DEFAULT_MAX_PROMPT_TOKENS = 24000
+CHARS_PER_TOKEN = 4
+MAX_HUNK_LINES = 60
+MAX_HUNK_SIGNATURES = 10
+SUMMARY_TAIL_RESERVE = 40
+
+SIGNATURE_PATTERN = re.compile(
+    r'^[+-]\s*(async def |def |class |function |func |fn |pub |public |private |protected '
+    r'|export |interface |struct |enum |impl |module |type |#+ )'
+)
+DIGITS_PATTERN = re.compile(r'\d+')
+
+
+def estimate_tokens(size):
+    return (size + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def get_max_prompt_tokens(config):
+    try:
+        return max(0, int(config.get('MRKT_MAX_PROMPT_TOKENS', DEFAULT_MAX_PROMPT_TOKENS)))
+    except ValueError:
+        return DEFAULT_MAX_PROMPT_TOKENS
+
+
+def iter_diff_lines(chunks):
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8', 'replace')
+    if pending:
+        yield pending.decode('utf-8', 'replace')
+
+
+def number_diff_lines(lines):
+    index = -1
+    for line in lines:
+        if line.startswith('diff --git '):
+            index += 1
+        yield index, line
+
+
+def iter_file_lines(chunks):
+    """
+    Yield `(index, lines)` for each file of the patch, streaming its lines.
+    """
+    numbered = number_diff_lines(iter_diff_lines(chunks))
+    for index, group in groupby(numbered, key=itemgetter(0)):
+        yield index, (line for _, line in group)
+
+
+def new_hunk(header):
+    return {
+        'header': header,
+        'lines': [],
+        'signatures': [],
+        'total': 0,
+        'fingerprint': hashlib.sha1()
+    }
+
+
+def add_hunk_line(hunk, line):
+    hunk['total'] += 1
+    hunk['fingerprint'].update(DIGITS_PATTERN.sub('0', line.strip()).encode('utf-8'))
+    if len(hunk['lines']) < MAX_HUNK_LINES:
+        hunk['lines'].append(line)
+    if len(hunk['signatures']) < MAX_HUNK_SIGNATURES and SIGNATURE_PATTERN.match(line):
+        hunk['signatures'].append(line)
+
+
+def digest_file(lines):
+    """
+    Split a file's diff lines into its header and bounded hunk digests.
+    """
+    header = []
+    hunks = []
+    for line in lines:
+        if line.startswith('@@'):
+            hunks.append(new_hunk(line))
+            continue
+        if not hunks:
+            header.append(line)
+            continue
+        add_hunk_line(hunks[-1], line)
+    return {'header': header, 'hunks': hunks}
+
+
+def render_hunk(hunk, detail):
+    if detail == 'signatures':
+        return [hunk['header']] + hunk['signatures']
+    lines = [hunk['header']] + hunk['lines']
+    omitted = hunk['total'] - len(hunk['lines'])
+    if omitted > 0:
+        lines.append(f"... ({omitted} more line(s) omitted)")
+    return lines
+
+
+def render_file(digest, detail):
+    """
+    Render a file digest with `full` (trimmed) or `signatures` detail.
+
+    Hunks whose normalized body repeats an earlier hunk are collapsed.
+    """
+    lines = list(digest['header'])
+    seen = set()
+    collapsed = 0
+    for hunk in digest['hunks']:
+        fingerprint = hunk['fingerprint'].hexdigest()
+        if fingerprint in seen:
+            collapsed += 1
+            continue
+        seen.add(fingerprint)
+        lines.extend(render_hunk(hunk, detail))
+    if collapsed:
+        lines.append(f"... ({collapsed} repetitive hunk(s) collapsed)")
+    return '\n'.join(lines) + '\n'
+
+
+def summarize_file(file_info):
+    return f"  {file_info['name']} | +{file_info['additions']} -{file_info['deletions']}"
+
+
+def file_score(file_info):
+    """
+    Rank how informative a file's diff is for the commit message.
+    """
+    if file_info.get('binary'):
+        return 0
+    # Lockfiles, generated and vendored files, when not excluded
+    if compile_rules(DEFAULT_EXCLUDES).match(file_info['name']):
+        return 1
+    if file_info['status'] == 'D':
+        return 2
+    return 3
+
+
+def measure_files(snapshot):
+    sizes = {}
+    for index, lines in iter_file_lines(snapshot.iter_diff_chunks()):
+        if index < 0:
+            continue
+        digest = digest_file(lines)
+        sizes[index] = {
+            'full': len(render_file(digest, 'full')),
+            'signatures': len(render_file(digest, 'signatures'))
+        }
+    return sizes
+
+
+def file_info_at(snapshot, index):
+    if index < len(snapshot.files):
+        return snapshot.files[index]
+    return {'name': f'file {index + 1}', 'status': 'M', 'additions': 0, 'deletions': 0}
+
+
+def plan_details(snapshot, sizes, budget):
+    """
+    Pick the detail level of each file, most informative files first.
+    """
+    order = sorted(
+        sizes,
+        key=lambda index: (
+            -file_score(file_info_at(snapshot, index)),
+            sizes[index]['full']
+        )
+    )
+    details = {}
+    remaining = budget
+    for index in order:
+        for detail in ('full', 'signatures'):
+            if sizes[index][detail] <= remaining:
+                details[index] = detail
+                remaining -= sizes[index][detail]
+                break
+    return details, remaining
+
+
+def render_summaries(summaries, remaining):
+    lines = ["Other changed files (diff omitted):"]
+    used = len(lines[0]) + 1 + SUMMARY_TAIL_RESERVE
+    for position, summary in enumerate(summaries):
+        if used + len(summary) + 1 > remaining:
+            lines.append(f"  ... and {len(summaries) - position} more file(s)")
+            break
+        lines.append(summary)
+        used += len(summary) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def condense_snapshot(snapshot, max_tokens):
+    """
+    Condense the staged patch to fit within `max_tokens`.
+
+    Returns None when the patch already fits (or the budget is disabled),
+    otherwise the condensed diff text.
+    """
+    if not max_tokens or estimate_tokens(snapshot.size) <= max_tokens:
+        return None
+    budget = max_tokens * CHARS_PER_TOKEN
+    sizes = measure_files(snapshot)
+    summary_reserve = min(budget // 4, sum(len(summarize_file(file_info_at(snapshot, i))) + 1 for i in sizes))
+    details, remaining = plan_details(snapshot, sizes, budget - summary_reserve)
+    parts = []
+    for index, lines in iter_file_lines(snapshot.iter_diff_chunks()):
+        if index in details:
+            parts.append(render_file(digest_file(lines), details[index]))
+    summaries = [summarize_file(file_info_at(snapshot, index)) for index in sizes if index not in details]
+    if summaries:
+        parts.append(render_summaries(summaries, remaining + summary_reserve))
+    return ''.join(parts)
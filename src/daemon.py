@@ -0,0 +1,292 @@
+"""
+Long running `mrkt daemon` and the thin client that forwards to it.
+
+The daemon keeps a warm interpreter with every handler, agent module and
+parsed `.meerkatrc` already loaded. The client sends its argv, cwd and
+environment over a per-user Unix domain socket, together with its stdin,
+stdout and stderr file descriptors (SCM_RIGHTS). The daemon forks a child
+per command; the child adopts the client's cwd, environment and file
+descriptors, so output (including git's and the agent's) streams straight
+to the client's terminal, and reports the exit code back on the socket.
+
+The environment and file descriptors are only handed over when the
+socket directory is a real directory owned by the user with mode 0700,
+and both ends of the socket check that the peer runs as the same user
+(SO_PEERCRED); otherwise the command runs in the client's process.
+
+This module is imported on every `mrkt` call, so the client path only
+imports `json` and `socket` when a daemon socket exists.
+"""
+import os
+import sys
+
+FORWARDED_COMMANDS = ('start', 'save', 'update')
+DEFAULT_IDLE_TIMEOUT = 1800
+ACCEPT_TIMEOUT = 1.0
+
+
+def get_daemon_dir():
+    base = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(base, f'mrkt-{os.getuid()}')
+
+
+def is_private_dir(path):
+    """
+    True when `path` is a directory (not a symlink) owned by this user
+    with mode 0700, so no other user can create the socket in it.
+    """
+    import stat
+
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and stat.S_IMODE(info.st_mode) == 0o700
+
+
+def get_peer_uid(conn):
+    """
+    Return the uid of the process at the other end of a Unix socket, or
+    None when it cannot be determined.
+    """
+    import socket
+    import struct
+
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    try:
+        credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    except OSError:
+        return None
+    _, uid, _ = struct.unpack('3i', credentials)
+    return uid
+
+
+def get_socket_path():
+    return os.path.join(get_daemon_dir(), 'daemon.sock')
+
+
+def get_pid_path():
+    return os.path.join(get_daemon_dir(), 'daemon.pid')
+
+
+def should_forward(argv):
+    if os.environ.get('MRKT_DAEMON', '').lower() in ('0', 'false', 'off'):
+        return False
+    command = next((arg for arg in argv if not arg.startswith('-')), None)
+    return command in FORWARDED_COMMANDS
+
+
+def send_message(conn, message):
+    import json
+
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def read_messages(conn):
+    import json
+
+    for line in conn.makefile('rb'):
+        yield json.loads(line)
+
+
+def forward_to_daemon(argv):
+    """
+    Run a command in the daemon.
+
+    Returns the exit code, or None when no daemon is reachable and the
+    command should run in this process.
+    """
+    if not should_forward(argv) or not os.path.exists(get_socket_path()):
+        return None
+    if not is_private_dir(get_daemon_dir()):
+        print(f"Warning: ignoring mrkt daemon, {get_daemon_dir()} is not a private directory", file=sys.stderr)
+        return None
+    import json
+    import signal
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(get_socket_path())
+        if get_peer_uid(client) != os.getuid():
+            print("Warning: ignoring mrkt daemon, its socket is not served by this user", file=sys.stderr)
+            client.close()
+            return None
+        socket.send_fds(client, [b'F'], [0, 1, 2])
+        request = {'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}
+        client.sendall(json.dumps(request).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+    except OSError:
+        client.close()
+        return None
+
+    child_pid = None
+    try:
+        for message in read_messages(client):
+            child_pid = message.get('pid', child_pid)
+            if 'exit' in message:
+                return message['exit']
+    except KeyboardInterrupt:
+        if child_pid:
+            os.kill(child_pid, signal.SIGINT)
+        return 130
+    finally:
+        client.close()
+    print("Error: mrkt daemon closed the connection", file=sys.stderr)
+    return 1
+
+
+def receive_request(conn):
+    import json
+    import socket
+
+    _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+    chunks = []
+    for chunk in iter(lambda: conn.recv(65536), b''):
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks)), fds
+
+
+def run_request(conn, request, fds, config):
+    """
+    Run one forwarded command in a forked child and return its exit code.
+    """
+    from .main import main
+
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    send_message(conn, {'pid': os.getpid()})
+    try:
+        code = main(request['argv'], config)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        import traceback
+
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    send_message(conn, {'exit': code})
+    return code
+
+
+def handle_connection(server, conn):
+    from .main import load_config
+
+    if get_peer_uid(conn) != os.getuid():
+        conn.close()
+        return
+    try:
+        request, fds = receive_request(conn)
+    except (OSError, ValueError):
+        conn.close()
+        return
+    # Resolve the config in the daemon so parsed `.meerkatrc` files stay
+    # cached across commands; the forked child inherits the result.
+    config = load_config(request['cwd'], request['env'])
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            server.close()
+            code = run_request(conn, request, fds, config)
+        finally:
+            os._exit(code)
+    for fd in fds:
+        os.close(fd)
+    conn.close()
+
+
+def serve_connection(server, conn):
+    """
+    Handle one connection, then drop the trace spans the daemon recorded
+    meanwhile (e.g. git calls while loading the config): it runs for hours
+    and never exports them. The child running the command exits with its own.
+    """
+    from .trace import clear_spans
+
+    try:
+        handle_connection(server, conn)
+    finally:
+        clear_spans()
+
+
+def reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def warm_up():
+    """
+    Import the modules used by commands so forked children start warm.
+    """
+    from . import handle_start, handle_save, handle_update  # noqa: F401
+    from . import map_reduce, race, agent_copilot, agent_codex  # noqa: F401
+
+
+def serve(idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Serve forwarded commands until idle for `idle_timeout` seconds or stopped.
+    """
+    import signal
+    import socket
+    import time
+
+    os.makedirs(get_daemon_dir(), mode=0o700, exist_ok=True)
+    if not is_private_dir(get_daemon_dir()):
+        print(f"Error: {get_daemon_dir()} must be a directory owned by you with mode 0700", file=sys.stderr)
+        return 1
+    warm_up()
+    socket_path = get_socket_path()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(16)
+    server.settimeout(ACCEPT_TIMEOUT)
+    with open(get_pid_path(), 'w') as f:
+        f.write(str(os.getpid()))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    last_activity = time.monotonic()
+    try:
+        while not idle_timeout or time.monotonic() - last_activity < idle_timeout:
+            reap_children()
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            last_activity = time.monotonic()
+            serve_connection(server, conn)
+    finally:
+        server.close()
+        for path in (socket_path, get_pid_path()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    return 0
+
+
+def read_daemon_pid():
+    try:
+        with open(get_pid_path(), 'r') as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return None
+    return pid
@@ -0,0 +1,178 @@
+"""
+Paths left out of the diff sent to the agent.
+
+Lockfiles, generated files, vendored code and binary files make diffs
+huge and say little about a change. Staged files matching the rules are
+still committed and listed with their line counts, but their patch is not
+generated (see `src.git.get_staged_snapshot`).
+
+`LOCKFILES` and `GENERATED_PATHS` are also the built-in patterns of the
+fast path (`src.fastpath`) and the files the condenser ranks last
+(`src.condense`). Binary files are the ones git reports as such.
+
+Rules use the `.gitignore` syntax and come from, in order (the last
+matching rule wins, `!pattern` includes a file again):
+
+- the built-in defaults and binary files, unless `MRKT_EXCLUDE_DEFAULTS=false`
+- `MRKT_EXCLUDE` in `.meerkatrc`, comma separated
+- a `.mrktignore` file in the repository, one pattern per line
+"""
+import os
+import re
+
+IGNORE_FILE_NAME = '.mrktignore'
+LOCKFILES = (
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'bun.lockb',
+    'poetry.lock', 'Pipfile.lock', 'uv.lock', 'pdm.lock', 'Cargo.lock', 'Gemfile.lock',
+    'composer.lock', 'go.sum', 'mix.lock', 'pubspec.lock', 'Podfile.lock', 'packages.lock.json',
+)
+GENERATED_PATHS = (
+    'dist/', 'build/', 'coverage/', 'generated/', '__pycache__/', '*.egg-info/',
+    '*.min.js', '*.min.css', '*.map', '*.pyc', '*_pb2.py', '*.generated.*',
+    '*.snap', '__snapshots__/',
+)
+VENDORED_PATHS = ('vendor/', 'node_modules/', 'third_party/')
+DEFAULT_EXCLUDES = LOCKFILES + GENERATED_PATHS + VENDORED_PATHS
+
+# Compiled matchers keyed by their rules, reused by `mrkt daemon`
+_matchers = {}
+# Parsed `.mrktignore` files keyed by path, reused while their mtime does not change
+_ignore_files = {}
+
+
+def glob_to_regex(pattern):
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+            continue
+        if pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+            continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[' and ']' in pattern[index + 1:]:
+            end = pattern.index(']', index + 1)
+            chars = pattern[index + 1:end]
+            parts.append('[' + ('^' + chars[1:] if chars.startswith('!') else chars) + ']')
+            index = end
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return ''.join(parts)
+
+
+def rule_to_regex(rule):
+    """
+    Translate one `.gitignore` pattern into a regex matching whole paths.
+    """
+    directory = rule.endswith('/')
+    rule = rule.rstrip('/')
+    # A slash anywhere but at the end anchors the pattern at the root
+    anchored = '/' in rule
+    body = glob_to_regex(rule.lstrip('/'))
+    prefix = '' if anchored else '(?:.*/)?'
+    suffix = '/.*' if directory else '(?:/.*)?'
+    return f'{prefix}{body}{suffix}'
+
+
+class ExcludeRules:
+    """
+    Rules compiled once: a single regex when no rule is negated, else one
+    regex per rule, checked from the last. With `binary`, files git
+    reports as binary match too.
+    """
+
+    def __init__(self, rules, binary=False):
+        self.rules = tuple(rules)
+        self.binary = binary
+        compiled = [(rule.startswith('!'), rule_to_regex(rule.lstrip('!'))) for rule in self.rules]
+        self.negated = any(negated for negated, _ in compiled)
+        if self.negated:
+            self.patterns = [(negated, re.compile(regex)) for negated, regex in reversed(compiled)]
+        else:
+            self.pattern = re.compile('|'.join(f'(?:{regex})' for _, regex in compiled)) if compiled else None
+
+    def __bool__(self):
+        return bool(self.rules) or self.binary
+
+    def match(self, path):
+        if not self.negated:
+            return bool(self.pattern and self.pattern.fullmatch(path))
+        for negated, pattern in self.patterns:
+            if pattern.fullmatch(path):
+                return not negated
+        return False
+
+    def match_file(self, file_info):
+        """
+        Match a snapshot file by either name for renames and copies, or
+        by its content when it is binary.
+        """
+        if self.binary and file_info['binary']:
+            return True
+        return self.match(file_info['name']) or bool(file_info['old_name'] and self.match(file_info['old_name']))
+
+
+def compile_rules(rules, binary=False):
+    key = (tuple(rules), binary)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = _matchers[key] = ExcludeRules(*key)
+    return matcher
+
+
+def find_ignore_file(start=None):
+    """
+    Walk up from `start` (the cwd by default) to the repository root.
+    """
+    current = start or os.getcwd()
+    while True:
+        path = os.path.join(current, IGNORE_FILE_NAME)
+        if os.path.isfile(path):
+            return path
+        if os.path.exists(os.path.join(current, '.git')):
+            return None
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def read_ignore_file(path):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    cached = _ignore_files.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    rules = []
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    rules.append(line)
+    except OSError:
+        return []
+    _ignore_files[path] = (mtime, rules)
+    return rules
+
+
+def get_exclude_rules(config):
+    rules = []
+    defaults = config.get('MRKT_EXCLUDE_DEFAULTS', 'true').lower() == 'true'
+    if defaults:
+        rules.extend(DEFAULT_EXCLUDES)
+    rules.extend(rule.strip() for rule in config.get('MRKT_EXCLUDE', '').split(',') if rule.strip())
+    ignore_file = find_ignore_file()
+    if ignore_file:
+        rules.extend(read_ignore_file(ignore_file))
+    return compile_rules(rules, binary=defaults)
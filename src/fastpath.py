@@ -0,0 +1,238 @@
+"""
+Commit messages for trivial changes, without calling the agent.
+
+Rules are tried in order on the staged snapshot; the first one matching
+every staged file gives a conventional commit message:
+
+- `generated`: generated files deleted (`dist/`, `*.min.js`, ...)
+- `lockfile`: only lockfiles changed
+- `rename`: files renamed or moved without changes
+- `version`: only version strings changed (`"version": "1.2.3"`)
+- `whitespace`: only whitespace changed, line by line, without touching
+  the indentation of indentation-significant files (`*.py`, `*.yaml`,
+  `Makefile`, ...)
+
+`MRKT_FAST_PATH` lists the rules in use (empty disables the fast path,
+`whitespace` is off by default);
+`MRKT_LOCKFILES` and `MRKT_GENERATED_PATHS` add `.gitignore` patterns to
+the built-in ones, shared with `src.exclude`.
+"""
+import os
+import re
+from fnmatch import fnmatch
+
+from .exclude import GENERATED_PATHS, LOCKFILES, compile_rules
+
+DEFAULT_RULES = 'generated,lockfile,rename,version'
+# Files where the leading whitespace of a line is part of its meaning
+INDENTED_PATHS = (
+    '*.py', '*.pyi', '*.pyx', '*.yaml', '*.yml', 'Makefile', 'GNUmakefile', '*.mk',
+    '*.coffee', '*.haml', '*.pug', '*.sass', '*.styl', '*.nim', '*.fs', '*.hs',
+)
+# Whitespace and version changes are only looked for in small patches
+MAX_PATCH_BYTES = 256 * 1024
+VERSION_PATTERN = re.compile(r'\d+\.\d+(?:\.\d+)?(?:[-.+][0-9A-Za-z.]+)?')
+VERSION_LINE_PATTERN = re.compile(r'version', re.IGNORECASE)
+STRING_LITERAL_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+
+
+def get_rules(config):
+    names = config.get('MRKT_FAST_PATH', DEFAULT_RULES).split(',')
+    return [name.strip() for name in names if name.strip() in RULES]
+
+
+def get_patterns(config, key, defaults):
+    """
+    Compile the built-in patterns and the ones added by `key`.
+    """
+    extra = [pattern.strip() for pattern in config.get(key, '').split(',')]
+    return compile_rules(list(defaults) + [pattern for pattern in extra if pattern])
+
+
+def matches_any(path, patterns):
+    """
+    Match a glob against the path and every trailing part of it, so
+    `dist/*` also matches `web/dist/app.js`.
+    """
+    parts = path.split('/')
+    suffixes = ['/'.join(parts[index:]) for index in range(len(parts))]
+    return any(fnmatch(suffix, pattern) for pattern in patterns for suffix in suffixes)
+
+
+def describe_paths(paths, noun):
+    if len(paths) == 1:
+        return paths[0]
+    if len(paths) == 2:
+        return f"{paths[0]} and {paths[1]}"
+    return f"{len(paths)} {noun}"
+
+
+def common_directory(paths):
+    directory = os.path.commonpath(paths) if paths else ''
+    return directory if directory and directory not in paths else ''
+
+
+def read_file_changes(snapshot):
+    """
+    Return the changed blocks of each file in the patch, in patch order,
+    or None when the patch is too large to look at.
+
+    A block is a `(removed, added)` pair of line lists: the lines a hunk
+    changes between two context lines.
+    """
+    if snapshot.size > MAX_PATCH_BYTES:
+        return None
+    changes = {}
+    blocks = None
+    in_hunk = in_block = False
+    for line in snapshot.diff.splitlines():
+        if line.startswith('diff --git '):
+            blocks = changes.setdefault(line.split(' b/', 1)[-1], [])
+            in_hunk = in_block = False
+        elif line.startswith('@@'):
+            in_hunk = blocks is not None
+            in_block = False
+        elif in_hunk and line and line[0] in '-+':
+            if not in_block:
+                blocks.append(([], []))
+                in_block = True
+            blocks[-1][0 if line[0] == '-' else 1].append(line[1:])
+        else:
+            in_block = False
+    return changes
+
+
+def pair_lines(blocks):
+    """
+    Pair the removed and added lines of every block in order, or return
+    None when a block does not remove as many lines as it adds.
+    """
+    pairs = []
+    for removed, added in blocks:
+        if len(removed) != len(added):
+            return None
+        pairs.extend(zip(removed, added))
+    return pairs
+
+
+def check_generated(config, snapshot):
+    patterns = get_patterns(config, 'MRKT_GENERATED_PATHS', GENERATED_PATHS)
+    names = [file_info['name'] for file_info in snapshot.all_files]
+    if not all(file_info['status'] == 'D' for file_info in snapshot.all_files):
+        return None
+    if not all(patterns.match(name) for name in names):
+        return None
+    if len(names) == 1:
+        return f"chore: remove generated {names[0]}"
+    directory = common_directory(names)
+    if directory:
+        return f"chore: remove generated files in {directory}/"
+    return f"chore: remove {len(names)} generated files"
+
+
+def check_lockfile(config, snapshot):
+    patterns = get_patterns(config, 'MRKT_LOCKFILES', LOCKFILES)
+    names = [file_info['name'] for file_info in snapshot.all_files]
+    if not all(patterns.match(name) for name in names):
+        return None
+    verbs = {file_info['status'] for file_info in snapshot.all_files}
+    verb = {'A': 'add', 'D': 'remove'}.get(verbs.pop(), 'update') if len(verbs) == 1 else 'update'
+    return f"chore(deps): {verb} {describe_paths(names, 'lockfiles')}"
+
+
+def check_rename(config, snapshot):
+    files = snapshot.all_files
+    if not all(file_info['status'] == 'R' and not file_info['additions'] and not file_info['deletions'] for file_info in files):
+        return None
+    if len(files) == 1:
+        return f"refactor: rename {files[0]['old_name']} to {files[0]['name']}"
+    old_directory = common_directory([file_info['old_name'] for file_info in files])
+    new_directory = common_directory([file_info['name'] for file_info in files])
+    if old_directory != new_directory and new_directory:
+        return f"refactor: move {len(files)} files to {new_directory}/"
+    return f"refactor: rename {len(files)} files"
+
+
+def check_version(config, snapshot):
+    lockfiles = get_patterns(config, 'MRKT_LOCKFILES', LOCKFILES)
+    changes = read_file_changes(snapshot)
+    if not changes:
+        return None
+    versions = []
+    for file_info in snapshot.all_files:
+        if lockfiles.match(file_info['name']):
+            continue
+        if file_info['status'] != 'M' or file_info['name'] not in changes:
+            return None
+        pairs = pair_lines(changes[file_info['name']])
+        if not pairs:
+            return None
+        for removed, added in pairs:
+            if not (VERSION_LINE_PATTERN.search(added) or VERSION_PATTERN.fullmatch(added.strip())):
+                return None
+            if VERSION_PATTERN.sub('', removed) != VERSION_PATTERN.sub('', added):
+                return None
+            versions += [match.group(0) for match in VERSION_PATTERN.finditer(added)]
+    distinct = list(dict.fromkeys(versions))
+    if not distinct:
+        return None
+    return f"chore(release): bump version to {distinct[0]}" if len(distinct) == 1 else "chore(release): bump versions"
+
+
+def is_whitespace_change(removed, added, indented):
+    """
+    True when only the whitespace between the tokens of a line changed:
+    never inside a token (`- -c` is not `--c`), inside a string literal,
+    or, for `indented` languages, in the indentation.
+    """
+    if indented and removed[:len(removed) - len(removed.lstrip())] != added[:len(added) - len(added.lstrip())]:
+        return False
+    return removed.split() == added.split() and STRING_LITERAL_PATTERN.findall(removed) == STRING_LITERAL_PATTERN.findall(added)
+
+
+def check_whitespace(config, snapshot):
+    changes = read_file_changes(snapshot)
+    if not changes or not all(file_info['status'] == 'M' and not file_info['binary'] for file_info in snapshot.all_files):
+        return None
+    names = [file_info['name'] for file_info in snapshot.all_files]
+    for name in names:
+        # Blank lines are dropped before pairing, the other lines stay in order
+        blocks = [
+            ([line for line in removed if line.strip()], [line for line in added if line.strip()])
+            for removed, added in changes.get(name, [])
+        ]
+        pairs = pair_lines(blocks)
+        if pairs is None or not blocks:
+            return None
+        indented = matches_any(name, INDENTED_PATHS)
+        if not all(is_whitespace_change(removed, added, indented) for removed, added in pairs):
+            return None
+    return f"style: reformat {describe_paths(names, 'files')}"
+
+
+# Rule name: (check, what a match means)
+RULES = {
+    'generated': (check_generated, 'only generated files were deleted'),
+    'lockfile': (check_lockfile, 'only lockfiles changed'),
+    'rename': (check_rename, 'files were renamed without changes'),
+    'version': (check_version, 'only version strings changed'),
+    'whitespace': (check_whitespace, 'only whitespace changed'),
+}
+
+
+def classify_snapshot(config, snapshot):
+    """
+    Try the enabled rules on the staged snapshot.
+
+    Returns:
+        tuple: `(rule, reason, message)` of the first matching rule, or
+        None when the change needs the agent.
+    """
+    if not snapshot or not snapshot.all_files:
+        return None
+    for name in get_rules(config):
+        check, reason = RULES[name]
+        message = check(config, snapshot)
+        if message:
+            return name, reason, message
+    return None
@@ -0,0 +1,124 @@
+"""
+Prefetching `origin/main` for `--rebase` and `--merge`.
+
+`mrkt start` and `mrkt save` start a background fetch of `origin/main`
+when it is older than `MRKT_FETCH_MAX_AGE` seconds. `--rebase` and
+`--merge` then wait for a fetch still in flight and skip fetching when
+the last successful one is recent enough. The time of the last fetch is
+kept in `.git/mrkt/fetch.json`; a fetch in flight holds
+`.git/mrkt/fetch.lock`, which is released even if it dies.
+
+Only `refs/heads/main` is fetched, without tags, and the negotiation
+only offers the current `origin/main` tip, so the round trip stays small
+in repositories with many local branches.
+"""
+import fcntl
+import time
+from contextlib import contextmanager
+
+from .git import run_command
+from .message import print_message
+from .runner import POLL_INTERVAL, redirect_output, start_detached
+from .state import get_state_path, load_json, save_json
+
+FETCH_FILE_NAME = 'fetch.json'
+FETCH_LOCK_NAME = 'fetch.lock'
+DEFAULT_MAX_AGE = 60.0
+# Longest wait for a background fetch before fetching in the foreground
+FETCH_WAIT_TIMEOUT = 120.0
+REMOTE = 'origin'
+BRANCH = 'main'
+TRACKING_REF = f'refs/remotes/{REMOTE}/{BRANCH}'
+
+
+def get_fetch_path():
+    return get_state_path(FETCH_FILE_NAME)
+
+
+def get_max_age(config):
+    try:
+        return max(0.0, float(config.get('MRKT_FETCH_MAX_AGE', DEFAULT_MAX_AGE)))
+    except ValueError:
+        return DEFAULT_MAX_AGE
+
+
+def is_prefetch_enabled(config):
+    return config.get('MRKT_PREFETCH', 'true').lower() == 'true'
+
+
+def build_fetch_command():
+    argv = ['git', '-c', 'fetch.negotiationAlgorithm=skipping', 'fetch', '--no-tags', '--no-recurse-submodules']
+    if run_command(['git', 'rev-parse', '--verify', '-q', TRACKING_REF], capture_output=True, quiet=True):
+        argv.append(f'--negotiation-tip={TRACKING_REF}')
+    argv.extend([REMOTE, f'+refs/heads/{BRANCH}:{TRACKING_REF}'])
+    return argv
+
+
+def is_fresh(config, now=None):
+    max_age = get_max_age(config)
+    fetched = load_json(get_fetch_path()).get('fetched')
+    return bool(max_age and fetched) and (now or time.time()) - fetched < max_age
+
+
+def fetch_main(quiet=False):
+    """
+    Fetch `origin/main` now and record the time when it succeeded.
+    """
+    if not run_command(build_fetch_command(), quiet=quiet):
+        return False
+    save_json(get_fetch_path(), {'fetched': time.time()})
+    return True
+
+
+@contextmanager
+def fetch_lock(timeout=None):
+    """
+    Hold the fetch lock for the block. Yields the open lock file, or
+    None when it could not be taken within `timeout` seconds (at once
+    when `timeout` is 0).
+    """
+    with open(get_state_path(FETCH_LOCK_NAME), 'a') as lock:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (fcntl.LOCK_NB if deadline is not None else 0))
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    yield None
+                    return
+                time.sleep(POLL_INTERVAL)
+        yield lock
+
+
+def run_fetch_worker(lock_fd):
+    # The worker inherited the lock; it is released when the worker exits
+    redirect_output(keep=(lock_fd,))
+    return 0 if fetch_main(quiet=True) else 1
+
+
+def start_prefetch(config):
+    """
+    Start a background fetch of `origin/main` unless it is fresh, one is
+    already running or prefetching is disabled. Returns the worker pid.
+    """
+    if not is_prefetch_enabled(config) or not get_max_age(config) or is_fresh(config):
+        return None
+    if not run_command(['git', 'remote', 'get-url', REMOTE], capture_output=True, quiet=True):
+        return None
+    with fetch_lock(timeout=0) as lock:
+        if lock is None:
+            return None
+        return start_detached(run_fetch_worker, lock.fileno())
+
+
+def ensure_main_fetched(config, quiet=False):
+    """
+    Make sure `origin/main` is at most `MRKT_FETCH_MAX_AGE` seconds old,
+    waiting for a background fetch first and fetching only when needed.
+    """
+    with fetch_lock(timeout=FETCH_WAIT_TIMEOUT):
+        if is_fresh(config):
+            print_message(f"Using origin/{BRANCH} fetched less than {get_max_age(config):g}s ago", quiet)
+            return True
+        return fetch_main(quiet)
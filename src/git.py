@@ -1,112 +1,404 @@
 """
 Git-related operations for Meerkat CLI.
 """
+import io
+import itertools
+import shlex
 import subprocess
 import sys
 import os
-from pathlib import Path
+import tempfile
+from dataclasses import dataclass, field
+from .runner import run, stream
 
-def run_command(command, capture_output=False, quiet=False):
-    try:
-        if capture_output:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return result.stdout.strip()
-        else:
-            result = subprocess.run(
-                command,
-                shell=True,
-                check=True
-            )
-            return True
-    except subprocess.CalledProcessError as e:
-        if not quiet:
-            print(f"Error: Command failed: {command}", file=sys.stderr)
-            if capture_output and e.stderr:
-                print(e.stderr, file=sys.stderr)
-        return None
+def run_command(argv, capture_output=False, quiet=False, input=None):
+    """
+    Run a git command given as an argv list, without a shell.
+
+    Returns the stripped stdout when `capture_output` is set, True
+    otherwise, or None when the command failed. `input` is written to
+    stdin (e.g. a commit message for `git commit -F -`).
+    """
+    result = run(argv, input=input, capture_output=capture_output)
+    if result and result.ok:
+        return result.text.strip() if capture_output else True
+    if not quiet:
+        print(f"Error: Command failed: {shlex.join(argv)}", file=sys.stderr)
+        if capture_output and result and result.stderr:
+            print(result.stderr, file=sys.stderr)
+    return None
 
 def get_current_branch():
-    branch = run_command(
-        "git rev-parse --abbrev-ref HEAD",
-        capture_output=True,
-        quiet=True
-    )
+    from .git_backend import get_git_backend
+
+    branch = get_git_backend().current_branch()
     return branch if branch else "main"
 
-def get_git_status_info():
-    status_output = run_command(
-        "git diff --cached --name-status",
-        capture_output=True,
-        quiet=True
-    )
-    if not status_output:
+def get_git_dir():
+    from .git_backend import get_git_backend
+
+    return get_git_backend().git_dir()
+
+def get_staged_paths():
+    from .git_backend import get_git_backend
+
+    return get_git_backend().staged_paths()
+
+def has_staged_changes():
+    """
+    True or False, or None when it cannot be determined.
+    """
+    from .git_backend import get_git_backend
+
+    return get_git_backend().has_staged_changes()
+
+def get_mrkt_dir():
+    git_dir = get_git_dir()
+    if not git_dir:
         return None
+    mrkt_dir = git_dir / 'mrkt'
+    mrkt_dir.mkdir(parents=True, exist_ok=True)
+    return mrkt_dir
+
+STAGED_SNAPSHOT_COMMAND = ['git', 'diff', '--cached', '--raw', '--numstat', '--patch', '-z']
+BLOCK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+FILE_HEADER = b'\ndiff --git '
+# Excluded files are left out by pathspec, rerunning git, only when their
+# patches are large enough to be worth it and their paths fit on a command line
+EXCLUDE_PATHSPEC_MIN_LINES = 1000
+MAX_EXCLUDE_PATHSPECS = 1000
+MAX_EXCLUDED_SUMMARY_LINES = 20
+
+@dataclass
+class StagedSnapshot:
+    """
+    Staged changes collected from a single `git diff --cached` call.
+
+    `files` holds one dict per path with its status letter, name (the
+    destination for renames and copies), `old_name`, line counts and a
+    `binary` flag. `patch` is a seekable binary file holding the patch,
+    spooled to disk once it grows past `SPOOL_MAX_MEMORY`. `context` is
+    text sent to the agent ahead of the patch.
+
+    `excluded` holds the files left out of the patch (see `src.exclude`);
+    the patch has one chunk per entry of `files`, in the same order.
+    """
+    files: list = field(default_factory=list)
+    patch: object = None
+    context: str = ''
+    excluded: list = field(default_factory=list)
+
+    @classmethod
+    def from_diff(cls, diff, files=None):
+        return cls(files=files or [], patch=io.BytesIO(diff.encode('utf-8')))
+
+    @property
+    def all_files(self):
+        return self.files + self.excluded
+
+    @property
+    def total_files(self):
+        return len(self.all_files)
+
+    @property
+    def additions(self):
+        return sum(file_info['additions'] for file_info in self.all_files)
+
+    @property
+    def deletions(self):
+        return sum(file_info['deletions'] for file_info in self.all_files)
+
+    @property
+    def size(self):
+        if not self.patch:
+            return 0
+        self.patch.seek(0, io.SEEK_END)
+        return self.patch.tell()
+
+    @property
+    def diff(self):
+        """
+        The whole patch as text. Prefer `iter_diff_chunks` on hot paths.
+        """
+        if not self.patch:
+            return ''
+        self.patch.seek(0)
+        return self.patch.read().decode('utf-8', 'replace')
+
+    def iter_diff_chunks(self):
+        if not self.patch:
+            return
+        self.patch.seek(0)
+        yield from iter_diff_chunks(self.patch)
+
+    def excluded_summary(self):
+        """
+        One numstat line per excluded file, sent to the agent instead of their patch.
+        """
+        if not self.excluded:
+            return ''
+        lines = ["Files left out of the diff (generated, vendored or binary):"]
+        for file_info in self.excluded[:MAX_EXCLUDED_SUMMARY_LINES]:
+            counts = 'binary' if file_info['binary'] else f"+{file_info['additions']} -{file_info['deletions']}"
+            lines.append(f"  {file_info['name']} | {counts}")
+        if len(self.excluded) > MAX_EXCLUDED_SUMMARY_LINES:
+            lines.append(f"  ... and {len(self.excluded) - MAX_EXCLUDED_SUMMARY_LINES} more file(s)")
+        return '\n'.join(lines) + '\n\n'
+
+    def status_info(self):
+        return {
+            'files': self.all_files,
+            'excluded': self.excluded,
+            'total_files': self.total_files,
+            'additions': self.additions,
+            'deletions': self.deletions
+        }
+
+def iter_diff_chunks(stream, block_size=BLOCK_SIZE, max_chunk_size=MAX_CHUNK_SIZE, prefix=b''):
+    """
+    Yield the patch read from a binary stream as per-file bytes chunks.
+
+    Each chunk starts with its `diff --git` header. Files larger than
+    `max_chunk_size` are yielded in several pieces, so memory stays
+    bounded no matter how large the patch is. `prefix` holds patch bytes
+    already read from the stream.
+    """
+    pending = bytearray()
+    blocks = iter(lambda: stream.read(block_size), b'')
+    for block in itertools.chain([prefix] if prefix else [], blocks):
+        pending.extend(block)
+        start = 0
+        boundary = pending.find(FILE_HEADER, start + 1)
+        while boundary != -1:
+            yield bytes(pending[start:boundary + 1])
+            start = boundary + 1
+            boundary = pending.find(FILE_HEADER, start + 1)
+        del pending[:start]
+        if len(pending) > max_chunk_size:
+            keep = len(FILE_HEADER)
+            yield bytes(pending[:-keep])
+            del pending[:-keep]
+    if pending:
+        yield bytes(pending)
+
+def parse_count(value):
+    return int(value) if value.isdigit() else 0
+
+def parse_raw_records(tokens, pos):
     files = []
-    lines = status_output.split('\n')
-    for line in lines:
-        if not line.strip():
-            continue
-        parts = line.split('\t')
-        if len(parts) >= 2:
-            status = parts[0]
-            filename = parts[1]
-            files.append({'status': status, 'name': filename})
-    stat_output = run_command(
-        "git diff --cached --numstat",
+    while pos < len(tokens) and tokens[pos].startswith(':'):
+        status = tokens[pos].split()[-1]
+        entry = {
+            'status': status[0],
+            'name': tokens[pos + 1],
+            'old_name': None,
+            'additions': 0,
+            'deletions': 0,
+            'binary': False
+        }
+        pos += 2
+        if status[0] in 'RC':
+            entry['old_name'] = entry['name']
+            entry['name'] = tokens[pos]
+            pos += 1
+        files.append(entry)
+    return files, pos
+
+def parse_numstat_records(tokens, pos, files):
+    for entry in files:
+        if pos >= len(tokens) or not tokens[pos]:
+            break
+        parts = tokens[pos].split('\t')
+        pos += 3 if len(parts) >= 3 and not parts[2] else 1
+        entry['binary'] = parts[0] == '-'
+        entry['additions'] = parse_count(parts[0])
+        entry['deletions'] = parse_count(parts[1]) if len(parts) > 1 else 0
+    return pos
+
+def read_snapshot_header(stream):
+    """
+    Read the NUL separated raw and numstat records from the stream.
+
+    The records end with an empty record. Returns the header and the
+    bytes already read past it, which belong to the patch.
+    """
+    buffer = bytearray()
+    searched = 0
+    while True:
+        end = buffer.find(b'\0\0', searched)
+        if end != -1:
+            return bytes(buffer[:end + 1]), bytes(buffer[end + 2:])
+        searched = max(0, len(buffer) - 1)
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            return bytes(buffer), b''
+        buffer.extend(block)
+
+def parse_snapshot_files(header):
+    tokens = header.decode('utf-8', 'surrogateescape').split('\0')[:-1]
+    files, pos = parse_raw_records(tokens, 0)
+    if files:
+        parse_numstat_records(tokens, pos, files)
+    return files
+
+def find_excluded(files, exclude):
+    """
+    Return the indexes of the files matching the `exclude` rules (see
+    `src.exclude.ExcludeRules.match_file`).
+    """
+    if not exclude:
+        return set()
+    return {index for index, file_info in enumerate(files) if exclude.match_file(file_info)}
+
+def spool_patch(stream, rest=b'', skip=()):
+    """
+    Copy the patch to a spooled file, leaving out the chunks of the files
+    at the `skip` indexes.
+    """
+    patch = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    if skip:
+        index = -1
+        for chunk in iter_diff_chunks(stream, prefix=rest):
+            if chunk.startswith(b'diff --git'):
+                index += 1
+            if index not in skip:
+                patch.write(chunk)
+    else:
+        patch.write(rest)
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+            patch.write(block)
+    patch.seek(0)
+    return patch
+
+def build_staged_snapshot(files, skip, stream, rest=b''):
+    return StagedSnapshot(
+        files=[file_info for index, file_info in enumerate(files) if index not in skip],
+        patch=spool_patch(stream, rest, skip),
+        excluded=[files[index] for index in sorted(skip)]
+    )
+
+def read_staged_snapshot(stream, exclude=None):
+    """
+    Parse `git diff --cached --raw --numstat --patch -z` output from a binary stream.
+    """
+    header, rest = read_snapshot_header(stream)
+    files = parse_snapshot_files(header)
+    if not files:
+        return None
+    return build_staged_snapshot(files, find_excluded(files, exclude), stream, rest)
+
+def should_exclude_by_pathspec(files, skip):
+    if not skip or len(skip) > MAX_EXCLUDE_PATHSPECS:
+        return False
+    lines = sum(files[index]['additions'] + files[index]['deletions'] for index in skip)
+    return lines >= EXCLUDE_PATHSPEC_MIN_LINES
+
+def get_pathspec_snapshot(argv, excluded):
+    """
+    Read the staged changes again, with the excluded files left out by
+    pathspec so git does not generate their patches.
+    """
+    paths = dict.fromkeys(name for file_info in excluded for name in (file_info['name'], file_info['old_name']) if name)
+    pathspecs = [':/'] + [f':(top,literal,exclude){path}' for path in paths]
+    try:
+        with stream(argv + ['--'] + pathspecs, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            header, rest = read_snapshot_header(process.stdout)
+            files = parse_snapshot_files(header)
+            patch = spool_patch(process.stdout, rest)
+    except OSError:
+        return None
+    if process.returncode != 0:
+        return None
+    return StagedSnapshot(files=files, patch=patch, excluded=excluded)
+
+def get_staged_snapshot(base=None, exclude=None):
+    """
+    Read the staged changes, against `base` (a tree-ish) instead of HEAD when given.
+
+    Files matching the `exclude` rules (see `src.exclude.get_exclude_rules`)
+    are listed in `excluded` and left out of the patch. Their line counts
+    come with the header, before any patch: when their patches are large,
+    git is stopped and run again with them excluded by pathspec, otherwise
+    their chunks are skipped while the patch is read.
+    """
+    argv = STAGED_SNAPSHOT_COMMAND + [base] if base else STAGED_SNAPSHOT_COMMAND
+    excluded = None
+    try:
+        with stream(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            header, rest = read_snapshot_header(process.stdout)
+            files = parse_snapshot_files(header)
+            skip = find_excluded(files, exclude)
+            snapshot = None
+            if should_exclude_by_pathspec(files, skip):
+                process.kill()
+                excluded = [files[index] for index in sorted(skip)]
+            elif files:
+                snapshot = build_staged_snapshot(files, skip, process.stdout, rest)
+    except OSError:
+        return None
+    if excluded:
+        return get_pathspec_snapshot(argv, excluded)
+    return snapshot if process.returncode == 0 else None
+
+def get_git_status_info():
+    snapshot = get_staged_snapshot()
+    return snapshot.status_info() if snapshot else None
+
+def get_head_commit():
+    return run_command(['git', 'rev-parse', '--verify', '-q', 'HEAD'], capture_output=True, quiet=True)
+
+def write_index_tree():
+    """
+    Return the id of the tree the index describes (`git write-tree`).
+    """
+    return run_command(['git', 'write-tree'], capture_output=True, quiet=True)
+
+def get_recent_change_sets(max_commits=200):
+    """
+    Return the files changed by each of the last `max_commits` commits.
+    """
+    log = run_command(
+        ['git', 'log', '--name-only', '--format=%x00', '-n', str(max_commits)],
         capture_output=True,
         quiet=True
     )
-    total_additions = 0
-    total_deletions = 0
-    if stat_output:
-        stat_lines = stat_output.split('\n')
-        for line in stat_lines:
-            if not line.strip():
-                continue
-            parts = line.split('\t')
-            if len(parts) >= 2:
-                try:
-                    additions = int(parts[0]) if parts[0] != '-' else 0
-                    deletions = int(parts[1]) if parts[1] != '-' else 0
-                    total_additions += additions
-                    total_deletions += deletions
-                except ValueError:
-                    continue
-    return {
-        'files': files,
-        'total_files': len(files),
-        'additions': total_additions,
-        'deletions': total_deletions
-    }
+    if not log:
+        return []
+    change_sets = []
+    for entry in log.split('\0'):
+        names = [line for line in entry.splitlines() if line]
+        if names:
+            change_sets.append(names)
+    return change_sets
 
 def create_and_push_branch(full_branch_name, quiet=False):
     print(f"Creating branch: {full_branch_name}")
-    if not run_command(f"git checkout -b {full_branch_name}", quiet=quiet):
+    if not run_command(['git', 'checkout', '-b', full_branch_name], quiet=quiet):
         return False
     print("Pushing branch to origin...")
-    if not run_command(f"git push -u origin {full_branch_name}", quiet=quiet):
+    if not run_command(['git', 'push', '-u', 'origin', full_branch_name], quiet=quiet):
         return False
     print("Branch created and pushed successfully!")
     return True
 
-def perform_rebase(quiet=False):
+def perform_rebase(quiet=False, config=None, fetch=True):
+    from .fetch import ensure_main_fetched
+
     print("Rebasing on main...")
-    if not run_command("git fetch origin main", quiet=quiet):
+    if fetch and not ensure_main_fetched(config or {}, quiet):
         return False
-    if not run_command("git rebase origin/main", quiet=quiet):
+    if not run_command(['git', 'rebase', 'origin/main'], quiet=quiet):
         return False
     return True
 
-def perform_merge(quiet=False):
+def perform_merge(quiet=False, config=None, fetch=True):
+    from .fetch import ensure_main_fetched
+
     print("Merging main into branch...")
-    if not run_command("git fetch origin main", quiet=quiet):
+    if fetch and not ensure_main_fetched(config or {}, quiet):
         return False
-    if not run_command("git merge origin/main", quiet=quiet):
+    if not run_command(['git', 'merge', 'origin/main'], quiet=quiet):
         return False
     return True
@@ -0,0 +1,78 @@
+"""
+Handlers for the `daemon` command.
+"""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from .daemon import DEFAULT_IDLE_TIMEOUT, get_daemon_dir, get_socket_path, read_daemon_pid, serve
+from .message import print_message, print_error
+
+START_TIMEOUT = 10.0
+MEERKAT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'meerkat.py')
+
+
+def handle_daemon_command(args, config, quiet):
+    action = getattr(args, 'action', 'start')
+    if action == 'run':
+        return serve(get_idle_timeout(config))
+    if action == 'stop':
+        return stop_daemon(quiet)
+    if action == 'status':
+        return show_daemon_status()
+    return start_daemon(quiet)
+
+
+def get_idle_timeout(config):
+    try:
+        return max(0.0, float(config.get('MRKT_DAEMON_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)))
+    except ValueError:
+        return DEFAULT_IDLE_TIMEOUT
+
+
+def start_daemon(quiet):
+    pid = read_daemon_pid()
+    if pid:
+        print_message(f"mrkt daemon already running (pid {pid})", quiet)
+        return 0
+    os.makedirs(get_daemon_dir(), mode=0o700, exist_ok=True)
+    log_path = os.path.join(get_daemon_dir(), 'daemon.log')
+    with open(log_path, 'ab') as log:
+        env = dict(os.environ, MRKT_DAEMON='off')
+        subprocess.Popen(
+            [sys.executable, MEERKAT_SCRIPT, 'daemon', 'run'],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            env=env,
+            start_new_session=True,
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if os.path.exists(get_socket_path()) and read_daemon_pid():
+            print_message(f"mrkt daemon listening on {get_socket_path()}", quiet)
+            return 0
+        time.sleep(0.05)
+    print_error(f"mrkt daemon did not start, see {log_path}")
+    return 1
+
+
+def stop_daemon(quiet):
+    pid = read_daemon_pid()
+    if not pid:
+        print_message("mrkt daemon is not running", quiet)
+        return 0
+    os.kill(pid, signal.SIGTERM)
+    print_message(f"Stopped mrkt daemon (pid {pid})", quiet)
+    return 0
+
+
+def show_daemon_status():
+    pid = read_daemon_pid()
+    if pid:
+        print(f"mrkt daemon running (pid {pid}) on {get_socket_path()}")
+        return 0
+    print("mrkt daemon is not running")
+    return 1
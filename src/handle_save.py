@@ -1,23 +1,163 @@
 """
 Handlers for the `save` command.
 """
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
 from .message import print_message, print_error, get_ai_commit_message
-from .git import run_command, get_git_status_info, perform_rebase, perform_merge
+from .pipeline import Step, run_pipeline
+from .exclude import get_exclude_rules
+from .trace import span
+from .git import run_command, get_staged_snapshot, get_recent_change_sets, has_staged_changes, perform_rebase, perform_merge
 
 
 def handle_save_command(args, config, quiet):
+    if getattr(args, 'repos', None):
+        from .workspace import run_in_repos
+        return run_in_repos('save', args, config, quiet)
     exclusive_args = [getattr(args, 'rebase', False), getattr(args, 'merge', False)]
     if sum(bool(x) for x in exclusive_args) > 1:
         print_error("Only one of --rebase or --merge can be used")
         return 1
+    start_prefetch(args, config)
+    cancel = threading.Event()
+    return 0 if run_pipeline(build_save_steps(args, config, quiet, cancel), cancel).ok else 1
 
-    print_message("Staging all changes...", quiet)
-    if not run_command("git add .", quiet=quiet):
-        return 1
 
-    status_info = get_git_status_info()
+def start_prefetch(args, config):
+    """
+    Fetch `origin/main` in the background for a later `--rebase` or
+    `--merge`; these fetch it in the pipeline themselves. Called before
+    the pipeline starts its threads, as the fetch worker is forked.
+    """
+    if getattr(args, 'rebase', False) or getattr(args, 'merge', False):
+        return
+    from .fetch import start_prefetch as start_fetch_worker
+
+    start_fetch_worker(config)
+
+
+def build_save_steps(args, config, quiet, cancel):
+    """
+    Return the `save` pipeline (see `src.pipeline`).
+
+    With `--rebase` or `--merge`, `origin/main` is fetched while the
+    changes are staged, and the agent is called on the staged diff while
+    the branch is rebased or merged: the message is cached, so the final
+    call after the rebase reuses it when the staged diff did not change.
+    That draft only sees the snapshot: the agent runs in an empty
+    directory, away from the working tree being rebased.
+    """
+    integrate = 'rebase' if getattr(args, 'rebase', False) else 'merge' if getattr(args, 'merge', False) else None
+    split = getattr(args, 'split', False)
+    use_cache = not getattr(args, 'no_cache', False)
+    map_reduce = getattr(args, 'map_reduce', False)
+    story = getattr(args, 'story', None)
+
+    def stage(results):
+        print_message("Staging all changes...", quiet)
+        if not run_command(['git', 'add', '.'], quiet=quiet):
+            return False
+        if has_staged_changes() is False:
+            print_error("No staged changes to commit")
+            return False
+        return True
+
+    def take_snapshot(results):
+        with span('snapshot') as record:
+            snapshot = get_staged_snapshot(exclude=get_exclude_rules(config))
+            record['files'] = snapshot.total_files if snapshot else 0
+            record['bytes'] = snapshot.size if snapshot else 0
+        return snapshot
+
+    def fetch(results):
+        from .fetch import ensure_main_fetched
+
+        return ensure_main_fetched(config, quiet)
+
+    def integrate_main(results):
+        perform = perform_rebase if integrate == 'rebase' else perform_merge
+        return perform(quiet, config, fetch=False)
+
+    def draft(results):
+        if not results['snapshot']:
+            return True
+        # Quiet and not incremental: it must not touch the index being rebased
+        with span('draft'), isolated_workdir(story) as (workdir, draft_story):
+            get_ai_commit_message(config, draft_story, True, snapshot=results['snapshot'], cancel=cancel, workdir=workdir)
+        return True
+
+    def generate(results):
+        # The staged diff changes with the rebase or merge
+        snapshot = None if integrate else results['snapshot']
+        if split:
+            return commit_split(args, config, quiet, snapshot or get_staged_snapshot(exclude=get_exclude_rules(config))) == 0
+        with span('message'):
+            commit_message = get_ai_commit_message(
+                config,
+                story,
+                quiet,
+                use_cache=use_cache,
+                snapshot=snapshot,
+                map_reduce=map_reduce,
+                incremental=True
+            )
+        return commit_message or False
+
+    def commit(results):
+        if split:
+            return True
+        final_message = build_commit_message(results['message'], getattr(args, 'wip', False))
+        print_commit_preview(final_message, quiet)
+        if not run_command(build_commit_command(config), quiet=quiet, input=final_message):
+            return False
+        print_message("Changes committed successfully!", quiet)
+        return True
+
+    steps = [
+        Step('stage', stage),
+        Step('snapshot', take_snapshot, ('stage',)),
+        Step('status', lambda results: print_status(results['snapshot'], quiet), ('snapshot',)),
+    ]
+    message_after = ('status',)
+    if integrate:
+        steps += [
+            Step('fetch', fetch),
+            Step(integrate, integrate_main, ('fetch', 'status')),
+        ]
+        message_after = (integrate,)
+        if use_cache and not map_reduce and not split:
+            steps.append(Step('draft', draft, ('status',)))
+            message_after += ('draft',)
+    steps += [
+        Step('message', generate, message_after),
+        Step('commit', commit, ('message',)),
+    ]
+    return steps
+
+
+@contextmanager
+def isolated_workdir(story_file=None):
+    """
+    Yield an empty private directory for an agent to run in, and a copy of
+    the story in it (or None). The cache key hashes the story's content,
+    so the copy shares the cached message with the story itself.
+    """
+    with tempfile.TemporaryDirectory(prefix='mrkt-draft-') as workdir:
+        story_copy = None
+        if story_file and os.path.exists(story_file):
+            story_copy = shutil.copy(story_file, workdir)
+        yield workdir, story_copy
+
+
+def print_status(snapshot, quiet):
+    status_info = snapshot.status_info() if snapshot else None
     if status_info and not quiet:
         print_message(f"\nStaged {status_info['total_files']} file(s):", quiet)
+        excluded = {file_info['name'] for file_info in status_info['excluded']}
         for file_info in status_info['files']:
             status_label = {
                 'M': 'Modified',
@@ -25,42 +165,75 @@ def handle_save_command(args, config, quiet):
                 'D': 'Deleted',
                 'R': 'Renamed'
             }.get(file_info['status'], file_info['status'])
-            print_message(f"  [{status_label}] {file_info['name']}", quiet)
+            note = " (diff left out of the prompt)" if file_info['name'] in excluded else ""
+            print_message(f"  [{status_label}] {file_info['name']}{note}", quiet)
         print_message(
             f"\n+{status_info['additions']} lines added, "
             f"-{status_info['deletions']} lines removed\n",
             quiet
         )
+    return True
 
-    if getattr(args, 'rebase', False):
-        if not perform_rebase(quiet):
-            return 1
-    elif getattr(args, 'merge', False):
-        if not perform_merge(quiet):
-            return 1
-
-    commit_message = get_ai_commit_message(config, getattr(args, 'story', None), quiet)
-    if not commit_message:
-        return 1
 
-    final_message = f"WIP: {commit_message}" if getattr(args, 'wip', False) else commit_message
+def print_commit_preview(message, quiet):
     print_message("Commit message preview:", quiet)
     print_message("─" * 50, quiet)
-    print_message(final_message, quiet)
+    print_message(message, quiet)
     print_message("─" * 50, quiet)
     print_message("", quiet)
-    commit_command = build_commit_command(config, commit_message, getattr(args, 'wip', False))
-    if not run_command(commit_command, quiet=quiet):
+
+
+def commit_split(args, config, quiet, snapshot):
+    """
+    Commit the staged changes as several commits, one per group of files.
+
+    The messages of all groups are generated concurrently; the commits are
+    then created in group order.
+    """
+    from .split import CO_CHANGE_COMMITS, build_group_snapshots, generate_group_messages, group_paths, plan_commit_groups
+
+    if not snapshot or not snapshot.all_files:
+        print_error("No staged changes to commit")
         return 1
+    groups = plan_commit_groups(snapshot.all_files, get_recent_change_sets(CO_CHANGE_COMMITS))
+    group_snapshots = build_group_snapshots(snapshot, groups)
+    print_message(f"Splitting into {len(groups)} commit(s), generating messages...", quiet)
+    with span('message', groups=len(groups)):
+        messages = generate_group_messages(
+            config,
+            group_snapshots,
+            getattr(args, 'story', None),
+            use_cache=not getattr(args, 'no_cache', False),
+            map_reduce=getattr(args, 'map_reduce', False)
+        )
 
-    print_message("Changes committed successfully!", quiet)
+    wip = getattr(args, 'wip', False)
+    for number, (group_snapshot, message) in enumerate(zip(group_snapshots, messages), 1):
+        paths = group_paths(group_snapshot)
+        print_message(f"\nCommit {number}/{len(groups)}: {', '.join(paths)}", quiet)
+        final_message = build_commit_message(message, wip)
+        print_commit_preview(final_message, quiet)
+        if not run_command(build_commit_command(config, paths), quiet=quiet, input=final_message):
+            return 1
+
+    print_message(f"{len(groups)} commit(s) created successfully!", quiet)
     return 0
 
 
-def build_commit_command(config, message, wip=False):
-    if wip:
-        message = f"WIP: {message}"
+def build_commit_message(message, wip=False):
+    return f"WIP: {message}" if wip else message
+
 
+def build_commit_command(config, paths=None):
+    """
+    Return the `git commit` argv. The message is read from stdin (`-F -`),
+    so quotes or backticks in it need no escaping.
+    """
     no_verify = config.get('MRKT_NO_VERIFY_COMMIT', 'false').lower() == 'true' or config.get('MRKT_NO_VERIFY', 'false').lower() == 'true'
-    verify_flag = " --no-verify" if no_verify else ""
-    return f'git commit -m "{message}"{verify_flag}'
+    argv = ['git', 'commit', '-F', '-']
+    if no_verify:
+        argv.append('--no-verify')
+    # With paths, only those are committed and the rest stays staged
+    if paths:
+        argv += ['--', *paths]
+    return argv
@@ -21,6 +21,10 @@ def handle_start_command(args, config, quiet):
         getattr(args, 'no_prefix', False)
     )
     success = create_and_push_branch(full_branch_name, quiet)
+    if success:
+        from .fetch import start_prefetch
+
+        start_prefetch(config)
     return 0 if success else 1
 
 
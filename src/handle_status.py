@@ -0,0 +1,47 @@
+"""
+Handlers for the `status` command.
+"""
+import time
+
+from .message import print_message, print_error
+from .push import get_push_log_path, get_push_records
+from .runner import is_process_running
+
+
+def handle_status_command(args, config, quiet):
+    records = get_push_records()
+    if not records:
+        print_message("No background pushes", quiet)
+        return 0
+    failed = False
+    for branch, record in sorted(records.items()):
+        line, ok = describe_push(branch, record)
+        if ok:
+            print_message(line, quiet)
+        else:
+            failed = True
+            print_error(line)
+    if failed:
+        print_error(f"See {get_push_log_path()}")
+        return 1
+    return 0
+
+
+def describe_push(branch, record, now=None):
+    """
+    Return a line describing the last push of a branch, and False when it
+    failed or its worker died.
+    """
+    now = now or time.time()
+    status = record.get('status')
+    if status in ('queued', 'running'):
+        if not is_process_running(record.get('pid')):
+            return f"origin/{branch}: push interrupted", False
+        since = int(now - record.get('started', record.get('requested', now)))
+        pending = ', another push queued' if record.get('pending') else ''
+        return f"origin/{branch}: {status} for {since}s (pid {record.get('pid')}{pending})", True
+    finished = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.get('finished', now)))
+    if status == 'failed':
+        return f"origin/{branch}: push failed with exit code {record.get('returncode')} at {finished}", False
+    commit = f" {record['commit'][:7]}" if record.get('commit') else ''
+    return f"origin/{branch}: pushed{commit} at {finished}", True
@@ -1,37 +1,103 @@
 """
 Handlers for the `update` command.
 """
+import threading
+
 from .message import print_message, print_error
 from .git import run_command, get_current_branch
 
 
 def handle_update_command(args, config, quiet):
+    if getattr(args, 'repos', None):
+        from .workspace import run_in_repos
+        return run_in_repos('update', args, config, quiet)
     exclusive_args = [getattr(args, 'close', False), getattr(args, 'rebase', False), getattr(args, 'merge', False)]
     if sum(bool(x) for x in exclusive_args) > 1:
         print_error("Only one of --close, --rebase, or --merge can be used")
         return 1
+    if getattr(args, 'squash', False) and not getattr(args, 'close', False):
+        print_error("--squash can only be used with --close")
+        return 1
     # import local to avoid circular import at module import time
-    from .handle_save import handle_save_command
-    save_result = handle_save_command(args, config, quiet)
-    if save_result != 0:
-        return save_result
-    current_branch = get_current_branch()
+    from .handle_save import build_save_steps, start_prefetch
+    from .pipeline import Step, run_pipeline
+
+    def close(results):
+        if not close_branch(config, results['branch'], getattr(args, 'squash', False), quiet):
+            return False
+        return "main"
+
+    def push(results):
+        branch = results.get('close') or results['branch']
+        print_message(f"Pushing to origin/{branch}...", quiet)
+        if not run_command(build_push_command(config, branch), quiet=quiet):
+            return False
+        print_message("Changes updated successfully!", quiet)
+        return True
+
+    start_prefetch(args, config)
+    cancel = threading.Event()
+    steps = build_save_steps(args, config, quiet, cancel)
+    # The branch does not change while saving, so it is read concurrently,
+    # but before a rebase detaches HEAD
+    steps.append(Step('branch', lambda results: get_current_branch()))
+    for step in steps:
+        if step.name in ('rebase', 'merge'):
+            step.after += ('branch',)
+    push_after = ('commit', 'branch')
     if getattr(args, 'close', False):
-        print_message("Merging to main branch...", quiet)
-        if not run_command("git checkout main", quiet=quiet):
-            return 1
-        if not run_command(f"git merge {current_branch}", quiet=quiet):
-            return 1
-        current_branch = "main"
-    print_message(f"Pushing to origin/{current_branch}...", quiet)
-    push_command = build_push_command(config, current_branch)
-    if not run_command(push_command, quiet=quiet):
+        steps.append(Step('close', close, push_after))
+        push_after = ('close',)
+    background = getattr(args, 'background', False)
+    if not background:
+        steps.append(Step('push', push, push_after))
+    pipeline = run_pipeline(steps, cancel)
+    if not pipeline.ok:
         return 1
-    print_message("Changes updated successfully!", quiet)
+    if background:
+        # The push worker is forked, so only once the pipeline threads are gone
+        from .push import request_push
+
+        branch = pipeline.results.get('close') or pipeline.results['branch']
+        if request_push(build_push_command(config, branch), branch):
+            print_message(f"Pushing to origin/{branch} in the background, see `mrkt status`", quiet)
+        else:
+            print_message(f"A push of {branch} is in progress, it will push this commit too", quiet)
     return 0
 
 
+def close_branch(config, branch, squash, quiet):
+    """
+    Merge `branch` into main.
+
+    When a merge commit is created, or the branch is squashed into one
+    commit, its message is a rollup of the branch's commit messages.
+    """
+    from .handle_save import build_commit_command, print_commit_preview
+    from .incremental import generate_rollup_message, get_branch_messages
+
+    rollup = None
+    fast_forward = run_command(['git', 'merge-base', '--is-ancestor', 'main', branch], quiet=True)
+    if squash or not fast_forward:
+        messages = get_branch_messages(branch)
+        if messages:
+            rollup = generate_rollup_message(config, branch, messages, quiet)
+            print_message("Branch rollup:", quiet)
+            print_commit_preview(rollup, quiet)
+    print_message("Merging to main branch...", quiet)
+    if not run_command(['git', 'checkout', 'main'], quiet=quiet):
+        return False
+    if squash:
+        if not run_command(['git', 'merge', '--squash', branch], quiet=quiet):
+            return False
+        return bool(run_command(build_commit_command(config), quiet=quiet, input=rollup or f"Squash branch '{branch}'"))
+    argv = ['git', 'merge', '-m', rollup, branch] if rollup else ['git', 'merge', branch]
+    return bool(run_command(argv, quiet=quiet))
+
+
 def build_push_command(config, branch):
     no_verify = config.get('MRKT_NO_VERIFY_PUSH', 'false').lower() == 'true' or config.get('MRKT_NO_VERIFY', 'false').lower() == 'true'
-    verify_flag = " --no-verify" if no_verify else ""
-    return f"git push origin {branch}{verify_flag}"
+    argv = ['git', 'push', 'origin', branch]
+    if no_verify:
+        argv.append('--no-verify')
+    return argv
@@ -0,0 +1,64 @@
+"""
+Circuit breaker for agents that keep failing.
+
+Consecutive failures and timeouts are recorded per agent in
+`.git/mrkt/agent_health.json`. After `MRKT_BREAKER_THRESHOLD` failures in
+a row the agent is skipped for `MRKT_BREAKER_COOLDOWN` seconds, and mrkt
+goes straight to the next agent or to the fallback message.
+"""
+import threading
+import time
+
+from .state import get_state_path, load_json, save_json
+
+HEALTH_FILE_NAME = 'agent_health.json'
+DEFAULT_THRESHOLD = 3
+DEFAULT_COOLDOWN = 600
+
+_lock = threading.Lock()
+
+
+def get_breaker_settings(config):
+    try:
+        threshold = int(config.get('MRKT_BREAKER_THRESHOLD', DEFAULT_THRESHOLD))
+    except ValueError:
+        threshold = DEFAULT_THRESHOLD
+    try:
+        cooldown = float(config.get('MRKT_BREAKER_COOLDOWN', DEFAULT_COOLDOWN))
+    except ValueError:
+        cooldown = DEFAULT_COOLDOWN
+    return threshold, cooldown
+
+
+def get_health_path():
+    return get_state_path(HEALTH_FILE_NAME)
+
+
+def is_agent_available(config, agent_name, path=None, now=None):
+    """
+    Return False while the agent's breaker is open.
+    """
+    threshold, _ = get_breaker_settings(config)
+    if threshold <= 0:
+        return True
+    record = load_json(path or get_health_path()).get(agent_name, {})
+    return record.get('skip_until', 0) <= (now or time.time())
+
+
+def record_agent_result(config, agent_name, ok, path=None, now=None):
+    """
+    Record a call result, opening the breaker after too many failures.
+    """
+    threshold, cooldown = get_breaker_settings(config)
+    if threshold <= 0:
+        return
+    path = path or get_health_path()
+    with _lock:
+        records = load_json(path)
+        record = records.get(agent_name, {})
+        failures = 0 if ok else record.get('failures', 0) + 1
+        record = {'failures': failures, 'skip_until': 0}
+        if failures >= threshold:
+            record['skip_until'] = (now or time.time()) + cooldown
+        records[agent_name] = record
+        save_json(path, records)
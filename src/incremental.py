@@ -0,0 +1,141 @@
+"""
+Incremental message generation for branches that are updated often.
+
+The last generated message of each branch is kept in
+`.git/mrkt/branch_messages.json` with the HEAD commit and the index tree
+it describes. When mrkt runs again on the same HEAD (the commit failed
+or was aborted, or more changes were staged before committing), the
+agent gets only the changes since that tree, with the earlier message as
+context, instead of the whole staged diff.
+
+`mrkt update --close` rolls the messages of the branch up into one, used
+for the merge commit or, with `--squash`, for the squashed commit.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .git import StagedSnapshot, get_current_branch, get_head_commit, get_staged_snapshot, run_command, write_index_tree
+from .state import get_state_path, load_json, save_json
+
+HISTORY_FILE_NAME = 'branch_messages.json'
+MAX_BRANCHES = 100
+
+DELTA_CONTEXT = (
+    "An earlier version of these staged changes was described by the "
+    "commit message below. Only the changes made since then follow. "
+    "Write one commit message covering both.\n\n"
+    "Earlier message:\n{message}\n\n"
+    "Changes since then:\n"
+)
+
+ROLLUP_CONTEXT = (
+    "These are the commit messages of the branch {branch}, oldest first, "
+    "which is being merged. Combine them into a single commit message "
+    "describing the whole branch.\n\n"
+)
+
+_lock = threading.Lock()
+
+
+@dataclass
+class Generation:
+    """
+    Where a message is generated: the branch, its HEAD commit and the
+    tree of the index.
+    """
+    branch: str
+    head: Optional[str]
+    tree: str
+
+
+def is_incremental_enabled(config):
+    return config.get('MRKT_INCREMENTAL', 'true').lower() == 'true'
+
+
+def get_history_path():
+    return get_state_path(HISTORY_FILE_NAME)
+
+
+def get_generation():
+    branch = get_current_branch()
+    tree = write_index_tree()
+    if not branch or not tree:
+        return None
+    return Generation(branch=branch, head=get_head_commit(), tree=tree)
+
+
+def get_previous_generation(generation, path=None):
+    return load_json(path or get_history_path()).get(generation.branch)
+
+
+def record_generation(generation, message, path=None, now=None):
+    """
+    Remember the message generated for the branch, dropping the least
+    recently used branches past `MAX_BRANCHES`.
+    """
+    path = path or get_history_path()
+    with _lock:
+        records = load_json(path)
+        records[generation.branch] = {
+            'head': generation.head,
+            'tree': generation.tree,
+            'message': message,
+            'timestamp': now or time.time(),
+        }
+        if len(records) > MAX_BRANCHES:
+            newest = sorted(records.items(), key=lambda item: item[1].get('timestamp', 0), reverse=True)
+            records = dict(newest[:MAX_BRANCHES])
+        save_json(path, records)
+
+
+def get_delta_snapshot(generation, snapshot, path=None, exclude=None):
+    """
+    Return the changes since the last message generated on the same HEAD,
+    with that message as context, or None when the whole staged diff must
+    be described. `exclude` rules apply as for the staged snapshot.
+    """
+    previous = get_previous_generation(generation, path)
+    if not previous or not previous.get('message'):
+        return None
+    if previous.get('head') != generation.head or previous.get('tree') == generation.tree:
+        return None
+    delta = get_staged_snapshot(base=previous['tree'], exclude=exclude)
+    if not delta or delta.size >= snapshot.size:
+        return None
+    delta.context = DELTA_CONTEXT.format(message=previous['message'])
+    return delta
+
+
+def get_branch_messages(branch, target='main'):
+    """
+    Return the messages of the commits on `branch` missing from `target`, oldest first.
+    """
+    log = run_command(
+        ['git', 'log', '--reverse', '--format=%B%x00', f'{target}..{branch}'],
+        capture_output=True,
+        quiet=True
+    )
+    if not log:
+        return []
+    return [message.strip() for message in log.split('\0') if message.strip()]
+
+
+def build_simple_rollup(branch, messages):
+    lines = [f"Merge branch '{branch}'", '']
+    lines.extend(f"- {message.splitlines()[0]}" for message in messages)
+    return '\n'.join(lines)
+
+
+def generate_rollup_message(config, branch, messages, quiet=False):
+    """
+    Ask the agent to combine the branch messages into one, falling back
+    to a list of their titles.
+    """
+    from .message import run_agent
+
+    text = '\n\n'.join(f"Commit {number}:\n{message}" for number, message in enumerate(messages, 1))
+    snapshot = StagedSnapshot.from_diff(text)
+    snapshot.context = ROLLUP_CONTEXT.format(branch=branch)
+    return run_agent(config, snapshot, quiet=quiet) or build_simple_rollup(branch, messages)
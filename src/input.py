@@ -1,15 +1,22 @@
 """
 Argument parsing and input validation for Meerkat CLI.
+
+`argparse` is imported when the parser is built, so importing this module
+on start-up stays free.
 """
-import argparse
+
+TRACE_CHOICES = ['text', 'json', 'chrome']
 
 def create_parser():
+    import argparse
+
     parser = argparse.ArgumentParser(
         prog='mrkt',
         description='A command-line tool to work with AI libraries for development'
     )
     parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
     parser.add_argument('--verbose', action='store_true', help='Show all messages')
+    parser.add_argument('--trace', nargs='?', const='text', choices=TRACE_CHOICES, help='Time each step: text (default), json or chrome')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     start_parser = subparsers.add_parser('start', help='Create a branch and push it to origin')
     start_parser.add_argument('branch_name', nargs='?', help='Name of the branch to create')
@@ -18,6 +25,7 @@ def create_parser():
     start_parser.add_argument('--release', action='store_true', help='Use release as prefix')
     start_parser.add_argument('--prefix', type=str, help='Define a custom prefix')
     start_parser.add_argument('--no-prefix', action='store_true', help="Don't add any prefix")
+    start_parser.add_argument('--trace', nargs='?', const='text', choices=TRACE_CHOICES, default=argparse.SUPPRESS, help='Time each step: text (default), json or chrome')
     start_parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
     start_parser.add_argument('--verbose', action='store_true', help='Show all messages')
     save_parser = subparsers.add_parser('save', help='Create a commit with AI-generated message (no push)')
@@ -25,15 +33,33 @@ def create_parser():
     save_parser.add_argument('--rebase', action='store_true', help='Rebase before commit')
     save_parser.add_argument('--merge', action='store_true', help='Merge main into branch before commit')
     save_parser.add_argument('--story', type=str, help='Path to story definition file for context')
+    save_parser.add_argument('--no-cache', action='store_true', help='Always call the AI agent, ignoring cached messages')
+    save_parser.add_argument('--map-reduce', action='store_true', help='Summarize large diffs in parallel groups before writing the message')
+    save_parser.add_argument('--split', action='store_true', help='Group the staged files into several commits, generating their messages in parallel')
+    save_parser.add_argument('--repos', type=str, help='Run in every git repository matching a glob, or listed in a file')
+    save_parser.add_argument('--trace', nargs='?', const='text', choices=TRACE_CHOICES, default=argparse.SUPPRESS, help='Time each step: text (default), json or chrome')
     save_parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
     save_parser.add_argument('--verbose', action='store_true', help='Show all messages')
     update_parser = subparsers.add_parser('update', help='Create a commit message with AI and push to origin')
     update_parser.add_argument('--wip', action='store_true', help='Add WIP in the title of the message')
     update_parser.add_argument('--close', action='store_true', help='Commit changes and merge to main branch')
+    update_parser.add_argument('--squash', action='store_true', help='With --close, squash the branch into one commit on main')
+    update_parser.add_argument('--background', action='store_true', help='Push in a background worker and return after the commit')
     update_parser.add_argument('--rebase', action='store_true', help='Rebase before commit and push')
     update_parser.add_argument('--merge', action='store_true', help='Merge main into branch before commit and push')
     update_parser.add_argument('--story', type=str, help='Path to story definition file for context')
+    update_parser.add_argument('--no-cache', action='store_true', help='Always call the AI agent, ignoring cached messages')
+    update_parser.add_argument('--map-reduce', action='store_true', help='Summarize large diffs in parallel groups before writing the message')
+    update_parser.add_argument('--repos', type=str, help='Run in every git repository matching a glob, or listed in a file')
+    update_parser.add_argument('--trace', nargs='?', const='text', choices=TRACE_CHOICES, default=argparse.SUPPRESS, help='Time each step: text (default), json or chrome')
     update_parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
     update_parser.add_argument('--verbose', action='store_true', help='Show all messages')
+    status_parser = subparsers.add_parser('status', help='Show background pushes in flight or failed')
+    status_parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
+    status_parser.add_argument('--verbose', action='store_true', help='Show all messages')
+    daemon_parser = subparsers.add_parser('daemon', help='Run a background process that serves mrkt commands')
+    daemon_parser.add_argument('action', nargs='?', default='start', choices=['start', 'stop', 'status', 'run'], help='Daemon action (default: start)')
+    daemon_parser.add_argument('--quiet', action='store_true', help='Only error messages are printed')
+    daemon_parser.add_argument('--verbose', action='store_true', help='Show all messages')
     subparsers.add_parser('help', help='Show help message')
     return parser
@@ -1,17 +1,18 @@
 """
 Main entry point for Meerkat CLI.
 """
+import os
 import sys
 from .input import create_parser
-from .message import print_error
-from .handle_start import handle_start_command
-from .handle_save import handle_save_command
-from .handle_update import handle_update_command
-from .handle_help import handle_help_command
 
-def load_config():
-    import os
-    from pathlib import Path
+CONFIG_FILE_NAME = '.meerkatrc'
+
+# Parsed `.meerkatrc` files keyed by path, reused while their mtime does
+# not change. Matters for `mrkt daemon`, which serves many commands.
+_parsed_configs = {}
+
+def load_config(cwd=None, environ=None):
+    environ = os.environ if environ is None else environ
     DEFAULT_CONFIG = {
         'MRKT_AGENT': 'copilot',
         'MRKT_AGENT_PATH': '',
@@ -21,31 +22,70 @@ def load_config():
         'MRKT_NO_VERIFY': 'false',
         'MRKT_NO_VERIFY_COMMIT': 'false',
         'MRKT_NO_VERIFY_PUSH': 'false',
+        'MRKT_CACHE_SIZE': '200',
+        'MRKT_MAX_PROMPT_TOKENS': '24000',
+        'MRKT_STORY_MAX_TOKENS': '2000',
+        'MRKT_MAP_REDUCE_WORKERS': '4',
+        'MRKT_AGENT_STRATEGY': 'race',
+        'MRKT_REFERENCE_TRANSPORT': 'auto',
+        'MRKT_INCREMENTAL': 'true',
+        'MRKT_FAST_PATH': 'generated,lockfile,rename,version',
+        'MRKT_LOCKFILES': '',
+        'MRKT_GENERATED_PATHS': '',
+        'MRKT_EXCLUDE': '',
+        'MRKT_EXCLUDE_DEFAULTS': 'true',
+        'MRKT_PREFETCH': 'true',
+        'MRKT_FETCH_MAX_AGE': '60',
+        'MRKT_AGENT_HEDGE_DELAY': '5',
+        'MRKT_AGENT_TIMEOUT': '120',
+        'MRKT_AGENT_IDLE_GAP': '0',
+        'MRKT_AGENT_SENTINEL': '',
+        'MRKT_BREAKER_THRESHOLD': '3',
+        'MRKT_BREAKER_COOLDOWN': '600',
+        'MRKT_DAEMON_IDLE_TIMEOUT': '1800',
+        'MRKT_SPLIT_WORKERS': '4',
+        'MRKT_REPOS_WORKERS': '8',
+        'MRKT_MAX_AGENT_CALLS': '4',
+        'MRKT_TRACE': '',
+        'MRKT_TRACE_FILE': '',
     }
     config = DEFAULT_CONFIG.copy()
-    config_file = find_config_file()
+    config_file = find_config_file(cwd)
     if config_file:
         config.update(parse_config_file(config_file))
     for key in DEFAULT_CONFIG.keys():
-        env_value = os.environ.get(key)
+        env_value = environ.get(key)
         if env_value:
             config[key] = env_value
     return config
 
-def find_config_file():
-    from pathlib import Path
-    current = Path.cwd()
-    while current != current.parent:
-        config_path = current / '.meerkatrc'
-        if config_path.exists():
+def find_config_file(start=None):
+    """
+    Walk up from `start` (the cwd by default) to the repository root.
+
+    Returns the first `.meerkatrc` found, stopping at the directory that
+    holds `.git`. Plain `os.path` calls keep this cheap on every start.
+    """
+    current = start or os.getcwd()
+    while True:
+        config_path = os.path.join(current, CONFIG_FILE_NAME)
+        if os.path.isfile(config_path):
             return config_path
-        git_path = current / '.git'
-        if git_path.exists():
-            return current / '.meerkatrc' if (current / '.meerkatrc').exists() else None
-        current = current.parent
-    return None
+        if os.path.exists(os.path.join(current, '.git')):
+            return None
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
 
 def parse_config_file(config_path):
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _parsed_configs.get(config_path)
+    if cached and cached[0] == mtime:
+        return dict(cached[1])
     config = {}
     try:
         with open(config_path, 'r') as f:
@@ -57,8 +97,11 @@ def parse_config_file(config_path):
                     key, value = line.split('=', 1)
                     config[key.strip()] = value.strip()
     except Exception as e:
+        from .message import print_error
         print_error(f"Error reading config file: {e}")
-    return config
+        return config
+    _parsed_configs[config_path] = (mtime, config)
+    return dict(config)
 
 def is_quiet_mode(config, args):
     if hasattr(args, 'verbose') and args.verbose:
@@ -67,21 +110,51 @@ def is_quiet_mode(config, args):
         return True
     return config.get('MRKT_ALWAYS_QUIET', 'false').lower() == 'true'
 
-def main():
+def get_command_handler(command):
+    """
+    Import only the handler module of the selected command.
+    """
+    if command == 'start':
+        from .handle_start import handle_start_command
+        return handle_start_command
+    if command == 'save':
+        from .handle_save import handle_save_command
+        return handle_save_command
+    if command == 'update':
+        from .handle_update import handle_update_command
+        return handle_update_command
+    if command == 'status':
+        from .handle_status import handle_status_command
+        return handle_status_command
+    if command == 'daemon':
+        from .handle_daemon import handle_daemon_command
+        return handle_daemon_command
+    return None
+
+def main(argv=None, config=None):
+    """
+    Run the CLI. `argv` defaults to `sys.argv[1:]`; when a `mrkt daemon`
+    is running, the command is forwarded to it instead.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+        from .daemon import forward_to_daemon
+        forwarded = forward_to_daemon(argv)
+        if forwarded is not None:
+            return forwarded
     parser = create_parser()
-    args = parser.parse_args()
-    config = load_config()
+    args = parser.parse_args(argv)
     if not args.command or args.command == 'help':
+        from .handle_help import handle_help_command
         return handle_help_command(parser)
+    config = config or load_config()
     quiet = is_quiet_mode(config, args)
-    if args.command == 'start':
-        return handle_start_command(args, config, quiet)
-    elif args.command == 'save':
-        return handle_save_command(args, config, quiet)
-    elif args.command == 'update':
-        return handle_update_command(args, config, quiet)
-    else:
+    handler = get_command_handler(args.command)
+    if not handler:
         parser.print_help()
         return 1
-
-
+    trace = getattr(args, 'trace', None) or config.get('MRKT_TRACE')
+    if not trace:
+        return handler(args, config, quiet)
+    from .trace import run_traced
+    return run_traced(trace, args.command, lambda: handler(args, config, quiet), config.get('MRKT_TRACE_FILE') or None)
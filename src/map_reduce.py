@@ -0,0 +1,170 @@
+"""
+Map-reduce commit message generation for very large change sets.
+
+The staged patch is split into groups of files, packed by directory up to
+the prompt budget. Each group is summarized by a concurrent agent call
+through a bounded worker pool, then one final call combines the partial
+summaries into a conventional commit message.
+
+Groups and summaries reach the agent as references opened with
+`MRKT_REFERENCE_TRANSPORT` (see `src.transport`), like a single call.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .agents import get_agent_spec, load_agent_function
+from .condense import CHARS_PER_TOKEN, DEFAULT_MAX_PROMPT_TOKENS, condense_snapshot, file_info_at, get_max_prompt_tokens
+from .health import is_agent_available, record_agent_result
+from .message import get_agent_names, open_story, print_message
+from .prompt import prompt, map_prompt, reduce_prompt
+from .runner import get_agent_timeout
+from .split import build_group_snapshots
+from .trace import count, span
+from .transport import get_reference_transport, open_reference
+
+DEFAULT_WORKERS = 4
+MAX_GROUPS = 16
+
+
+def get_map_reduce_workers(config):
+    try:
+        return max(1, int(config.get('MRKT_MAP_REDUCE_WORKERS', DEFAULT_WORKERS)))
+    except ValueError:
+        return DEFAULT_WORKERS
+
+
+def get_agent_runners(config, agent_name):
+    """
+    Return the `(run, generate)` functions of a registered agent, or None.
+    """
+    spec = get_agent_spec(config, agent_name)
+    run = load_agent_function(spec, spec.run)
+    generate = load_agent_function(spec, spec.generate)
+    if not run or not generate:
+        return None
+    return run, generate
+
+
+def pick_agent(config, quiet=False):
+    """
+    Return the first agent of `MRKT_AGENT` whose breaker is closed and
+    that supports map-reduce, with its runners, or `(None, None)`.
+    """
+    for agent_name in get_agent_names(config):
+        if not is_agent_available(config, agent_name):
+            count('agent.skipped')
+            print_message(f"  - Skipping {agent_name}: it failed repeatedly, waiting for cooldown", quiet)
+            continue
+        runners = get_agent_runners(config, agent_name)
+        if runners:
+            return agent_name, runners
+        print_message(f"  - Map-reduce is not supported for agent {agent_name}", quiet)
+    return None, None
+
+
+def measure_file_sizes(snapshot):
+    sizes = []
+    for chunk in snapshot.iter_diff_chunks():
+        if chunk.startswith(b'diff --git'):
+            sizes.append(0)
+        if sizes:
+            sizes[-1] += len(chunk)
+    return sizes
+
+
+def plan_groups(snapshot, sizes, group_budget):
+    """
+    Split file indexes into groups of at most `group_budget` bytes.
+
+    Files are ordered by directory so each group covers as few
+    directories as possible. A file larger than the budget gets its own
+    group and is condensed before being summarized.
+    """
+    order = sorted(
+        range(len(sizes)),
+        key=lambda index: (os.path.dirname(file_info_at(snapshot, index)['name']), index)
+    )
+    groups = []
+    current = []
+    current_size = 0
+    for index in order:
+        if current and current_size + sizes[index] > group_budget:
+            groups.append(current)
+            current = []
+            current_size = 0
+        current.append(index)
+        current_size += sizes[index]
+    if current:
+        groups.append(current)
+    return groups
+
+
+def group_label(snapshot, group):
+    directories = sorted({os.path.dirname(file_info_at(snapshot, index)['name']) or '.' for index in group})
+    return f"{', '.join(directories)} ({len(group)} file(s))"
+
+
+def summarize_group(run, group_snapshot, max_tokens, transport, timeout=None, cancel=None):
+    """
+    Summarize one group, condensed first when a single file is over the budget.
+    """
+    if cancel is not None and cancel.is_set():
+        return None
+    changes = condense_snapshot(group_snapshot, max_tokens) or group_snapshot.iter_diff_chunks()
+    with open_reference(changes, transport) as reference_file:
+        output = run(map_prompt.format(reference_file=reference_file), cancel=cancel, timeout=timeout)
+    return output.strip() if output else None
+
+
+def format_summaries(snapshot, groups, summaries):
+    """
+    The reduce input: the files left out of the patch, which no group
+    covers, then the summary of each group.
+    """
+    parts = [snapshot.excluded_summary()]
+    for group, summary in zip(groups, summaries):
+        if summary:
+            parts.append(f"Changes in {group_label(snapshot, group)}:\n{summary}\n\n")
+    return ''.join(parts)
+
+
+def run_map_reduce(config, snapshot, story_file=None, quiet=False, cancel=None):
+    """
+    Summarize groups of files concurrently and combine the summaries.
+
+    The first agent of `MRKT_AGENT` that its circuit breaker allows and
+    that supports map-reduce is used; its result feeds the breaker.
+    Setting `cancel` kills the agent processes.
+
+    Returns the commit message, or None when no agent supports map-reduce
+    or every call failed.
+    """
+    agent_name, runners = pick_agent(config, quiet)
+    if not runners:
+        return None
+    run, generate = runners
+    max_tokens = get_max_prompt_tokens(config) or DEFAULT_MAX_PROMPT_TOKENS
+    sizes = measure_file_sizes(snapshot)
+    group_budget = max(max_tokens * CHARS_PER_TOKEN, sum(sizes) // MAX_GROUPS + 1)
+    groups = plan_groups(snapshot, sizes, group_budget)
+    workers = min(get_map_reduce_workers(config), len(groups))
+    timeout = get_agent_timeout(config, agent_name, get_agent_spec(config, agent_name).timeout)
+    print_message(f"  - Map-reduce: {len(groups)} group(s), {workers} worker(s), agent {agent_name}", quiet)
+
+    msg = None
+    transport = get_reference_transport(config)
+    group_snapshots = build_group_snapshots(snapshot, groups)
+    with span('map', groups=len(groups), workers=workers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            summaries = list(pool.map(
+                lambda group_snapshot: summarize_group(run, group_snapshot, max_tokens, transport, timeout, cancel),
+                group_snapshots
+            ))
+    if any(summaries) and not (cancel is not None and cancel.is_set()):
+        summaries_text = format_summaries(snapshot, groups, summaries)
+        with span('reduce'), open_story(config, story_file, snapshot, True) as story:
+            with open_reference(summaries_text, transport) as summaries_file:
+                msg = generate(story, summaries_file, prompt + reduce_prompt, cancel=cancel, timeout=timeout)
+    if cancel is None or not cancel.is_set():
+        record_agent_result(config, agent_name, bool(msg))
+    return msg
@@ -1,10 +1,20 @@
 """
 Message building and commit message generation for Meerkat CLI.
+
+Every handler imports this module for `print_message`, so the agent,
+condense, story, cache and map-reduce machinery is imported inside the
+functions that use it.
 """
 import os
-import subprocess
+import re
+import shlex
 import sys
-from .git import run_command
+from contextlib import contextmanager
+from .git import get_staged_snapshot
+from .trace import count, span
+
+DIFF_HEADER_PATTERN = re.compile(r'^diff --git .*$', re.MULTILINE)
+GENERIC_AGENT_PROMPT = "Generate a git commit message for the changes given on stdin."
 
 
 def print_message(message, quiet=False):
@@ -16,140 +26,356 @@ def print_error(message):
     print(f"Error: {message}", file=sys.stderr)
 
 
-def save_reference_to_file(diff):
-    with open('temp_git_message_reference.md', 'w') as f:
-        f.write(diff)
+def get_agent_message(config, snapshot, story_file=None, quiet=False):
+    """
+    Select and call the configured AI agent to generate a commit message.
+
+    Falls back to `generate_simple_commit_message` on failure or when no
+    known agent is configured.
+    """
+    msg = run_agent(config, snapshot, story_file, quiet)
+    if msg:
+        return msg
+    return generate_simple_commit_message(snapshot.iter_diff_chunks())
+
+
+def get_agent_name(config):
+    return config.get('MRKT_AGENT_PATH') or config.get('MRKT_AGENT', 'codex')
+
 
+def get_agent_names(config):
+    names = config.get('MRKT_AGENT', 'codex').split(',')
+    return [name.strip() for name in names if name.strip()]
 
-def get_agent_message(config, diff, story_file=None, quiet=False):
+
+def get_agent_command(config, agent_name):
     """
-    Select and call the configured AI agent to generate a commit message.
+    Return the CLI used for an agent; `MRKT_AGENT_PATH` overrides unknown agents.
+    """
+    from .agents import get_agent_spec
+
+    if get_agent_spec(config, agent_name).transport != 'stdin':
+        return agent_name
+    return config.get('MRKT_AGENT_PATH') or agent_name
+
+
+def call_generic_agent(config, agent_name, changes, story_file=None, quiet=False, cancel=None, timeout=None):
+    """
+    Call an unknown agent through its CLI.
+
+    The instruction is passed with `-p` and the changes, preceded by the
+    story, are streamed to the agent's stdin chunk by chunk, so their size
+    is limited neither by the command line nor by memory.
+    """
+    from .runner import run_agent_process
+
+    ai_command = get_agent_command(config, agent_name)
+
+    print_message(f"AI Command: {ai_command}\n", quiet)
+    argv = shlex.split(ai_command) + ['-p', GENERIC_AGENT_PROMPT]
+    prompt_input = iter_generic_input(story_file, changes)
+    result = run_agent_process(argv, cancel=cancel, timeout=timeout, input=prompt_input)
+    if result and result.ok and result.text.strip():
+        return result.text.strip()
+    return None
+
+
+def iter_generic_input(story_file, changes):
+    from .transport import iter_content
+
+    if story_file and os.path.exists(story_file):
+        with open(story_file, 'rb') as f:
+            yield b'Story context:\n' + f.read() + b'\n\n'
+    yield from iter_content(changes)
+
+
+def invoke_agent(config, agent_name, snapshot, condensed, story_file=None, quiet=False, cancel=None, timeout=None):
+    from .agents import get_agent_spec, load_agent_function
+    from .transport import open_reference, get_reference_transport
+
+    spec = get_agent_spec(config, agent_name)
+    changes = condensed if condensed is not None else snapshot.iter_diff_chunks()
+    context = snapshot.context + snapshot.excluded_summary()
+    if context:
+        changes = prepend_context(context, changes)
+    if spec.transport == 'stdin':
+        return call_generic_agent(config, agent_name, changes, story_file, quiet, cancel, timeout)
+    generate = load_agent_function(spec, spec.generate)
+    if not generate:
+        return None
+    # Every call gets its own reference, so raced agents and concurrent
+    # runs in the same directory never share one.
+    with open_reference(changes, get_reference_transport(config)) as reference_file:
+        return generate(story_file, reference_file=reference_file, cancel=cancel, timeout=timeout)
+
+
+@contextmanager
+def open_story(config, story_file, snapshot, quiet=False):
+    """
+    Yield the story file to pass to the agent: a private reference holding
+    only the sections relevant to the staged changes when the story is
+    over its budget (see `src.story`), or the story file itself.
+    """
+    from .story import select_story_excerpt
+    from .transport import open_reference, get_reference_transport
+
+    excerpt = select_story_excerpt(config, story_file, snapshot) if story_file else None
+    if excerpt is None:
+        if story_file:
+            print_message(f"  - Story file: {story_file}", quiet)
+        yield story_file
+        return
+    print_message(
+        f"  - Story file: {story_file}, {excerpt.sections} of {excerpt.total_sections} sections "
+        f"({excerpt.size} of {excerpt.total_size} bytes)",
+        quiet
+    )
+    with open_reference(excerpt.text, get_reference_transport(config)) as reference:
+        yield reference
+
+
+def prepend_context(context, changes):
+    yield context.encode('utf-8')
+    if isinstance(changes, str):
+        yield changes.encode('utf-8')
+    else:
+        yield from changes
+
+
+def call_agent(config, agent_name, snapshot, condensed, story_file=None, quiet=False, cancel=None, workdir=None):
+    """
+    Call one agent and return its message, or None on failure.
+
+    The result feeds the agent's circuit breaker. Calls cancelled because
+    another agent won a race are not counted. The agent's output is
+    streamed (see `src.streaming`) and previewed unless `quiet`. The agent
+    runs in `workdir` when set, instead of the current directory.
+    """
+    from .agents import get_agent_spec
+    from .health import record_agent_result
+    from .runner import agent_working_directory, get_agent_timeout, watch_agent_output
+    from .streaming import MessageStream, get_idle_gap, get_sentinel, print_preview
+
+    with span('agent', agent=agent_name) as record:
+        try:
+            spec = get_agent_spec(config, agent_name)
+            timeout = get_agent_timeout(config, agent_name, spec.timeout)
+            stream = MessageStream(
+                get_sentinel(config, spec.sentinel),
+                get_idle_gap(config),
+                None if quiet else print_preview,
+                require_header=spec.prompt_style == 'conventional'
+            )
+            with watch_agent_output(stream), agent_working_directory(workdir):
+                msg = invoke_agent(config, agent_name, snapshot, condensed, story_file, quiet, cancel, timeout)
+        except Exception:
+            msg = None
+        record['ok'] = bool(msg)
+    if cancel is None or not cancel.is_set():
+        record_agent_result(config, agent_name, bool(msg))
+    return msg
 
-    Falls back to `generate_simple_commit_message(diff)` on failure or
-    when no known agent is configured.
+
+def race_agent_calls(config, agent_names, snapshot, condensed, story_file=None, quiet=False, stop=None, workdir=None):
+    from .prompt import parse_output_message
+    from .race import race_agents, get_agent_strategy, get_hedge_delay
+
+    strategy = get_agent_strategy(config)
+    print_message(f"  - Strategy: {strategy}", quiet)
+
+    def make_call(agent_name):
+        def call(cancel):
+            msg = call_agent(config, agent_name, snapshot, condensed, story_file, True, cancel, workdir)
+            return parse_output_message(msg) if msg else None
+        return call
+
+    calls = [(agent_name, make_call(agent_name)) for agent_name in agent_names]
+    winner, msg = race_agents(calls, strategy, get_hedge_delay(config), stop)
+    if winner:
+        print_message(f"  - Winner: {winner}", quiet)
+    return msg
+
+
+def run_agent(config, snapshot, story_file=None, quiet=False, cancel=None, workdir=None):
     """
-    agent_path = config.get('MRKT_AGENT_PATH')
-    agent_name = config.get('MRKT_AGENT', 'codex')
+    Call the configured AI agent(s) and return the message, or None on failure.
+
+    `MRKT_AGENT` may list several agents (e.g. `copilot,codex`); they are
+    then raced according to `MRKT_AGENT_STRATEGY`. Setting `cancel` kills
+    the agent processes; `workdir` is the directory they run in.
+    """
+    from .condense import condense_snapshot, estimate_tokens, get_max_prompt_tokens
+    from .health import is_agent_available
+
+    agent_names = get_agent_names(config)
 
     print_message("\nGenerating commit message with AI...", quiet)
     print_message("Context being used:", quiet)
     print_message("  - Git diff (staged changes)", quiet)
+    with span('condense') as record:
+        condensed = condense_snapshot(snapshot, get_max_prompt_tokens(config))
+        record['prompt_bytes'] = len(condensed) if condensed is not None else snapshot.size
+        record['prompt_tokens'] = estimate_tokens(record['prompt_bytes'])
+    if condensed is not None:
+        print_message(f"  - Diff condensed from {snapshot.size} to {len(condensed)} bytes", quiet)
 
     # If no explicit agent name configured, just return simple message
-    if not agent_name:
+    if not agent_names:
         print_message("  - AI Agent: (none configured), using simple generator", quiet)
-        return generate_simple_commit_message(diff)
+        return None
 
-    # Copilot special flow: create temp reference file and call module
-    if agent_name == 'copilot':
-        print_message(f"  - AI Agent: {agent_name}", quiet)
-        if story_file:
-            print_message(f"  - Story file: {story_file}", quiet)
-        save_reference_to_file(diff)
-        try:
-            from .agent_copilot import generate_commit_message_with_copilot
+    for agent_name in agent_names:
+        if not is_agent_available(config, agent_name):
+            count('agent.skipped')
+            print_message(f"  - Skipping {agent_name}: it failed repeatedly, waiting for cooldown", quiet)
+    agent_names = [agent_name for agent_name in agent_names if is_agent_available(config, agent_name)]
+    if not agent_names:
+        return None
 
-            msg = generate_commit_message_with_copilot(story_file)
-        except Exception:
-            msg = None
-        finally:
-            try:
-                os.remove('temp_git_message_reference.md')
-            except Exception:
-                pass
-
-        if msg:
-            print_message("AI agent call succeeded.\n", quiet)
+    display_agents = [get_agent_command(config, name) for name in agent_names]
+    print_message(f"  - AI Agent: {', '.join(display_agents)}", quiet)
+
+    with open_story(config, story_file, snapshot, quiet) as story_file:
+        if len(agent_names) == 1:
+            msg = call_agent(config, agent_names[0], snapshot, condensed, story_file, quiet, cancel, workdir)
+        else:
+            msg = race_agent_calls(config, agent_names, snapshot, condensed, story_file, quiet, cancel, workdir)
+
+    if msg:
+        print_message("AI agent call succeeded.\n", quiet)
+        if len(agent_names) > 1:
+            # A single agent's message was already previewed as it streamed
             print_message(f"AI Output: {msg}\n", quiet)
-            return msg
+        return msg
 
-        print_message("AI agent call failed, falling back to simple commit message generation.\n\n", quiet)
-        return generate_simple_commit_message(diff)
+    print_message("AI agent call failed, falling back to simple commit message generation.\n\n", quiet)
+    return None
 
-    # Codex: call dedicated module
-    if agent_name == 'codex':
-        print_message(f"  - AI Agent: {agent_name}", quiet)
-        if story_file:
-            print_message(f"  - Story file: {story_file}", quiet)
-        try:
-            from .agent_codex import generate_commit_message_with_codex
 
-            msg = generate_commit_message_with_codex(story_file)
-        except Exception:
-            msg = None
+def needs_map_reduce(config, snapshot):
+    from .condense import estimate_tokens, get_max_prompt_tokens
 
-        if msg:
-            print_message("AI agent call succeeded.\n", quiet)
-            print_message(f"AI Output: {msg}\n", quiet)
-            return msg
+    max_tokens = get_max_prompt_tokens(config)
+    return bool(max_tokens) and estimate_tokens(snapshot.size) > max_tokens
 
-        print_message("AI agent call failed, falling back to simple commit message generation.\n\n", quiet)
-        return generate_simple_commit_message(diff)
 
-    # Unknown agent: try invoking via provided path or name as a CLI
-    if agent_path:
-        ai_command = agent_path
-        display_agent = agent_path
-    else:
-        ai_command = agent_name
-        display_agent = agent_name
+def generate_agent_message(config, snapshot, story_file=None, quiet=False, map_reduce=False, cancel=None, workdir=None):
+    """
+    Call the agent once, or split the work with map-reduce when requested
+    and the diff does not fit the prompt budget. `workdir` applies to a
+    single call only.
+    """
+    if not map_reduce or not needs_map_reduce(config, snapshot):
+        return run_agent(config, snapshot, story_file, quiet, cancel, workdir)
+    print_message("\nGenerating commit message with AI (map-reduce)...", quiet)
+    from .map_reduce import run_map_reduce
 
-    print_message(f"  - AI Agent: {display_agent}", quiet)
+    msg = run_map_reduce(config, snapshot, story_file, quiet, cancel)
+    if msg:
+        print_message(f"AI Output: {msg}\n", quiet)
+        return msg
+    print_message("Map-reduce failed, calling the agent with the condensed diff.", quiet)
+    return run_agent(config, snapshot, story_file, quiet, cancel)
 
-    prompt_text = "Generate a git commit message for the following changes:\n\n"
-    prompt_text += diff
-    if story_file and os.path.exists(story_file):
-        with open(story_file, 'r') as f:
-            story_content = f.read()
-            prompt_text = f"Story context:\n{story_content}\n\n{prompt_text}"
-            print_message(f"  - Story file: {story_file}", quiet)
 
-    print_message("Try to call agent prompt. \n\n", quiet)
-    try:
-        command = ai_command + ' -p "' + prompt_text + '"'
-        print_message(f"AI Command: {ai_command}\n", quiet)
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            print_message("AI agent call succeeded.\n", quiet)
-            print_message(f"AI Output: {result.stdout}\n", quiet)
-            return result.stdout.strip()
-    except Exception:
-        print_message(
-            "AI agent call failed, falling back "
-            + "to simple commit message generation.\n\n",
-            quiet
-        )
-
-    return generate_simple_commit_message(diff)
-
-
-def get_ai_commit_message(config, story_file=None, quiet=False):
-    diff_command = "git diff --cached"
-    diff = run_command(diff_command, capture_output=True, quiet=True)
-    if not diff:
+def get_ai_commit_message(config, story_file=None, quiet=False, use_cache=True, snapshot=None, map_reduce=False, incremental=False, cancel=None, workdir=None):
+    """
+    Generate a commit message for the staged changes.
+
+    `snapshot` is the `StagedSnapshot` already collected by the caller;
+    when omitted the staged changes are read again. With `incremental`,
+    only the changes since the last message generated on the branch are
+    sent, with that message as context (see `src.incremental`). Setting
+    `cancel` stops the agent call, and `workdir` is the directory the
+    agent runs in. Trivial changes get their message from `src.fastpath`
+    without calling the agent.
+    """
+    from .cache import build_cache_key, get_cache_size, get_cached_message, store_cached_message
+    from .exclude import get_exclude_rules
+    from .fastpath import classify_snapshot
+    from .incremental import get_delta_snapshot, get_generation, is_incremental_enabled, record_generation
+
+    if snapshot is None:
+        snapshot = get_staged_snapshot(exclude=get_exclude_rules(config))
+    if not snapshot:
         print_error("No staged changes to commit")
         return None
 
-    return get_agent_message(config, diff, story_file, quiet)
+    generation = None
+    if incremental and is_incremental_enabled(config):
+        generation = get_generation()
+
+    fast_path = classify_snapshot(config, snapshot)
+    if fast_path:
+        rule, reason, msg = fast_path
+        count(f'fastpath.{rule}')
+        print_message(f"\nFast path ({rule}): {reason}, not calling the agent.", quiet)
+        print_message(f"Message: {msg}\n", quiet)
+        if generation:
+            record_generation(generation, msg)
+        return msg
+    print_message("\nFast path: no rule matched.", quiet)
+
+    cache_key = None
+    if use_cache:
+        cache_key = build_cache_key(snapshot.iter_diff_chunks(), get_agent_name(config), story_file, snapshot.excluded_summary())
+        cached = get_cached_message(cache_key)
+        count('cache.hit' if cached else 'cache.miss')
+        if cached:
+            print_message("\nUsing cached commit message for this staged diff.\n", quiet)
+            if generation:
+                record_generation(generation, cached)
+            return cached
+
+    prompt_snapshot = snapshot
+    if generation and not map_reduce:
+        delta = get_delta_snapshot(generation, snapshot, exclude=get_exclude_rules(config))
+        if delta:
+            count('incremental.delta')
+            print_message(f"\nDescribing {delta.size} of {snapshot.size} bytes changed since the last message.", quiet)
+            prompt_snapshot = delta
+
+    msg = generate_agent_message(config, prompt_snapshot, story_file, quiet, map_reduce, cancel, workdir)
+    if not msg:
+        return generate_simple_commit_message(snapshot.iter_diff_chunks())
+    if cache_key:
+        store_cached_message(cache_key, msg, get_cache_size(config))
+    if generation:
+        record_generation(generation, msg)
+    return msg
+
+
+def chunk_header(chunk):
+    end = chunk.find(b'\n')
+    header = chunk[:end] if end != -1 else chunk
+    return header.decode('utf-8', 'replace')
+
+
+def iter_diff_files(diff):
+    """
+    Yield the path of each file in a diff.
+
+    `diff` is either the patch text or an iterable of bytes chunks as
+    yielded by `StagedSnapshot.iter_diff_chunks`.
+    """
+    if isinstance(diff, str):
+        headers = (match.group(0) for match in DIFF_HEADER_PATTERN.finditer(diff))
+    else:
+        headers = (chunk_header(chunk) for chunk in diff if chunk.startswith(b'diff --git'))
+    for line in headers:
+        parts = line.split()
+        if len(parts) >= 4:
+            yield parts[3].replace('b/', '')
 
 
 def generate_simple_commit_message(diff):
-    lines = diff.split('\n')
-    files = []
-    for line in lines:
-        if line.startswith('diff --git'):
-            parts = line.split()
-            if len(parts) >= 4:
-                file_path = parts[3].replace('b/', '')
-                files.append(file_path)
-    if files:
-        if len(files) == 1:
-            return f"Update {files[0]}"
-        else:
-            return f"Update {len(files)} files"
+    first_file = None
+    total_files = 0
+    for file_path in iter_diff_files(diff):
+        first_file = first_file or file_path
+        total_files += 1
+    if total_files == 1:
+        return f"Update {first_file}"
+    if total_files:
+        return f"Update {total_files} files"
     return "Update files"
@@ -0,0 +1,103 @@
+"""
+A small dependency-graph executor for the steps of a command.
+
+`save` and `update` are described as steps, each naming the steps whose
+results it needs. Steps whose dependencies are done run concurrently on
+threads, so a fetch of `origin/main` overlaps staging and reading the
+diff, and the branch lookup of `update` overlaps everything before the
+push.
+
+A step fails by returning False. No step starts after a failure; the
+steps already running are cancelled through the pipeline's `cancel`
+event (for those that watch it) and waited for, so nothing runs once
+`run_pipeline` returned. Exceptions are re-raised the same way.
+"""
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .trace import continue_span, get_current_span
+
+
+@dataclass
+class Step:
+    """
+    `run(results)` gets the results of the finished steps by name.
+    """
+    name: str
+    run: object
+    after: tuple = ()
+
+
+@dataclass
+class PipelineResult:
+    results: dict = field(default_factory=dict)
+    failed: str = None
+
+    @property
+    def ok(self):
+        return self.failed is None
+
+
+def check_steps(steps):
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate step names: {names}")
+    for step in steps:
+        unknown = [name for name in step.after if name not in names]
+        if unknown:
+            raise ValueError(f"Step {step.name} depends on unknown steps: {', '.join(unknown)}")
+
+
+def run_step(step, results, parent):
+    with continue_span(parent):
+        return step.run(results)
+
+
+def run_pipeline(steps, cancel=None):
+    """
+    Run `steps` as soon as their dependencies succeeded.
+
+    Args:
+        steps (list): `Step`s, started in list order when several are ready.
+        cancel (threading.Event): Set when a step fails or raises.
+
+    Returns:
+        PipelineResult: The results by step name, and the name of the
+        first failed step.
+    """
+    check_steps(steps)
+    cancel = cancel or threading.Event()
+    parent = get_current_span()
+    waiting = list(steps)
+    running = {}
+    results = {}
+    failed = None
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, len(steps)), thread_name_prefix='mrkt-step') as pool:
+        while True:
+            if failed is None and error is None:
+                for step in [step for step in waiting if all(name in results for name in step.after)]:
+                    waiting.remove(step)
+                    running[pool.submit(run_step, step, dict(results), parent)] = step.name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    value = future.result()
+                except BaseException as exc:
+                    error = error or exc
+                    cancel.set()
+                    continue
+                if value is False:
+                    failed = failed or name
+                    cancel.set()
+                else:
+                    results[name] = value
+    if error is not None:
+        raise error
+    if waiting and failed is None:
+        raise ValueError(f"Steps with circular dependencies: {', '.join(step.name for step in waiting)}")
+    return PipelineResult(results, failed)
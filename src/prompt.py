@@ -9,11 +9,15 @@ import re
 from typing import Optional
 
 
+# Placeholder for the reference path in `prompt`, replaced by
+# `build_prompt` with the private reference of each call.
+REFERENCE_FILE = 'temp_git_message_reference.md'
+
 # Base prompt used by agents. Keep as a plain string so agents can
 # extend it with story file context when needed.
 prompt = (
     "Generate a git commit message for the following changes in "
-    "@temp_git_message_reference.md "
+    f"@{REFERENCE_FILE} "
     "I want only the commit message. "
     "I will use this commit message directly. "
     "BE SURE TO ONLY RETURN THE COMMIT MESSAGE. "
@@ -29,6 +33,38 @@ prompt = (
 )
 
 
+# Prompt used to summarize one group of files when a large change set
+# is split across several agent calls (`--map-reduce`).
+map_prompt = (
+    "Summarize the changes in @{reference_file} "
+    "The file contains only part of the staged changes of a commit. "
+    "Return only a short list of the changes, one per line. "
+    "DO NOT USE MARKDOWN FORMATTING. "
+    "DO NOT write a commit message."
+)
+
+# Appended to the base prompt when the reference file holds the partial
+# summaries produced by `map_prompt` instead of a diff.
+reduce_prompt = (
+    " The referenced file contains summaries of groups of the staged "
+    "changes instead of the diff. Combine them into a single commit message."
+)
+
+
+# A Conventional Commit header, e.g. "feat(scope): summary"
+HEADER_PATTERN = re.compile(r"^[a-z]+(?:\([^\)]*\))?(?:!)?:\s+.+", re.IGNORECASE)
+
+
+def build_prompt(story_file=None, reference_file=REFERENCE_FILE, base_prompt=prompt):
+    """
+    Build the agent prompt for a reference file and optional story file.
+    """
+    command_prompt = base_prompt.replace(f"@{REFERENCE_FILE}", f"@{reference_file}")
+    if story_file:
+        command_prompt = f"{command_prompt} Also, uses as context reference the story on @{story_file}"
+    return command_prompt
+
+
 def parse_output_message(output: str) -> Optional[str]:
     """
     Extract the commit message starting from a Conventional Commit header.
@@ -40,11 +76,9 @@ def parse_output_message(output: str) -> Optional[str]:
     if not output:
         return None
 
-    pattern = re.compile(r"^[a-z]+(?:\([^\)]*\))?(?:!)?:\s+.+", re.IGNORECASE)
-
     lines = output.splitlines()
     for idx, line in enumerate(lines):
-        if pattern.match(line.strip()):
+        if HEADER_PATTERN.match(line.strip()):
             return "\n".join(lines[idx:]).strip()
 
     return None
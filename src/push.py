@@ -0,0 +1,111 @@
+"""
+Background pushes for `mrkt update --background`.
+
+The push is handed to a detached worker process that appends git's
+output to `.git/mrkt/push.log`. The state of the last push of each
+branch is kept in `.git/mrkt/push.json` and shown by `mrkt status`.
+
+Pushes are coalesced per branch: an update requested while a worker is
+still pushing the same branch only flags it, and the worker pushes once
+more when it is done, sending every commit made in the meantime.
+"""
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+from .git import run_command
+from .runner import is_process_running, redirect_output, run, start_detached
+from .state import get_state_path, load_json, save_json
+
+PUSH_FILE_NAME = 'push.json'
+PUSH_LOG_NAME = 'push.log'
+PUSH_LOCK_NAME = 'push.lock'
+
+
+def get_push_path():
+    return get_state_path(PUSH_FILE_NAME)
+
+
+def get_push_log_path():
+    return get_state_path(PUSH_LOG_NAME)
+
+
+@contextmanager
+def locked_pushes():
+    """
+    Load the push records under an exclusive lock shared with the
+    workers, and save them when the block ends.
+    """
+    path = get_push_path()
+    with open(get_state_path(PUSH_LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        records = load_json(path)
+        yield records
+        save_json(path, records)
+
+
+def request_push(argv, branch):
+    """
+    Push `branch` in the background with the `git push` command `argv`.
+
+    Returns:
+        bool: True when a new worker was started, False when the push was
+        coalesced with one already in flight for the branch.
+    """
+    with locked_pushes() as records:
+        record = records.get(branch, {})
+        if record.get('status') in ('queued', 'running') and is_process_running(record.get('pid')):
+            record['pending'] = True
+            records[branch] = record
+            return False
+        # The worker waits for this lock before it starts pushing
+        pid = start_detached(run_worker, argv, branch)
+        records[branch] = {'status': 'queued', 'pid': pid, 'requested': time.time(), 'pending': False}
+    return True
+
+
+def log_line(message):
+    # stdout is the log once the worker redirected it
+    os.write(1, f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n".encode('utf-8'))
+
+
+def run_worker(argv, branch):
+    redirect_output(get_push_log_path())
+    return push_until_done(argv, branch)
+
+
+def push_until_done(argv, branch):
+    """
+    Push, then push again while updates were requested during the push.
+    """
+    while True:
+        commit = get_branch_commit(branch)
+        with locked_pushes() as records:
+            record = records.get(branch, {})
+            record.update({'status': 'running', 'pid': os.getpid(), 'pending': False, 'started': time.time()})
+            records[branch] = record
+        log_line(f"{' '.join(argv)} ({commit or branch})")
+        result = run(argv, capture_output=False)
+        code = result.returncode if result else 1
+        log_line(f"exit {code}")
+        with locked_pushes() as records:
+            record = records.get(branch, {})
+            if record.get('pending'):
+                continue
+            record.update({
+                'status': 'done' if code == 0 else 'failed',
+                'returncode': code,
+                'commit': commit,
+                'finished': time.time(),
+            })
+            records[branch] = record
+        return code
+
+
+def get_branch_commit(branch):
+    return run_command(['git', 'rev-parse', '--verify', '-q', branch], capture_output=True, quiet=True)
+
+
+def get_push_records():
+    return load_json(get_push_path())
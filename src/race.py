@@ -0,0 +1,102 @@
+"""
+Racing and hedging across several configured agents.
+
+With `MRKT_AGENT=copilot,codex` the agents are started concurrently
+(`race`) or one after another with a delay (`hedge`). The first call that
+returns a usable message wins and the remaining calls are cancelled,
+which kills their agent processes.
+"""
+import queue
+import threading
+import time
+
+DEFAULT_STRATEGY = 'race'
+DEFAULT_HEDGE_DELAY = 5.0
+# How often a race checks its `stop` event
+STOP_POLL_INTERVAL = 0.05
+
+
+def get_agent_strategy(config):
+    strategy = config.get('MRKT_AGENT_STRATEGY', DEFAULT_STRATEGY).strip().lower()
+    return strategy if strategy in ('race', 'hedge') else DEFAULT_STRATEGY
+
+
+def get_hedge_delay(config):
+    try:
+        return max(0.0, float(config.get('MRKT_AGENT_HEDGE_DELAY', DEFAULT_HEDGE_DELAY)))
+    except ValueError:
+        return DEFAULT_HEDGE_DELAY
+
+
+def start_call(name, call, cancel, results):
+    def worker():
+        try:
+            msg = call(cancel)
+        except Exception:
+            msg = None
+        results.put((name, msg))
+
+    thread = threading.Thread(target=worker, name=f'mrkt-agent-{name}', daemon=True)
+    thread.start()
+
+
+def wait_result(results, deadline, stop):
+    """
+    Return the next `(name, message)` result. Raises `queue.Empty` at the
+    monotonic `deadline` (None waits forever) or once `stop` is set.
+    """
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if stop is not None:
+            timeout = STOP_POLL_INTERVAL if timeout is None else min(timeout, STOP_POLL_INTERVAL)
+        try:
+            return results.get(timeout=timeout)
+        except queue.Empty:
+            if (stop is not None and stop.is_set()) or (deadline is not None and time.monotonic() >= deadline):
+                raise
+
+
+def race_agents(calls, strategy=DEFAULT_STRATEGY, hedge_delay=DEFAULT_HEDGE_DELAY, stop=None):
+    """
+    Run agent calls concurrently and return the first usable message.
+
+    Args:
+        calls (list): `(name, call)` pairs, where `call(cancel)` returns a
+            message or None and stops when the `cancel` event is set.
+        strategy (str): `race` starts every call at once, `hedge` starts
+            the next call after `hedge_delay` seconds or as soon as the
+            running ones failed.
+        hedge_delay (float): Seconds to wait before hedging.
+        stop (threading.Event): Cancels every call when set from outside.
+
+    Returns:
+        tuple: `(name, message)` of the winner, or `(None, None)`.
+    """
+    cancel = threading.Event()
+    results = queue.Queue()
+    pending = list(calls)
+    running = 0
+    while pending and (strategy == 'race' or running == 0):
+        start_call(*pending.pop(0), cancel, results)
+        running += 1
+
+    while running:
+        deadline = time.monotonic() + hedge_delay if pending else None
+        try:
+            name, msg = wait_result(results, deadline, stop)
+        except queue.Empty:
+            if stop is not None and stop.is_set():
+                cancel.set()
+                return None, None
+            start_call(*pending.pop(0), cancel, results)
+            running += 1
+            continue
+        running -= 1
+        if msg:
+            cancel.set()
+            return name, msg
+        if pending and running == 0:
+            start_call(*pending.pop(0), cancel, results)
+            running += 1
+
+    return None, None
@@ -0,0 +1,439 @@
+"""
+Subprocess runner for git and agent CLIs.
+
+Commands are argv lists run without a shell; data such as commit
+messages goes through stdin. Each call returns a `CommandResult` and
+records a timing span.
+
+Agent commands run in their own process group with an optional deadline.
+A call that times out, or that is no longer needed (e.g. it lost an agent
+race), is stopped by terminating the whole group, so helper processes
+spawned by the CLI do not outlive it. Within `watch_agent_output`, the
+output of agent commands is read as it arrives and the command is stopped
+as soon as the watcher has what it needs.
+"""
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from .trace import span
+
+POLL_INTERVAL = 0.05
+KILL_GRACE_PERIOD = 1.0
+DEFAULT_AGENT_TIMEOUT = 120.0
+MAX_TRACED_ARG_LENGTH = 40
+READ_SIZE = 64 * 1024
+
+
+@dataclass
+class CommandResult:
+    """
+    Outcome of a finished command: exit code, raw stdout, decoded stderr
+    and wall time in seconds. Output that was not captured is empty.
+    `stopped` is True when the command was stopped by its watcher (see
+    `watch_agent_output`), and `idle` when that was because it printed
+    nothing for the watcher's idle gap: the output may then be cut short,
+    so the command did not succeed.
+    """
+    argv: list
+    returncode: int
+    stdout: bytes = b''
+    stderr: str = ''
+    duration: float = 0.0
+    stopped: bool = False
+    idle: bool = False
+
+    @property
+    def ok(self):
+        return not self.idle and (self.returncode == 0 or self.stopped)
+
+    @property
+    def text(self):
+        return self.stdout.decode('utf-8', 'replace')
+
+
+# Optional limit on concurrent agent calls shared by several processes,
+# set by the multi-repository fan-out (`--repos`).
+_agent_slots = None
+# Output watcher of the agent commands started by each thread
+_watchers = threading.local()
+# Working directory of the agent commands started by each thread
+_workdirs = threading.local()
+
+
+def get_agent_timeout(config, agent_name, default=None):
+    """
+    Return the deadline in seconds for an agent, or None when disabled.
+
+    `MRKT_AGENT_TIMEOUT_<NAME>` (e.g. `MRKT_AGENT_TIMEOUT_CODEX`) wins,
+    then the agent's own `default`, then `MRKT_AGENT_TIMEOUT`. `0`
+    disables the deadline.
+    """
+    key = f"MRKT_AGENT_TIMEOUT_{agent_name.upper().replace('-', '_')}"
+    value = config.get(key) or default or config.get('MRKT_AGENT_TIMEOUT', DEFAULT_AGENT_TIMEOUT)
+    try:
+        timeout = float(value)
+    except ValueError:
+        return DEFAULT_AGENT_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def signal_process_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def kill_process_group(process):
+    """
+    Terminate the process group, escalating to SIGKILL after a grace period.
+    """
+    signal_process_group(process, signal.SIGTERM)
+    try:
+        process.wait(KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        pass
+    signal_process_group(process, signal.SIGKILL)
+    process.communicate()
+
+
+def stop_process(process, new_session=False):
+    if new_session:
+        kill_process_group(process)
+    else:
+        process.kill()
+        process.communicate()
+
+
+def span_name(argv):
+    """
+    Name a command span after the program and its subcommand, e.g. `git add`.
+    """
+    if not argv:
+        return 'command'
+    name = os.path.basename(argv[0])
+    if len(argv) > 1 and not argv[1].startswith('-') and len(argv[1]) <= MAX_TRACED_ARG_LENGTH:
+        name = f"{name} {argv[1]}"
+    return name
+
+
+def traced_argv(argv):
+    # Prompts passed as arguments can be huge; keep traces small
+    return [arg if len(arg) <= MAX_TRACED_ARG_LENGTH else arg[:MAX_TRACED_ARG_LENGTH] + '...' for arg in argv]
+
+
+def run(argv, input=None, capture_output=True, cancel=None, timeout=None, new_session=False, watcher=None, cwd=None):
+    """
+    Run a command without a shell and wait for it to finish.
+
+    Args:
+        argv (list): Program and arguments.
+        input (str, bytes or iterable, optional): Data written to the
+            command's stdin; an iterable of bytes chunks is streamed to it.
+        capture_output (bool): Capture stdout and stderr instead of letting
+            them through to the terminal.
+        cancel (threading.Event, optional): When set while the command is
+            running, it is killed.
+        timeout (float, optional): Deadline in seconds.
+        new_session (bool): Run in a new process group, killed as a whole.
+        watcher (object, optional): Gets the captured stdout as it arrives,
+            see `read_watched_output`.
+        cwd (str, optional): Directory to run the command in.
+
+    Returns:
+        CommandResult or None: The result, or None if the command could not
+        be started, was cancelled or timed out.
+    """
+    if isinstance(input, str):
+        input = input.encode('utf-8')
+    pipe = subprocess.PIPE if capture_output else None
+    with span(span_name(argv), argv=traced_argv(argv)) as record:
+        start = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE if input is not None else None,
+                stdout=pipe,
+                stderr=pipe,
+                start_new_session=new_session,
+                cwd=cwd,
+            )
+        except OSError:
+            record['returncode'] = None
+            return None
+        if input is not None and not isinstance(input, bytes):
+            # Chunks are written as the command reads them, never joined
+            stdin, process.stdin = process.stdin, None
+            threading.Thread(target=write_input, args=(stdin, input), daemon=True).start()
+            input = None
+        if watcher is not None and capture_output:
+            outputs = read_watched_output(process, input, cancel, timeout, new_session, watcher)
+        else:
+            outputs = wait_for_process(process, input, cancel, timeout, new_session)
+        record['returncode'] = process.returncode if outputs else None
+        if outputs is None:
+            return None
+        stdout, stderr = outputs[:2]
+        record['stopped'] = len(outputs) > 2 and outputs[2]
+        idle = len(outputs) > 3 and outputs[3]
+        if idle:
+            record['idle'] = True
+        return CommandResult(
+            argv=list(argv),
+            returncode=process.returncode,
+            stdout=stdout or b'',
+            stderr=(stderr or b'').decode('utf-8', 'replace'),
+            duration=time.monotonic() - start,
+            stopped=record['stopped'],
+            idle=idle,
+        )
+
+
+@contextmanager
+def stream(argv, **popen_kwargs):
+    """
+    Start a command whose pipes the caller streams, recording its span
+    until it exits.
+    """
+    with span(span_name(argv), argv=traced_argv(argv)) as record:
+        with subprocess.Popen(argv, **popen_kwargs) as process:
+            yield process
+        record['returncode'] = process.returncode
+
+
+def set_agent_slots(semaphore):
+    """
+    Share a semaphore limiting how many agent commands run at once.
+    """
+    global _agent_slots
+    _agent_slots = semaphore
+
+
+def acquire_agent_slot(cancel=None):
+    if _agent_slots is None:
+        return True
+    while not _agent_slots.acquire(timeout=POLL_INTERVAL):
+        if cancel is not None and cancel.is_set():
+            return False
+    return True
+
+
+def release_agent_slot():
+    if _agent_slots is not None:
+        _agent_slots.release()
+
+
+@contextmanager
+def watch_agent_output(watcher):
+    """
+    Stream the stdout of the agent commands this thread runs in the block
+    to `watcher` (see `read_watched_output`).
+    """
+    previous = getattr(_watchers, 'watcher', None)
+    _watchers.watcher = watcher
+    try:
+        yield watcher
+    finally:
+        _watchers.watcher = previous
+
+
+@contextmanager
+def agent_working_directory(path):
+    """
+    Run the agent commands this thread starts in the block in `path`
+    instead of the current directory; None keeps the current directory.
+    """
+    previous = getattr(_workdirs, 'path', None)
+    _workdirs.path = path
+    try:
+        yield path
+    finally:
+        _workdirs.path = previous
+
+
+def run_agent_process(argv, cancel=None, timeout=None, input=None):
+    """
+    Run an agent command in its own process group and wait for it.
+
+    When agent slots are shared (see `set_agent_slots`), the command waits
+    for a free slot first; the deadline starts once it runs.
+
+    Args:
+        argv (list): Program and arguments.
+        cancel (threading.Event, optional): When set while the command is
+            running, its process group is killed.
+        timeout (float, optional): Deadline in seconds.
+        input (str, bytes or iterable, optional): Data written to the
+            agent's stdin, see `run`.
+
+    Returns:
+        CommandResult or None: The result, or None if the command could not
+        be started, was cancelled or timed out.
+    """
+    if not acquire_agent_slot(cancel):
+        return None
+    try:
+        watcher = getattr(_watchers, 'watcher', None)
+        cwd = getattr(_workdirs, 'path', None)
+        return run(argv, input=input, cancel=cancel, timeout=timeout, new_session=True, watcher=watcher, cwd=cwd)
+    finally:
+        release_agent_slot()
+
+
+def wait_for_process(process, input=None, cancel=None, timeout=None, new_session=False):
+    """
+    Wait for a started process; returns `(stdout, stderr)`, or None after
+    killing it because `cancel` was set or the deadline passed.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        wait = POLL_INTERVAL if cancel is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            wait = min(wait, remaining) if wait is not None else remaining
+        try:
+            return process.communicate(input, timeout=wait)
+        except subprocess.TimeoutExpired:
+            cancelled = cancel is not None and cancel.is_set()
+            expired = deadline is not None and time.monotonic() >= deadline
+            if not cancelled and not expired:
+                continue
+            stop_process(process, new_session)
+            return None
+
+
+def write_input(pipe, data):
+    """
+    Write `data`, bytes or an iterable of bytes chunks, to a stdin pipe
+    and close it.
+    """
+    try:
+        for chunk in ([data] if isinstance(data, bytes) else data):
+            pipe.write(chunk)
+        pipe.close()
+    except (BrokenPipeError, ValueError):
+        pass
+
+
+def read_watched_output(process, input=None, cancel=None, timeout=None, new_session=False, watcher=None):
+    """
+    Wait for a started process like `wait_for_process`, passing its stdout
+    to the watcher as it arrives.
+
+    The watcher has a `feed(data)` method returning True once the output
+    is complete, an `idle_gap` (seconds of silence after which the process
+    is stopped, or None) and an `end` offset (or None) where the useful
+    stdout ends. The process is stopped as soon as the output is complete.
+
+    Returns:
+        tuple or None: `(stdout, stderr, stopped, idle)`, `idle` being set
+        when the process was stopped after an idle gap, or None after
+        killing the process because `cancel` was set or the deadline passed.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    if input is not None:
+        # The writer owns stdin, so that `communicate` leaves it alone
+        stdin, process.stdin = process.stdin, None
+        threading.Thread(target=write_input, args=(stdin, input), daemon=True).start()
+    outputs = {process.stdout: bytearray(), process.stderr: bytearray()}
+    last_output = time.monotonic()
+    stopped = idle = False
+    with selectors.DefaultSelector() as selector:
+        for pipe in outputs:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map() and not stopped:
+            for key, _ in selector.select(POLL_INTERVAL):
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                outputs[key.fileobj].extend(data)
+                if key.fileobj is process.stdout:
+                    last_output = time.monotonic()
+                    stopped = watcher.feed(data) or stopped
+            now = time.monotonic()
+            idle_gap = watcher.idle_gap
+            if idle_gap is not None and now - last_output >= idle_gap:
+                stopped = idle = True
+            if stopped:
+                break
+            if (cancel is not None and cancel.is_set()) or (deadline is not None and now >= deadline):
+                stop_process(process, new_session)
+                return None
+    if stopped:
+        stop_process(process, new_session)
+    else:
+        remaining = max(0.001, deadline - time.monotonic()) if deadline is not None else None
+        if wait_for_process(process, None, cancel, remaining, new_session) is None:
+            return None
+    stdout = bytes(outputs[process.stdout])
+    if watcher.end is not None:
+        stdout = stdout[:watcher.end]
+    return stdout, bytes(outputs[process.stderr]), stopped, idle
+
+
+def start_detached(target, *args):
+    """
+    Run `target(*args)` in a detached process (double fork, own session)
+    and return its pid. The process exits with the value `target` returns.
+    """
+    import sys
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    read_fd, write_fd = os.pipe()
+    child = os.fork()
+    if child == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            os.setsid()
+            worker = os.fork()
+            if worker == 0:
+                os.close(write_fd)
+                code = target(*args)
+            else:
+                os.write(write_fd, str(worker).encode())
+                code = 0
+        finally:
+            os._exit(code)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        pid = int(pipe.read() or 0)
+    os.waitpid(child, 0)
+    return pid
+
+
+def redirect_output(path=None, keep=()):
+    """
+    Point stdout and stderr of a detached process at `path` (appended),
+    or at /dev/null, and close every other inherited descriptor but
+    `keep`, such as locks held by the parent or the client socket of a
+    `mrkt daemon` request.
+    """
+    output = os.open(path or os.devnull, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(output, 1)
+    os.dup2(output, 2)
+    low = 3
+    for fd in sorted(keep):
+        os.closerange(low, fd)
+        low = fd + 1
+    os.closerange(low, os.sysconf('SC_OPEN_MAX'))
+
+
+def is_process_running(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,205 @@
+"""
+Split the staged changes into several commits (`mrkt save --split`).
+
+Staged files are clustered into logical groups: a test joins the module
+it covers, files often changed together in recent history stay together,
+and the remaining files are grouped by top level directory and kind of
+file. Commit messages for all groups are generated concurrently, then the
+commits are created one by one in group order.
+"""
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+from .git import SPOOL_MAX_MEMORY, StagedSnapshot
+from .message import get_ai_commit_message
+
+DEFAULT_SPLIT_WORKERS = 4
+CO_CHANGE_COMMITS = 200
+# Commits touching more files (bulk renames, reformatting) say little
+# about which files belong together.
+CO_CHANGE_MAX_FILES = 20
+CO_CHANGE_MIN_COUNT = 2
+TEST_DIRECTORIES = {'test', 'tests', '__tests__', 'spec', 'specs'}
+DOC_EXTENSIONS = {'.md', '.rst', '.txt', '.adoc'}
+CONFIG_EXTENSIONS = {'.json', '.yml', '.yaml', '.toml', '.ini', '.cfg', '.lock'}
+
+
+def get_split_workers(config):
+    try:
+        return max(1, int(config.get('MRKT_SPLIT_WORKERS', DEFAULT_SPLIT_WORKERS)))
+    except ValueError:
+        return DEFAULT_SPLIT_WORKERS
+
+
+def is_test_file(name):
+    parts = name.split('/')
+    base = parts[-1]
+    if any(part in TEST_DIRECTORIES for part in parts[:-1]):
+        return True
+    stem = base.split('.', 1)[0]
+    return base.startswith('test_') or stem.endswith(('_test', '_spec')) or '.test.' in base or '.spec.' in base
+
+
+def module_stem(name):
+    """
+    Name shared by a module and its tests, e.g. `view` for `src/view.py`,
+    `tests/test_view.py` and `view.spec.ts`.
+    """
+    stem = os.path.basename(name).split('.', 1)[0].lower()
+    if stem.startswith('test_'):
+        stem = stem[len('test_'):]
+    for suffix in ('_test', '_spec'):
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    return stem
+
+
+def file_kind(name):
+    if is_test_file(name):
+        return 'test'
+    base = os.path.basename(name)
+    extension = os.path.splitext(base)[1].lower()
+    if extension in DOC_EXTENSIONS or name.startswith('docs/'):
+        return 'docs'
+    if extension in CONFIG_EXTENSIONS or base.startswith('.'):
+        return 'config'
+    return 'code'
+
+
+def top_directory(name):
+    return name.split('/', 1)[0] if '/' in name else '.'
+
+
+def find_root(parents, index):
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def join(parents, first, second):
+    first, second = find_root(parents, first), find_root(parents, second)
+    if first != second:
+        parents[max(first, second)] = min(first, second)
+
+
+def count_co_changes(names, change_sets):
+    position = {name: index for index, name in enumerate(names)}
+    counts = Counter()
+    for change_set in change_sets:
+        if len(change_set) > CO_CHANGE_MAX_FILES:
+            continue
+        staged = sorted({position[name] for name in change_set if name in position})
+        counts.update(combinations(staged, 2))
+    return counts
+
+
+def plan_commit_groups(files, change_sets=()):
+    """
+    Cluster staged files into commit groups.
+
+    Args:
+        files (list): File dicts of a `StagedSnapshot`.
+        change_sets (list): Files changed by recent commits, used to keep
+            co-changing files together.
+
+    Returns:
+        list: Groups of file indexes, ordered by their first file.
+    """
+    names = [file_info['name'] for file_info in files]
+    parents = list(range(len(names)))
+
+    modules = {}
+    for index, name in enumerate(names):
+        if not is_test_file(name):
+            key = module_stem(name)
+            if key in modules and os.path.dirname(names[modules[key]]) == os.path.dirname(name):
+                join(parents, index, modules[key])
+            modules.setdefault(key, index)
+    for index, name in enumerate(names):
+        if is_test_file(name) and module_stem(name) in modules:
+            join(parents, index, modules[module_stem(name)])
+
+    for (first, second), count in count_co_changes(names, change_sets).items():
+        if count >= CO_CHANGE_MIN_COUNT:
+            join(parents, first, second)
+
+    # Files not linked to any other join the files of the same directory and kind
+    sizes = Counter(find_root(parents, index) for index in range(len(names)))
+    buckets = {}
+    for index, name in enumerate(names):
+        if sizes[find_root(parents, index)] > 1:
+            continue
+        key = (top_directory(name), file_kind(name))
+        if key in buckets:
+            join(parents, index, buckets[key])
+        buckets.setdefault(key, index)
+
+    groups = {}
+    for index in range(len(names)):
+        groups.setdefault(find_root(parents, index), []).append(index)
+    return sorted(groups.values(), key=lambda group: group[0])
+
+
+def build_group_snapshots(snapshot, groups):
+    """
+    Build one `StagedSnapshot` per group from a single pass over the patch.
+
+    Groups index `snapshot.all_files`: the files past `snapshot.files`
+    were left out of the patch and stay excluded in their group.
+    """
+    patches = [tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) for _ in groups]
+    group_of = {index: number for number, group in enumerate(groups) for index in group}
+    index = -1
+    for chunk in snapshot.iter_diff_chunks():
+        if chunk.startswith(b'diff --git'):
+            index += 1
+        if index in group_of:
+            patches[group_of[index]].write(chunk)
+    snapshots = []
+    for group, patch in zip(groups, patches):
+        patch.seek(0)
+        snapshots.append(StagedSnapshot(
+            files=[snapshot.files[index] for index in group if index < len(snapshot.files)],
+            patch=patch,
+            excluded=[snapshot.all_files[index] for index in group if index >= len(snapshot.files)]
+        ))
+    return snapshots
+
+
+def group_paths(snapshot):
+    """
+    Paths to pass to `git commit --`, including the old names of renames.
+    """
+    paths = []
+    for file_info in snapshot.all_files:
+        if file_info.get('old_name') and file_info.get('status') == 'R':
+            paths.append(file_info['old_name'])
+        paths.append(file_info['name'])
+    return paths
+
+
+def generate_group_messages(config, snapshots, story_file=None, use_cache=True, map_reduce=False):
+    """
+    Generate the commit messages of all groups through a bounded worker pool.
+
+    Each agent call gets its own private reference (see `src.transport`),
+    so concurrent agents never read each other's changes.
+    """
+    workers = min(get_split_workers(config), len(snapshots))
+
+    def generate(number):
+        return get_ai_commit_message(
+            config,
+            story_file,
+            True,
+            use_cache=use_cache,
+            snapshot=snapshots[number],
+            map_reduce=map_reduce
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(generate, range(len(snapshots))))
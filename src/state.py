@@ -0,0 +1,42 @@
+"""
+Small JSON state files kept under `.git/mrkt/`.
+
+Used for the message cache, agent health and other per-repository
+state. Writes go through a temp file and `os.replace` so a crashed or
+concurrent run never leaves a half written file behind.
+"""
+import json
+import os
+import threading
+
+from .git import get_mrkt_dir
+
+
+def get_state_path(file_name):
+    mrkt_dir = get_mrkt_dir()
+    if not mrkt_dir:
+        return None
+    return mrkt_dir / file_name
+
+
+def load_json(path):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_json(path, data):
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
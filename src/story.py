@@ -0,0 +1,213 @@
+"""
+Relevant sections of the story file (`--story`).
+
+Story files are often long specs with many tasks, while a commit touches
+one or two of them. The file is split into sections at its headings
+(or blank lines when it has none), and the sections are ranked with
+BM25 against the staged changes: the words of the changed paths, and
+the identifiers and words of the changed lines. The best sections that
+fit in `MRKT_STORY_MAX_TOKENS` are sent to the agent, in file order.
+
+The tokenized sections are cached in `.git/mrkt/story_index.json` by the
+hash of the file, and in memory by path, size and mtime.
+"""
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from .condense import CHARS_PER_TOKEN
+from .state import get_state_path, load_json, save_json
+
+INDEX_FILE_NAME = 'story_index.json'
+DEFAULT_STORY_MAX_TOKENS = 2000
+MAX_INDEXED_STORIES = 20
+# Only the start of large patches is read for query terms
+MAX_QUERY_BYTES = 256 * 1024
+BM25_K1 = 1.5
+BM25_B = 0.75
+PATH_TERM_WEIGHT = 2.0
+
+HEADING_PATTERN = re.compile(r'^(#{1,6}\s+\S|(task|story|step)\s*\d+\b)', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9_]*')
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+STOP_WORDS = frozenset((
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'will', 'should', 'must',
+    'can', 'not', 'but', 'all', 'any', 'its', 'into', 'when', 'then', 'than', 'use', 'used',
+    'def', 'self', 'return', 'import', 'none', 'true', 'false', 'class', 'function', 'const',
+    'let', 'var', 'new', 'get', 'set', 'if', 'else', 'elif', 'in', 'is', 'of', 'to', 'or', 'on',
+    'an', 'as', 'at', 'be', 'by', 'it', 'we', 'do', 'py', 'js', 'ts', 'md', 'src', 'test', 'tests',
+))
+
+# Indexes already loaded by this process: path -> (size, mtime, index)
+_indexes = {}
+
+
+@dataclass
+class StoryExcerpt:
+    """
+    Sections of a story file picked for the staged changes.
+    """
+    text: str
+    sections: int
+    total_sections: int
+    size: int
+    total_size: int
+
+
+def get_story_max_tokens(config):
+    try:
+        return max(0, int(config.get('MRKT_STORY_MAX_TOKENS', DEFAULT_STORY_MAX_TOKENS)))
+    except ValueError:
+        return DEFAULT_STORY_MAX_TOKENS
+
+
+def tokenize(text):
+    """
+    Lowercase words of a text; identifiers also yield their parts, so
+    `parseStoryFile` and `parse_story_file` both give `parse` and `story`.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        parts = [part for piece in word.split('_') for part in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            terms.append(word.lower())
+        terms.extend(part.lower() for part in parts)
+    return [term for term in terms if len(term) > 2 and term not in STOP_WORDS]
+
+
+def split_sections(text):
+    """
+    Return `(start, end)` offsets of the sections of a story: each heading
+    starts one, or each paragraph when there are no headings.
+    """
+    starts = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        if HEADING_PATTERN.match(line.strip()):
+            starts.append(offset)
+        offset += len(line)
+    if not starts:
+        starts = [match.end() for match in re.finditer(r'\n\s*\n', text)]
+    starts = sorted(set([0] + starts))
+    bounds = starts[1:] + [len(text)]
+    return [(start, end) for start, end in zip(starts, bounds) if text[start:end].strip()]
+
+
+def build_index(text):
+    return [
+        {'start': start, 'end': end, 'terms': dict(Counter(tokenize(text[start:end])))}
+        for start, end in split_sections(text)
+    ]
+
+
+def get_story_index(path, text):
+    """
+    Return the sections of a story, reusing the cached index when the
+    file did not change.
+    """
+    stat = os.stat(path)
+    cached = _indexes.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    index_path = get_state_path(INDEX_FILE_NAME)
+    indexes = load_json(index_path)
+    index = indexes.get(digest)
+    if index is None:
+        index = build_index(text)
+        indexes[digest] = index
+        while len(indexes) > MAX_INDEXED_STORIES:
+            indexes.pop(next(iter(indexes)))
+        save_json(index_path, indexes)
+    _indexes[path] = (stat.st_size, stat.st_mtime_ns, index)
+    return index
+
+
+def get_query_terms(snapshot):
+    """
+    Weighted terms describing the staged changes.
+    """
+    query = Counter()
+    for file_info in snapshot.files:
+        for name in (file_info['name'], file_info.get('old_name') or ''):
+            for term in tokenize(name.replace('/', ' ').replace('.', ' ')):
+                query[term] = PATH_TERM_WEIGHT
+    read = 0
+    for chunk in snapshot.iter_diff_chunks():
+        for line in chunk.decode('utf-8', 'replace').splitlines():
+            if line[:1] in ('+', '-') and not line.startswith(('+++', '---')):
+                for term in tokenize(line[1:]):
+                    query[term] = query[term] or 1.0
+        read += len(chunk)
+        if read >= MAX_QUERY_BYTES:
+            break
+    return query
+
+
+def score_sections(index, query):
+    """
+    BM25 score of every section for the weighted query terms.
+    """
+    count = len(index)
+    lengths = [sum(section['terms'].values()) for section in index]
+    average = (sum(lengths) / count) if count else 0
+    frequencies = Counter(term for section in index for term in section['terms'] if term in query)
+    scores = []
+    for section, length in zip(index, lengths):
+        score = 0.0
+        for term, frequency in section['terms'].items():
+            if term not in query:
+                continue
+            idf = math.log(1 + (count - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / (average or 1))
+            score += query[term] * idf * frequency * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
+
+
+def select_story_excerpt(config, story_file, snapshot):
+    """
+    Pick the sections of the story most relevant to the staged changes.
+
+    Returns:
+        StoryExcerpt or None: None when the whole file fits in the budget,
+        the budget is disabled or the file cannot be read.
+    """
+    budget = get_story_max_tokens(config) * CHARS_PER_TOKEN
+    try:
+        if not budget or os.path.getsize(story_file) <= budget:
+            return None
+        with open(story_file, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        index = get_story_index(story_file, text)
+    except OSError:
+        return None
+    scores = score_sections(index, get_query_terms(snapshot)) if snapshot else [0.0] * len(index)
+    # Best sections first; without any match, the start of the file
+    order = sorted(range(len(index)), key=lambda position: -scores[position])
+    if not any(scores):
+        order = list(range(len(index)))
+    picked = []
+    size = 0
+    for position in order:
+        section_size = index[position]['end'] - index[position]['start']
+        if size + section_size <= budget and (scores[position] or not any(scores)):
+            picked.append(position)
+            size += section_size
+    picked.sort()
+    parts = [text[index[position]['start']:index[position]['end']].strip('\n') for position in picked]
+    if not parts and order:
+        # Even the best section is over the budget: keep its start
+        section = index[order[0]]
+        parts = [text[section['start']:min(section['end'], section['start'] + budget)].strip('\n')]
+        picked, size = [order[0]], len(parts[0])
+    return StoryExcerpt(
+        text='\n\n'.join(parts) + '\n',
+        sections=len(picked),
+        total_sections=len(index),
+        size=size,
+        total_size=len(text),
+    )
@@ -0,0 +1,94 @@
+"""
+Streaming of agent output (`MRKT_AGENT_IDLE_GAP`, `MRKT_AGENT_SENTINEL`).
+
+Agents often keep printing tool logs or usage footers once the commit
+message is complete. Their stdout is read as it arrives (see
+`src.runner.watch_agent_output`): from the Conventional Commit header
+on, the message lines are previewed on the terminal, and the agent is
+stopped at the first line starting with the sentinel. Lines from the
+sentinel on are dropped. Built-in agents come with the sentinel of
+their usage footer; `MRKT_AGENT_SENTINEL` overrides it.
+
+Agents routinely pause between tokens or tool calls, so silence does not
+mean the message is complete. The idle gap is off by default; when set,
+an agent silent for that long after the header is stopped and the call
+fails, instead of waiting for the agent timeout.
+"""
+from .prompt import HEADER_PATTERN
+
+DEFAULT_IDLE_GAP = 0
+PREVIEW_PREFIX = '  │ '
+
+
+def get_idle_gap(config):
+    """
+    Seconds of silence after the message started that fail the call, or None.
+    """
+    try:
+        idle_gap = float(config.get('MRKT_AGENT_IDLE_GAP', DEFAULT_IDLE_GAP))
+    except ValueError:
+        idle_gap = DEFAULT_IDLE_GAP
+    return idle_gap if idle_gap > 0 else None
+
+
+def get_sentinel(config, default=''):
+    """
+    The `MRKT_AGENT_SENTINEL` line prefix, or the agent's own `default`.
+    """
+    return config.get('MRKT_AGENT_SENTINEL', '').strip() or default
+
+
+def print_preview(line):
+    print(f"{PREVIEW_PREFIX}{line}", flush=True)
+
+
+class MessageStream:
+    """
+    Output watcher that finds the commit message in an agent's stdout.
+
+    With `require_header` (agents parsed with `parse_output_message`), the
+    message starts at the first Conventional Commit header; otherwise at
+    the first line. `preview` is called with every message line.
+    """
+
+    def __init__(self, sentinel='', idle_gap=None, preview=None, require_header=True):
+        self.sentinel = sentinel
+        self.preview = preview
+        self.require_header = require_header
+        self.started = False
+        self.end = None
+        self._idle_gap = idle_gap
+        self._offset = 0
+        self._pending = b''
+
+    @property
+    def idle_gap(self):
+        return self._idle_gap if self.started else None
+
+    def feed(self, data):
+        """
+        Take the next stdout bytes; True once the message is complete.
+        """
+        self._pending += data
+        while self.end is None:
+            newline = self._pending.find(b'\n')
+            if newline == -1:
+                return False
+            raw, self._pending = self._pending[:newline + 1], self._pending[newline + 1:]
+            start = self._offset
+            self._offset += len(raw)
+            if self.read_line(raw.decode('utf-8', 'replace').rstrip('\r\n')):
+                self.end = start
+        return True
+
+    def read_line(self, line):
+        stripped = line.strip()
+        if not self.started:
+            if self.require_header and not HEADER_PATTERN.match(stripped):
+                return False
+            self.started = True
+        elif self.sentinel and stripped.startswith(self.sentinel):
+            return True
+        if self.preview:
+            self.preview(line)
+        return False
@@ -0,0 +1,227 @@
+"""
+Tracing for mrkt commands (`--trace`, `MRKT_TRACE`).
+
+Spans time nested phases (the command, the staged diff, message
+generation, agent calls) and every subprocess started through
+`src.runner`. Counters track events such as message cache hits. Spans
+and counters are always collected, which costs a dict per span, and are
+exported only when tracing is enabled. A traced command starts from an
+empty trace, and long running processes clear them after each request
+(see `src.daemon.serve_connection`):
+
+- `text`: an indented tree printed on stderr
+- `json`: one JSON object per span, appended to `.git/mrkt/trace.jsonl`
+- `chrome`: a Chrome `trace_event` file, `.git/mrkt/trace.json`, to open
+  in chrome://tracing or Perfetto
+
+`MRKT_TRACE_FILE` overrides the destination.
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_FORMATS = ('text', 'json', 'chrome')
+TRACE_FILE_NAMES = {'json': 'trace.jsonl', 'chrome': 'trace.json'}
+# Keys every span has; anything else is an attribute set by the caller
+SPAN_FIELDS = ('id', 'parent', 'name', 'thread', 'timestamp', 'start', 'duration')
+
+_spans = []
+_counters = {}
+_ids = itertools.count(1)
+_local = threading.local()
+_lock = threading.Lock()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a child of the current span of this thread.
+
+    The yielded dict can receive extra attributes.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    record = {
+        'id': next(_ids),
+        'parent': stack[-1]['id'] if stack else None,
+        'name': name,
+        'thread': threading.get_ident(),
+        'timestamp': time.time(),
+        **attributes,
+    }
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['start'] = start
+        record['duration'] = time.perf_counter() - start
+        stack.pop()
+        _spans.append(record)
+
+
+def get_current_span():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def continue_span(record):
+    """
+    Make `record`, the current span of another thread, the parent of the
+    spans opened by this thread in the block.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    if record is not None:
+        stack.append(record)
+    try:
+        yield
+    finally:
+        if record is not None:
+            stack.pop()
+
+
+def count(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_spans():
+    return list(_spans)
+
+
+def get_counters():
+    with _lock:
+        return dict(_counters)
+
+
+def clear_spans():
+    _spans.clear()
+    with _lock:
+        _counters.clear()
+
+
+def get_trace_format(value):
+    """
+    Map a `--trace`/`MRKT_TRACE` value to an export format, or None.
+    """
+    value = (value or '').strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return 'text'
+    return value if value in TRACE_FORMATS else None
+
+
+def span_attributes(record):
+    return {key: value for key, value in record.items() if key not in SPAN_FIELDS}
+
+
+def format_text(spans, counters):
+    children = {}
+    known = {record['id'] for record in spans}
+    for record in sorted(spans, key=lambda record: record['start']):
+        parent = record['parent'] if record['parent'] in known else None
+        children.setdefault(parent, []).append(record)
+
+    lines = ['Trace:']
+
+    def add_lines(parent, depth):
+        for record in children.get(parent, []):
+            label = '  ' * depth + record['name']
+            details = ' '.join(
+                f"{key}={value}" for key, value in span_attributes(record).items() if key != 'argv'
+            )
+            lines.append(f"{label:<40} {record['duration'] * 1000:10.1f} ms  {details}".rstrip())
+            add_lines(record['id'], depth + 1)
+
+    add_lines(None, 1)
+    if counters:
+        lines.append('Counters:')
+        lines.extend(f"  {name}: {value}" for name, value in sorted(counters.items()))
+    return '\n'.join(lines) + '\n'
+
+
+def format_json_lines(spans, counters):
+    pid = os.getpid()
+    lines = [json.dumps({'type': 'span', 'pid': pid, **record}) for record in spans]
+    lines.append(json.dumps({'type': 'counters', 'pid': pid, 'timestamp': time.time(), 'counters': counters}))
+    return '\n'.join(lines) + '\n'
+
+
+def format_chrome(spans, counters):
+    pid = os.getpid()
+    origin = min((record['start'] for record in spans), default=time.perf_counter())
+    end = max((record['start'] + record['duration'] for record in spans), default=origin)
+    events = [
+        {
+            'name': record['name'],
+            'ph': 'X',
+            'ts': (record['start'] - origin) * 1e6,
+            'dur': record['duration'] * 1e6,
+            'pid': pid,
+            'tid': record['thread'],
+            'args': span_attributes(record),
+        }
+        for record in spans
+    ]
+    events.extend(
+        {'name': name, 'ph': 'C', 'ts': (end - origin) * 1e6, 'pid': pid, 'args': {name: value}}
+        for name, value in sorted(counters.items())
+    )
+    return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+
+def get_trace_path(trace_format, path=None):
+    if path:
+        return path
+    from .state import get_state_path
+
+    return get_state_path(TRACE_FILE_NAMES[trace_format])
+
+
+def export_trace(trace_format, path=None):
+    """
+    Write the collected spans and counters in `trace_format`.
+    """
+    spans, counters = get_spans(), get_counters()
+    if trace_format == 'text' and not path:
+        sys.stderr.write(format_text(spans, counters))
+        return
+    path = get_trace_path(trace_format, path)
+    if not path:
+        print("Error: No trace file destination outside a git repository", file=sys.stderr)
+        return
+    if trace_format == 'chrome':
+        with open(path, 'w') as f:
+            f.write(format_chrome(spans, counters))
+    else:
+        content = format_text(spans, counters) if trace_format == 'text' else format_json_lines(spans, counters)
+        with open(path, 'a') as f:
+            f.write(content)
+    print(f"Trace written to {path}", file=sys.stderr)
+
+
+def run_traced(trace_value, name, call, path=None):
+    """
+    Run `call()` inside a root span and export the trace afterwards.
+
+    Spans and counters left by earlier commands of the same process are
+    dropped first, so each export holds this command only.
+    """
+    trace_format = get_trace_format(trace_value)
+    if not trace_format:
+        return call()
+    clear_spans()
+    try:
+        with span(name) as record:
+            code = call()
+            record['exit_code'] = code
+        return code
+    finally:
+        export_trace(trace_format, path)
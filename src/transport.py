@@ -0,0 +1,162 @@
+"""
+How the staged changes reach an agent CLI.
+
+Generic CLIs get the changes on stdin (`transport='stdin'`), so a large
+diff never hits the command line length limit. Agents that read the
+changes from a path named in their prompt (`transport='reference_file'`)
+get a private reference that is never written to the working directory,
+chosen with `MRKT_REFERENCE_TRANSPORT`:
+
+- `memfd`: an anonymous in-memory file, opened through `/proc` (Linux)
+- `fifo`: a named pipe in a private directory, for agents reading it once
+- `file`: a private file in `$XDG_RUNTIME_DIR` (tmpfs) or the temp dir
+- `auto` (default): `memfd` where available, `file` otherwise
+
+None of them is under the working directory, so agents sandboxed to it
+must be allowed to read the reference (see `src.agent_copilot`).
+"""
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+REFERENCE_TRANSPORTS = ('auto', 'memfd', 'fifo', 'file')
+DEFAULT_REFERENCE_TRANSPORT = 'auto'
+FIFO_POLL_INTERVAL = 0.01
+
+
+def get_reference_transport(config):
+    transport = config.get('MRKT_REFERENCE_TRANSPORT', DEFAULT_REFERENCE_TRANSPORT).strip().lower()
+    if transport not in REFERENCE_TRANSPORTS:
+        transport = DEFAULT_REFERENCE_TRANSPORT
+    if transport == 'auto' or (transport == 'memfd' and not supports_memfd()):
+        return 'memfd' if supports_memfd() else 'file'
+    return transport
+
+
+def supports_memfd():
+    return hasattr(os, 'memfd_create') and os.path.isdir(f'/proc/{os.getpid()}/fd')
+
+
+def get_private_dir():
+    """
+    Return a directory only the current user can read, preferably tmpfs.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return runtime_dir
+    return tempfile.gettempdir()
+
+
+def write_content(f, content):
+    """
+    Write `content`, text or an iterable of bytes chunks, to a binary file.
+    """
+    for chunk in iter_content(content):
+        f.write(chunk)
+
+
+def iter_content(content):
+    """
+    Yield `content`, text or an iterable of bytes chunks, as bytes chunks.
+    """
+    if isinstance(content, str):
+        yield content.encode('utf-8')
+        return
+    yield from content
+
+
+def read_content(content):
+    return b''.join(iter_content(content))
+
+
+@contextmanager
+def open_reference(content, transport='file'):
+    """
+    Expose `content` at a private path for the duration of the block.
+
+    Args:
+        content (str or iterable): Text, or bytes chunks as yielded by
+            `StagedSnapshot.iter_diff_chunks`.
+        transport (str): `memfd`, `fifo` or `file`.
+
+    Yields:
+        str: A path the agent can open while the block runs.
+    """
+    if transport == 'memfd':
+        with memfd_reference(content) as path:
+            yield path
+    elif transport == 'fifo':
+        with fifo_reference(content) as path:
+            yield path
+    else:
+        with file_reference(content) as path:
+            yield path
+
+
+@contextmanager
+def memfd_reference(content):
+    fd = os.memfd_create('mrkt-reference', os.MFD_CLOEXEC)
+    try:
+        with os.fdopen(os.dup(fd), 'wb') as f:
+            write_content(f, content)
+        # Child processes open our descriptor through /proc, so the
+        # descriptor itself does not need to be inherited.
+        yield f'/proc/{os.getpid()}/fd/{fd}'
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def file_reference(content):
+    fd, path = tempfile.mkstemp(prefix='mrkt-reference-', suffix='.md', dir=get_private_dir())
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_content(f, content)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def fifo_reference(content):
+    work_dir = tempfile.mkdtemp(prefix='mrkt-', dir=get_private_dir())
+    path = os.path.join(work_dir, 'reference.md')
+    os.mkfifo(path, 0o600)
+    data = read_content(content)
+    stop = threading.Event()
+    writer = threading.Thread(target=write_fifo, args=(path, data, stop), daemon=True)
+    writer.start()
+    try:
+        yield path
+    finally:
+        stop.set()
+        writer.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def write_fifo(path, data, stop):
+    """
+    Wait for a reader to open the pipe, then write `data` to it.
+
+    Opening without blocking lets `stop` end the wait when the agent
+    never reads the pipe; a reader that goes away ends the write.
+    """
+    while not stop.is_set():
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            # ENXIO: no reader yet
+            stop.wait(FIFO_POLL_INTERVAL)
+            continue
+        os.set_blocking(fd, True)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except OSError:
+            pass
+        return
@@ -0,0 +1,166 @@
+"""
+Multi-repository fan-out for `save` and `update` (`--repos`).
+
+The repositories are matched by a glob or listed in a file. Each one runs
+the regular command handler in a bounded process pool, with its own
+`.meerkatrc` and its output captured, so the total time is close to the
+slowest repository. Agent calls from all repositories share one
+semaphore, capping how many agents run at once. A summary grouped by
+outcome is printed at the end.
+"""
+import glob
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from .message import print_message, print_error
+from .runner import set_agent_slots
+
+DEFAULT_REPO_WORKERS = 8
+DEFAULT_MAX_AGENT_CALLS = 4
+
+
+@dataclass
+class RepoResult:
+    """
+    Outcome of a command in one repository. `status` is `ok`, `failed` or
+    `clean` when there was nothing to commit.
+    """
+    repo: str
+    status: str
+    code: int
+    output: str
+    duration: float
+
+
+def get_repo_workers(config):
+    try:
+        return max(1, int(config.get('MRKT_REPOS_WORKERS', DEFAULT_REPO_WORKERS)))
+    except ValueError:
+        return DEFAULT_REPO_WORKERS
+
+
+def get_max_agent_calls(config):
+    try:
+        return max(1, int(config.get('MRKT_MAX_AGENT_CALLS', DEFAULT_MAX_AGENT_CALLS)))
+    except ValueError:
+        return DEFAULT_MAX_AGENT_CALLS
+
+
+def read_repo_patterns(path):
+    base = os.path.dirname(os.path.abspath(path))
+    patterns = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(os.path.join(base, os.path.expanduser(line)))
+    return patterns
+
+
+def find_repos(spec):
+    """
+    Resolve `--repos` to repository directories.
+
+    `spec` is a file listing one path or glob per line (relative to the
+    file), or a glob itself. Directories without `.git` are skipped;
+    submodules, whose `.git` is a file, are kept.
+    """
+    patterns = read_repo_patterns(spec) if os.path.isfile(spec) else [os.path.expanduser(spec)]
+    repos = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            path = os.path.abspath(path)
+            if os.path.isdir(path) and os.path.exists(os.path.join(path, '.git')) and path not in repos:
+                repos.append(path)
+    return repos
+
+
+def run_in_repo(command, args, repo):
+    """
+    Run a command handler inside `repo`, capturing everything written to
+    stdout and stderr, including the output of git and the agents.
+    """
+    from .git import run_command
+    from .main import get_command_handler, is_quiet_mode, load_config
+
+    start = time.monotonic()
+    os.chdir(repo)
+    with tempfile.TemporaryFile() as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved = [os.dup(1), os.dup(2)]
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            if run_command(['git', 'status', '--porcelain'], capture_output=True, quiet=True) == '':
+                status, code = 'clean', 0
+            else:
+                config = load_config(repo)
+                code = get_command_handler(command)(args, config, is_quiet_mode(config, args))
+                status = 'ok' if code == 0 else 'failed'
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+            status, code = 'failed', 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for target, fd in enumerate(saved, 1):
+                os.dup2(fd, target)
+                os.close(fd)
+        log.seek(0)
+        output = log.read().decode('utf-8', 'replace')
+    return RepoResult(repo, status, code, output, time.monotonic() - start)
+
+
+def print_results(results, quiet):
+    print_message("", quiet)
+    for result in results:
+        if result.status == 'clean' or (quiet and result.status == 'ok'):
+            continue
+        print(f"==> {result.repo} ({result.status}, {result.duration:.1f}s)")
+        for line in result.output.rstrip().splitlines():
+            print(f"    {line}")
+
+    print("\nSummary:")
+    for status, label in (('ok', 'Succeeded'), ('clean', 'Nothing to commit'), ('failed', 'Failed')):
+        repos = [result for result in results if result.status == status]
+        if repos:
+            print(f"  {label} ({len(repos)}):")
+            for result in repos:
+                print(f"    {result.repo} ({result.duration:.1f}s)")
+
+
+def run_in_repos(command, args, config, quiet):
+    """
+    Run `command` in every repository matched by `args.repos`.
+
+    Returns 0 when every repository succeeded or had nothing to commit.
+    """
+    repos = find_repos(args.repos)
+    if not repos:
+        print_error(f"No git repositories match {args.repos}")
+        return 1
+    repo_args = Namespace(**{**vars(args), 'repos': None})
+    workers = min(get_repo_workers(config), len(repos))
+    print_message(f"Running {command} in {len(repos)} repositories ({workers} at a time)...", quiet)
+
+    context = multiprocessing.get_context()
+    agent_slots = context.BoundedSemaphore(get_max_agent_calls(config))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=set_agent_slots,
+        initargs=(agent_slots,)
+    ) as pool:
+        results = list(pool.map(run_in_repo, [command] * len(repos), [repo_args] * len(repos), repos))
+
+    print_results(results, quiet)
+    return 1 if any(result.status == 'failed' for result in results) else 0
@@ -0,0 +1,50 @@
+import subprocess
+
+import pytest
+
+
+class GitRepos:
+    """
+    Creates committed git repositories under a test's tmp_path.
+
+    `git_repo('repo', {'a.py': 'x = 1\n'})` returns the path of a repository
+    on `main` with those files committed; `remote=True` adds a bare `origin`
+    next to it (`repo.git`) and `push=True` also pushes `main` to it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def __call__(self, name='repo', files=None, remote=False, push=False):
+        path = self.root / name
+        path.mkdir()
+        self.sh('git init -q -b main && git config user.email t@t && git config user.name t', path)
+        if remote or push:
+            self.sh(f'git init -q --bare -b main {path}.git', self.root)
+            self.sh(f'git remote add origin {path}.git', path)
+        for file_name, content in (files or {'a.txt': 'a\n'}).items():
+            (path / file_name).parent.mkdir(parents=True, exist_ok=True)
+            (path / file_name).write_text(content)
+        self.sh('git add . && git commit -qm init', path)
+        if push:
+            self.sh('git push -q origin main', path)
+        return path
+
+    @staticmethod
+    def sh(command, cwd):
+        subprocess.run(command, shell=True, check=True, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    return GitRepos(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def isolated_mrkt_dir(tmp_path, monkeypatch):
+    # Keep cache and health state written by the code under test out of
+    # the repository's own .git/mrkt directory.
+    mrkt_dir = tmp_path / 'mrkt-state'
+    mrkt_dir.mkdir()
+    monkeypatch.setattr('src.state.get_mrkt_dir', lambda: mrkt_dir)
+    return mrkt_dir
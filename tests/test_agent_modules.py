@@ -1,12 +1,12 @@
+import os
 import subprocess
 from types import SimpleNamespace
 from src import agent_copilot, agent_codex, prompt
+from src.runner import CommandResult
 
 
-class FakeResult:
-    def __init__(self, stdout, returncode=0):
-        self.stdout = stdout
-        self.returncode = returncode
+def FakeResult(stdout, returncode=0):
+    return CommandResult(argv=[], returncode=returncode, stdout=stdout.encode('utf-8'))
 
 
 def test_parse_output_message():
@@ -17,7 +17,7 @@ def test_parse_output_message():
 
 def test_agent_copilot_parses(monkeypatch):
     fake = FakeResult('feat(scope): title\nmore', 0)
-    monkeypatch.setattr(subprocess, 'run', lambda *a, **k: fake)
+    monkeypatch.setattr(agent_copilot, 'run_agent_process', lambda *a, **k: fake)
     res = agent_copilot.generate_commit_message_with_copilot()
     assert res is not None
     assert res.startswith('feat(scope):')
@@ -25,7 +25,24 @@ def test_agent_copilot_parses(monkeypatch):
 
 def test_agent_codex_parses(monkeypatch):
     fake = FakeResult('feat(scope): codex\nmore', 0)
-    monkeypatch.setattr(subprocess, 'run', lambda *a, **k: fake)
+    monkeypatch.setattr(agent_codex, 'run_agent_process', lambda *a, **k: fake)
     res = agent_codex.generate_commit_message_with_codex()
     assert res is not None
     assert res.startswith('feat(scope):')
+
+
+def test_copilot_may_read_references_outside_the_repo(tmp_path, monkeypatch):
+    from src.transport import open_reference, supports_memfd
+
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    monkeypatch.setattr(agent_copilot, 'run_agent_process', lambda argv, **k: calls.append(argv) or FakeResult('feat: x'))
+    for transport in ('file', 'fifo') + (('memfd',) if supports_memfd() else ()):
+        with open_reference('diff', transport) as reference:
+            agent_copilot.generate_commit_message_with_copilot('story.md', reference_file=reference)
+        argv = calls[-1]
+        assert argv[argv.index('--add-dir') + 1] == os.path.dirname(reference)
+    # Paths under the working directory need no extra permission
+    assert agent_copilot.build_copilot_command(f'read @{tmp_path}/notes.md') == [
+        'copilot', '-p', f'read @{tmp_path}/notes.md', '--allow-all-tools'
+    ]
@@ -0,0 +1,33 @@
+import sys
+
+from src import agents, message
+from src.git import StagedSnapshot
+
+
+def test_builtin_agents_are_registered():
+    spec = agents.get_agent_spec({}, 'copilot')
+    assert spec.transport == 'reference_file'
+    generate = agents.load_agent_function(spec, spec.generate)
+    assert generate.__name__ == 'generate_commit_message_with_copilot'
+
+
+def test_unknown_agent_is_generic_cli():
+    spec = agents.get_agent_spec({}, 'my-cli')
+    assert spec.transport == 'stdin'
+    assert spec.prompt_style == 'raw'
+
+
+def test_config_plugin_is_imported_only_when_called(tmp_path, monkeypatch):
+    (tmp_path / 'mrkt_test_plugin.py').write_text(
+        'def generate(story_file=None, reference_file=None, cancel=None, timeout=None):\n'
+        '    return "feat(plugin): from plugin"\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cfg = {'MRKT_AGENT': 'internal', 'MRKT_AGENT_PLUGIN_INTERNAL': 'mrkt_test_plugin:generate'}
+    spec = agents.get_agent_spec(cfg, 'internal')
+    assert spec.module == 'mrkt_test_plugin'
+    assert 'mrkt_test_plugin' not in sys.modules
+    snapshot = StagedSnapshot.from_diff('diff --git a/a b/a\n')
+    assert message.run_agent(cfg, snapshot, quiet=True) == 'feat(plugin): from plugin'
+    assert 'mrkt_test_plugin' in sys.modules
+    monkeypatch.delitem(sys.modules, 'mrkt_test_plugin')
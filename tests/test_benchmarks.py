@@ -0,0 +1,23 @@
+import subprocess
+
+from benchmarks import run
+
+
+def test_small_scenario_runs_offline_with_stub_agents(tmp_path):
+    results = run.run_benchmarks(['small', 'renames'], scale=0.01, repeat=1, latency=0, workdir=str(tmp_path))
+    phases = results['scenarios']['small']['phases']
+    for phase in ('get_git_status_info', 'get_ai_commit_message', 'generate_simple_commit_message', 'save', 'update', 'update > git push'):
+        assert phases[phase]['median'] > 0
+    assert results['scenarios']['renames']['files'] == 10
+    log = subprocess.run(
+        ['git', 'log', '-1', '--format=%s', 'main'], cwd=tmp_path / 'small.git', capture_output=True, text=True
+    )
+    assert log.stdout.strip() == 'chore(bench): update generated files'
+
+
+def test_compare_results_flags_slower_phases():
+    def results(save, update):
+        return {'scenarios': {'small': {'phases': {'save': {'median': save}, 'update': {'median': update}}}}}
+
+    rows = run.compare_results(results(1.0, 0.001), results(1.5, 0.003))
+    assert [(phase, regressed) for _, phase, _, _, _, regressed in rows] == [('save', True), ('update', False)]
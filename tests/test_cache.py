@@ -0,0 +1,75 @@
+from src import cache, message
+from src.git import StagedSnapshot
+
+
+DIFF = 'diff --git a/foo b/foo\n--- a/foo\n+++ b/foo\n@@ -1 +1 @@\n-a\n+b\n'
+
+
+def test_compute_patch_id_is_stable():
+    assert cache.compute_patch_id(DIFF) == cache.compute_patch_id(DIFF)
+    assert cache.compute_patch_id(DIFF) != cache.compute_patch_id(DIFF.replace('+b', '+c'))
+
+
+def test_compute_patch_id_from_chunks():
+    chunks = [DIFF[:10].encode(), DIFF[10:].encode()]
+    assert cache.compute_patch_id(chunks) == cache.compute_patch_id(DIFF)
+
+
+def test_build_cache_key_depends_on_agent_and_story(tmp_path):
+    story = tmp_path / 'story.md'
+    story.write_text('Task 1')
+    key = cache.build_cache_key(DIFF, 'copilot')
+    assert key != cache.build_cache_key(DIFF, 'codex')
+    assert key != cache.build_cache_key(DIFF, 'copilot', str(story))
+
+
+def test_store_and_get_cached_message(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache.store_cached_message('k', 'feat: cached', path=path)
+    assert cache.get_cached_message('k', path=path) == 'feat: cached'
+    assert cache.get_cached_message('missing', path=path) is None
+
+
+def test_store_cached_message_evicts_least_recently_used(tmp_path):
+    path = tmp_path / 'cache.json'
+    cache.store_cached_message('a', 'feat: a', max_entries=2, path=path)
+    cache.store_cached_message('b', 'feat: b', max_entries=2, path=path)
+    cache.get_cached_message('a', path=path)
+    cache.store_cached_message('c', 'feat: c', max_entries=2, path=path)
+    assert cache.get_cached_message('b', path=path) is None
+    assert cache.get_cached_message('a', path=path) == 'feat: a'
+    assert cache.get_cached_message('c', path=path) == 'feat: c'
+
+
+def test_get_ai_commit_message_uses_cache(monkeypatch, tmp_path):
+    path = tmp_path / 'cache.json'
+    calls = []
+    monkeypatch.setattr(cache, 'get_cache_path', lambda: path)
+    monkeypatch.setattr(message, 'get_staged_snapshot', lambda **kwargs: StagedSnapshot.from_diff(DIFF))
+
+    def fake_codex(story, **k):
+        calls.append(story)
+        return 'feat(scope): codex generated'
+
+    monkeypatch.setattr('src.agent_codex.generate_commit_message_with_codex', fake_codex)
+    cfg = {'MRKT_AGENT': 'codex'}
+    assert message.get_ai_commit_message(cfg, None, quiet=True) == 'feat(scope): codex generated'
+    assert message.get_ai_commit_message(cfg, None, quiet=True) == 'feat(scope): codex generated'
+    assert len(calls) == 1
+    message.get_ai_commit_message(cfg, None, quiet=True, use_cache=False)
+    assert len(calls) == 2
+
+
+def test_concurrent_stores_are_not_lost(tmp_path):
+    import threading
+
+    path = tmp_path / 'cache.json'
+    threads = [
+        threading.Thread(target=cache.store_cached_message, args=(f'k{number}', f'feat: {number}'), kwargs={'path': path})
+        for number in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(cache.get_cached_message(f'k{number}', path=path) == f'feat: {number}' for number in range(20))
@@ -0,0 +1,52 @@
+from src import condense
+from src.git import StagedSnapshot
+
+
+def file_diff(name, hunks, lines_per_hunk=5, line='+value = 1'):
+    parts = [f'diff --git a/{name} b/{name}', f'--- a/{name}', f'+++ b/{name}']
+    for hunk in range(hunks):
+        parts.append(f'@@ -{hunk * 10},0 +{hunk * 10},{lines_per_hunk} @@')
+        parts.extend([line] * lines_per_hunk)
+    return '\n'.join(parts) + '\n'
+
+
+def file_info(name, additions=5):
+    return {'status': 'M', 'name': name, 'additions': additions, 'deletions': 0, 'binary': False}
+
+
+def test_condense_snapshot_keeps_small_diff_untouched():
+    snapshot = StagedSnapshot.from_diff(file_diff('a.py', 1), [file_info('a.py')])
+    assert condense.condense_snapshot(snapshot, 1000) is None
+    assert condense.condense_snapshot(snapshot, 0) is None
+
+
+def test_condense_snapshot_collapses_repetitive_hunks():
+    snapshot = StagedSnapshot.from_diff(file_diff('a.py', 20), [file_info('a.py', 100)])
+    condensed = condense.condense_snapshot(snapshot, 100)
+    assert 'diff --git a/a.py b/a.py' in condensed
+    assert '19 repetitive hunk(s) collapsed' in condensed
+    assert len(condensed) <= 100 * condense.CHARS_PER_TOKEN
+
+
+def test_condense_snapshot_prefers_source_over_lockfiles():
+    diff = file_diff('package-lock.json', 1, 200, '+  "dep": "1.0.0",') + file_diff('src/app.py', 1, 3, '+def run():')
+    files = [file_info('package-lock.json', 200), file_info('src/app.py', 3)]
+    condensed = condense.condense_snapshot(StagedSnapshot.from_diff(diff, files), 150)
+    assert '+def run():' in condensed
+    assert '"dep"' not in condensed
+    assert len(condensed) <= 150 * condense.CHARS_PER_TOKEN
+
+
+def test_condense_snapshot_summarizes_files_over_budget():
+    names = [f'src/module_{index}.py' for index in range(30)]
+    diff = ''.join(file_diff(name, 1, 3, f'+def {name[4:-3]}():') for name in names)
+    condensed = condense.condense_snapshot(StagedSnapshot.from_diff(diff, [file_info(n, 3) for n in names]), 200)
+    assert 'Other changed files (diff omitted):' in condensed
+    assert 'src/module_29.py | +3 -0' in condensed or 'more file(s)' in condensed
+    assert len(condensed) <= 200 * condense.CHARS_PER_TOKEN
+
+
+def test_render_file_signatures_keeps_headers_and_signatures():
+    lines = ['diff --git a/a.py b/a.py', '@@ -1 +1,3 @@', '+def run():', '+    return 1', '+x = 2']
+    rendered = condense.render_file(condense.digest_file(iter(lines)), 'signatures')
+    assert rendered == 'diff --git a/a.py b/a.py\n@@ -1 +1,3 @@\n+def run():\n'
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import time
+
+from src import daemon
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(tmp_path):
+    env = dict(os.environ, XDG_RUNTIME_DIR=str(tmp_path), MRKT_DAEMON_IDLE_TIMEOUT='30')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'meerkat.py'), 'daemon', 'run'],
+        cwd=ROOT,
+        env=env,
+    )
+    deadline = time.monotonic() + 10
+    while not os.path.exists(daemon.get_socket_path()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return process
+
+
+def test_should_forward_only_repo_commands(monkeypatch):
+    monkeypatch.delenv('MRKT_DAEMON', raising=False)
+    assert daemon.should_forward(['--quiet', 'save'])
+    assert not daemon.should_forward(['daemon', 'stop'])
+    assert not daemon.should_forward(['help'])
+    monkeypatch.setenv('MRKT_DAEMON', 'off')
+    assert not daemon.should_forward(['save'])
+
+
+def test_forward_without_daemon_runs_locally(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert daemon.forward_to_daemon(['save']) is None
+
+
+def test_daemon_serves_forwarded_command(tmp_path, monkeypatch, capfd):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    monkeypatch.setattr(daemon, 'FORWARDED_COMMANDS', ('help',))
+    process = start_server(tmp_path)
+    try:
+        assert daemon.read_daemon_pid() == process.pid
+        assert daemon.forward_to_daemon(['help']) == 0
+        assert 'usage' in capfd.readouterr().out
+    finally:
+        process.terminate()
+        process.wait(10)
+    assert not os.path.exists(daemon.get_socket_path())
+
+
+def test_daemon_refuses_a_directory_it_does_not_own_privately(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    monkeypatch.setattr(daemon, 'FORWARDED_COMMANDS', ('help',))
+    daemon_dir = tmp_path / f'mrkt-{os.getuid()}'
+    daemon_dir.mkdir(mode=0o755)
+    daemon_dir.chmod(0o755)
+    (daemon_dir / 'daemon.sock').write_text('')
+    assert not daemon.is_private_dir(str(daemon_dir))
+    assert daemon.forward_to_daemon(['help']) is None
+    assert daemon.serve(idle_timeout=1) == 1
+    assert 'mode 0700' in capsys.readouterr().err
+
+    daemon_dir.chmod(0o700)
+    assert daemon.is_private_dir(str(daemon_dir))
+    os.symlink(daemon_dir, tmp_path / 'link')
+    assert not daemon.is_private_dir(str(tmp_path / 'link'))
+
+
+def test_peer_uid_of_a_unix_socket():
+    import socket
+
+    first, second = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    with first, second:
+        expected = os.getuid() if hasattr(socket, 'SO_PEERCRED') else None
+        assert daemon.get_peer_uid(first) == expected
+
+
+def test_daemon_drops_its_spans_after_each_connection(monkeypatch):
+    from src import trace
+
+    def handle(server, conn):
+        with trace.span('load_config'):
+            trace.count('config.parsed')
+
+    monkeypatch.setattr(daemon, 'handle_connection', handle)
+    trace.clear_spans()
+    for _ in range(3):
+        daemon.serve_connection(None, None)
+    assert trace.get_spans() == [] and trace.get_counters() == {}
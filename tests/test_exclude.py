@@ -0,0 +1,88 @@
+from src import condense, exclude, fastpath, git, split
+
+
+def test_rules_follow_gitignore_syntax():
+    rules = exclude.compile_rules(['*.lock', 'vendor/', '/build', 'docs/**/*.png', '!keep.lock'])
+    assert rules.match('yarn.lock') and rules.match('web/Cargo.lock')
+    assert not rules.match('keep.lock')
+    assert rules.match('vendor/lib/a.py') and rules.match('third/vendor/b.py')
+    assert not rules.match('vendor.py')
+    assert rules.match('build/out.js') and not rules.match('src/build/out.js')
+    assert rules.match('docs/img/a.png') and rules.match('docs/a.png') and not rules.match('a.png')
+    assert not exclude.compile_rules([])
+    assert exclude.compile_rules(['*.lock']) is exclude.compile_rules(['*.lock'])
+
+
+def test_exclude_rules_from_config_and_ignore_file(git_repo, monkeypatch):
+    repo = git_repo('repo', {'a.py': 'a\n'})
+    (repo / '.mrktignore').write_text('# generated\ngen/\n!package-lock.json\n')
+    (repo / 'src').mkdir()
+    monkeypatch.chdir(repo / 'src')
+    rules = exclude.get_exclude_rules({'MRKT_EXCLUDE': '*.pb.go, '})
+    assert rules.match('gen/api.py') and rules.match('api.pb.go') and rules.match('yarn.lock')
+    assert not rules.match('package-lock.json') and not rules.match('src/app.py')
+    assert rules.binary
+    rules = exclude.get_exclude_rules({'MRKT_EXCLUDE_DEFAULTS': 'false'})
+    assert rules.match('gen/api.py') and not rules.match('yarn.lock')
+    assert not rules.binary
+
+
+def test_fast_path_and_condenser_share_the_default_patterns(git_repo, monkeypatch):
+    repo = git_repo('repo', {'web/dist/app.js': 'a\n', 'api/user_pb2.py': 'a\n', 'app.py': 'a\n'})
+    monkeypatch.chdir(repo)
+    git_repo.sh('git rm -rq web api', repo)
+    snapshot = git.get_staged_snapshot()
+    assert fastpath.classify_snapshot({}, snapshot)[2] == 'chore: remove 2 generated files'
+    rules = exclude.compile_rules(exclude.DEFAULT_EXCLUDES)
+    assert all(rules.match(file_info['name']) for file_info in snapshot.files)
+    assert [condense.file_score(file_info) for file_info in snapshot.files] == [1, 1]
+
+
+def test_excluded_files_are_left_out_of_the_patch(git_repo, monkeypatch):
+    repo = git_repo('repo', {'app.py': 'a\n', 'package-lock.json': '{}\n'})
+    monkeypatch.chdir(repo)
+    (repo / 'app.py').write_text('a\nb\n')
+    (repo / 'package-lock.json').write_text(''.join(f'"{n}"\n' for n in range(1500)))
+    # Binary by its content, whatever its extension
+    (repo / 'logo.dat').write_bytes(b'\x89PNG\0\1')
+    git_repo.sh('git add -A', repo)
+    rules = exclude.compile_rules(exclude.DEFAULT_EXCLUDES, binary=True)
+
+    for min_lines in (1, 10 ** 6):
+        # By pathspec, or skipping their chunks
+        monkeypatch.setattr(git, 'EXCLUDE_PATHSPEC_MIN_LINES', min_lines)
+        snapshot = git.get_staged_snapshot(exclude=rules)
+        assert [file_info['name'] for file_info in snapshot.files] == ['app.py']
+        assert [file_info['name'] for file_info in snapshot.excluded] == ['logo.dat', 'package-lock.json']
+        assert snapshot.diff.startswith('diff --git a/app.py') and 'package-lock' not in snapshot.diff
+        assert len(list(snapshot.iter_diff_chunks())) == 1
+        assert snapshot.status_info()['total_files'] == 3
+        assert snapshot.additions == 1501
+        assert snapshot.excluded_summary() == (
+            "Files left out of the diff (generated, vendored or binary):\n"
+            "  logo.dat | binary\n"
+            "  package-lock.json | +1500 -1\n\n"
+        )
+
+    full = git.get_staged_snapshot()
+    assert len(full.files) == 3 and not full.excluded
+
+
+def test_excluded_files_keep_their_group_and_fast_path(git_repo, monkeypatch):
+    repo = git_repo('repo', {'app.py': 'a\n', 'yarn.lock': 'a\n'})
+    monkeypatch.chdir(repo)
+    rules = exclude.compile_rules(exclude.DEFAULT_EXCLUDES)
+    (repo / 'yarn.lock').write_text('b\n')
+    git_repo.sh('git add -A', repo)
+    snapshot = git.get_staged_snapshot(exclude=rules)
+    assert not snapshot.files and snapshot.excluded
+    assert fastpath.classify_snapshot({}, snapshot)[2] == 'chore(deps): update yarn.lock'
+
+    (repo / 'app.py').write_text('b\n')
+    git_repo.sh('git add -A', repo)
+    snapshot = git.get_staged_snapshot(exclude=rules)
+    assert fastpath.classify_snapshot({}, snapshot) is None
+    group_snapshots = split.build_group_snapshots(snapshot, [[1], [0]])
+    assert [split.group_paths(group) for group in group_snapshots] == [['yarn.lock'], ['app.py']]
+    assert group_snapshots[0].excluded and not group_snapshots[0].diff
+    assert group_snapshots[1].diff.startswith('diff --git a/app.py')
@@ -0,0 +1,105 @@
+import subprocess
+
+from src import fastpath, message
+from src.git import get_staged_snapshot
+
+
+def classify(repo, config=None):
+    subprocess.run(['git', 'add', '-A'], cwd=repo, check=True)
+    decision = fastpath.classify_snapshot(config or {}, get_staged_snapshot())
+    return decision and decision[::2]
+
+
+def test_trivial_changes_get_a_message(git_repo, monkeypatch):
+    repo = git_repo('repo', {
+        'package.json': '{\n  "name": "app",\n  "version": "1.2.3"\n}\n',
+        'package-lock.json': '{\n  "version": "1.2.3"\n}\n',
+        'src/app.py': 'def main():\n    return 1\n',
+        'dist/app.min.js': 'x\n',
+        'dist/app.js.map': '{}\n',
+    })
+    monkeypatch.chdir(repo)
+
+    (repo / 'package-lock.json').write_text('{\n  "version": "1.2.4"\n}\n')
+    assert classify(repo) == ('lockfile', 'chore(deps): update package-lock.json')
+
+    (repo / 'package.json').write_text('{\n  "name": "app",\n  "version": "1.2.4"\n}\n')
+    assert classify(repo) == ('version', 'chore(release): bump version to 1.2.4')
+    git_repo.sh('git commit -qm bump', repo)
+
+    (repo / 'src/app.py').write_text('def main():  \n    return  1\n\n')
+    assert classify(repo) is None
+    assert classify(repo, {'MRKT_FAST_PATH': 'whitespace'}) == ('whitespace', 'style: reformat src/app.py')
+    git_repo.sh('git reset -q --hard', repo)
+
+    git_repo.sh('git mv src/app.py src/main.py', repo)
+    assert classify(repo) == ('rename', 'refactor: rename src/app.py to src/main.py')
+    git_repo.sh('git commit -qm rename', repo)
+
+    git_repo.sh('git rm -rq dist', repo)
+    assert classify(repo) == ('generated', 'chore: remove generated files in dist/')
+    assert classify(repo, {'MRKT_FAST_PATH': 'lockfile,rename'}) is None
+
+
+def test_real_changes_and_custom_patterns(git_repo, monkeypatch):
+    repo = git_repo('repo', {'app.py': 'x = 1\n', 'deps.lock': 'a\n'})
+    monkeypatch.chdir(repo)
+    (repo / 'app.py').write_text('x = 2\n')
+    assert classify(repo) is None
+    git_repo.sh('git reset -q --hard', repo)
+    (repo / 'deps.lock').write_text('b\n')
+    assert classify(repo) is None
+    assert classify(repo, {'MRKT_LOCKFILES': '*.lock'}) == ('lockfile', 'chore(deps): update deps.lock')
+
+
+def test_whitespace_rule_keeps_indentation_and_line_order(git_repo, monkeypatch):
+    repo = git_repo('repo', {
+        'm.py': 'def f(x):\n    if x:\n        print("a")\n        print("b")\n    return x\n',
+        'app.js': 'function f() {\n  a();\n  b();\n}\n',
+    })
+    monkeypatch.chdir(repo)
+    config = {'MRKT_FAST_PATH': 'whitespace'}
+
+    (repo / 'm.py').write_text('def f(x):\n    if x:\n        print("a")\n        print("b")\n        return x\n')
+    assert classify(repo, config) is None
+    git_repo.sh('git reset -q --hard', repo)
+
+    (repo / 'm.py').write_text('def f(x):\n    if x:\n        print("b")\n        print("a")\n    return x\n')
+    assert classify(repo, config) is None
+    git_repo.sh('git reset -q --hard', repo)
+
+    (repo / 'app.js').write_text('function f() {\n  b();\n  a();\n}\n')
+    assert classify(repo, config) is None
+    git_repo.sh('git reset -q --hard', repo)
+
+    (repo / 'app.js').write_text('function f() {\n    a();\n    b();\n}\n')
+    assert classify(repo, config) == ('whitespace', 'style: reformat app.js')
+
+
+def test_whitespace_inside_tokens_and_strings_is_not_a_reformat(git_repo, monkeypatch):
+    repo = git_repo('repo', {'app.js': 'print("hello world");\nlet a = b - -c;\nlet s = "a  b";\n'})
+    monkeypatch.chdir(repo)
+    config = {'MRKT_FAST_PATH': 'whitespace'}
+
+    for before, after in [
+        ('print("hello world");', 'print("helloworld");'),
+        ('let a = b - -c;', 'let a = b --c;'),
+        ('let s = "a  b";', 'let s = "a b";'),
+    ]:
+        (repo / 'app.js').write_text((repo / 'app.js').read_text().replace(before, after))
+        assert classify(repo, config) is None, after
+        git_repo.sh('git reset -q --hard', repo)
+
+    (repo / 'app.js').write_text('print("hello world");\nlet a  =  b  - -c;\nlet s = "a  b";\n')
+    assert classify(repo, config) == ('whitespace', 'style: reformat app.js')
+
+
+def test_fast_path_skips_the_agent_and_is_reported(git_repo, monkeypatch, capsys):
+    repo = git_repo('repo', {'a.py': 'x = 1\n'})
+    monkeypatch.chdir(repo)
+    monkeypatch.setattr(message, 'generate_agent_message', lambda *a: 'feat: from the agent')
+    git_repo.sh('git mv a.py b.py', repo)
+    assert message.get_ai_commit_message({}, use_cache=False) == 'refactor: rename a.py to b.py'
+    assert 'Fast path (rename): files were renamed without changes' in capsys.readouterr().out
+    assert message.get_ai_commit_message({'MRKT_FAST_PATH': ''}, use_cache=False) == 'feat: from the agent'
+    assert 'Fast path: no rule matched' in capsys.readouterr().out
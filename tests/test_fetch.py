@@ -0,0 +1,52 @@
+import subprocess
+import time
+
+from src import fetch
+
+
+def tracking_commit(repo):
+    return subprocess.run(['git', 'rev-parse', fetch.TRACKING_REF], cwd=repo, capture_output=True, text=True).stdout.strip()
+
+
+def test_fetch_command_only_fetches_main(git_repo, monkeypatch):
+    repo = git_repo('repo', push=True)
+    monkeypatch.chdir(repo)
+    git_repo.sh(f'git update-ref -d {fetch.TRACKING_REF}', repo)
+    argv = fetch.build_fetch_command()
+    assert argv[-2:] == ['origin', '+refs/heads/main:refs/remotes/origin/main']
+    assert '--no-tags' in argv
+    assert '--negotiation-tip=refs/remotes/origin/main' not in argv
+    fetch.fetch_main(quiet=True)
+    assert '--negotiation-tip=refs/remotes/origin/main' in fetch.build_fetch_command()
+
+
+def test_fetch_is_skipped_within_the_max_age(git_repo, monkeypatch, capsys):
+    repo = git_repo('repo', push=True)
+    monkeypatch.chdir(repo)
+    calls = []
+    monkeypatch.setattr(fetch, 'fetch_main', lambda quiet: calls.append(quiet) or True)
+    fetch.save_json(fetch.get_fetch_path(), {'fetched': time.time()})
+    assert fetch.ensure_main_fetched({'MRKT_FETCH_MAX_AGE': '60'}, quiet=True)
+    assert calls == []
+    assert capsys.readouterr().out == ''
+    assert fetch.ensure_main_fetched({'MRKT_FETCH_MAX_AGE': '60'})
+    assert 'Using origin/main fetched less than 60s ago' in capsys.readouterr().out
+    assert fetch.ensure_main_fetched({'MRKT_FETCH_MAX_AGE': '0'}, quiet=True)
+    assert calls == [True]
+    assert fetch.start_prefetch({'MRKT_FETCH_MAX_AGE': '60'}) is None
+
+
+def test_prefetch_runs_in_the_background_and_is_waited_for(tmp_path, git_repo, monkeypatch):
+    repo = git_repo('repo', push=True)
+    clone = tmp_path / 'clone'
+    git_repo.sh(f'git clone -q {repo}.git {clone}', tmp_path)
+    (repo / 'b.txt').write_text('b\n')
+    git_repo.sh('git add . && git commit -qm second && git push -q origin main', repo)
+    monkeypatch.chdir(clone)
+
+    assert fetch.start_prefetch({'MRKT_FETCH_MAX_AGE': '60'})
+    # Waits on the lock held by the worker, then finds the fetch fresh
+    monkeypatch.setattr(fetch, 'fetch_main', lambda quiet: False)
+    assert fetch.ensure_main_fetched({'MRKT_FETCH_MAX_AGE': '60'}, quiet=True)
+    assert tracking_commit(clone) == tracking_commit(repo)
+    assert fetch.start_prefetch({'MRKT_PREFETCH': 'false'}) is None
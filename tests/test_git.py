@@ -1,44 +1,70 @@
+import io
 import subprocess
 import builtins
-from src import git
+from src import fetch, git
 
 
 def test_run_command_capture_output_success():
-    out = git.run_command('echo hello', capture_output=True)
+    out = git.run_command(['echo', 'hello'], capture_output=True)
     assert out.strip() == 'hello'
 
 
 def test_run_command_no_capture_success():
-    res = git.run_command('true')
+    res = git.run_command(['true'])
     assert res is True
 
 
 def test_run_command_failure_returns_none():
     # `false` returns non-zero
-    res = git.run_command('false', quiet=True)
+    res = git.run_command(['false'], quiet=True)
     assert res is None
 
 
-def test_get_current_branch_when_no_git(monkeypatch):
+def test_get_current_branch_when_no_git(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
     monkeypatch.setattr(git, 'run_command', lambda *a, **k: None)
     assert git.get_current_branch() == 'main'
 
 
-def test_get_git_status_info_parsing(monkeypatch):
-    name_status = 'M\tfile1.py\nA\tfile2.txt\n'
-    numstat = '10\t2\tfile1.py\n-\t-\tfile2.txt\n'
-    def fake_run(cmd, capture_output=False, quiet=False):
-        if 'name-status' in cmd:
-            return name_status
-        if 'numstat' in cmd:
-            return numstat
-        return ''
-
-    monkeypatch.setattr(git, 'run_command', fake_run)
+def test_get_git_status_info_parsing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subprocess.run('git init -q && git config user.email t@t && git config user.name t', shell=True, check=True)
+    (tmp_path / 'file1.py').write_text('a\nb\n')
+    subprocess.run('git add . && git commit -qm init', shell=True, check=True)
+    (tmp_path / 'file1.py').write_text('a\nc\nd\n')
+    (tmp_path / 'file2.bin').write_bytes(b'\0\1')
+    subprocess.run('git add .', shell=True, check=True)
     info = git.get_git_status_info()
     assert info['total_files'] == 2
-    assert info['additions'] == 10
-    assert info['deletions'] == 2
+    assert info['additions'] == 2
+    assert info['deletions'] == 1
+
+
+def test_read_staged_snapshot_renames_and_patch():
+    output = (
+        b':100644 100644 aaa aaa R100\0old.py\0new.py\0'
+        b':100644 100644 bbb ccc M\0file.py\0'
+        b'0\t0\t\0old.py\0new.py\0'
+        b'3\t1\tfile.py\0\0'
+        b'diff --git a/old.py b/new.py\nrename from old.py\n'
+        b'diff --git a/file.py b/file.py\n+x\n'
+    )
+    snapshot = git.read_staged_snapshot(io.BytesIO(output))
+    assert snapshot.files[0]['status'] == 'R'
+    assert snapshot.files[0]['name'] == 'new.py'
+    assert snapshot.files[0]['old_name'] == 'old.py'
+    assert snapshot.files[1]['additions'] == 3
+    assert snapshot.diff.startswith('diff --git a/old.py b/new.py')
+    assert len(list(snapshot.iter_diff_chunks())) == 2
+    assert git.read_staged_snapshot(io.BytesIO(b'')) is None
+
+
+def test_iter_diff_chunks_bounds_chunk_size():
+    patch = b'diff --git a/big b/big\n' + b'+line\n' * 1000 + b'diff --git a/small b/small\n+x\n'
+    chunks = list(git.iter_diff_chunks(io.BytesIO(patch), block_size=64, max_chunk_size=512))
+    assert b''.join(chunks) == patch
+    assert max(len(chunk) for chunk in chunks) <= 512 + 64
+    assert chunks[-1] == b'diff --git a/small b/small\n+x\n'
 
 
 def test_create_and_push_branch(monkeypatch, capsys):
@@ -54,5 +80,6 @@ def test_create_and_push_branch(monkeypatch, capsys):
 
 def test_perform_rebase_and_merge(monkeypatch):
     monkeypatch.setattr(git, 'run_command', lambda *a, **k: True)
+    monkeypatch.setattr(fetch, 'run_command', lambda *a, **k: True)
     assert git.perform_rebase(quiet=True) is True
     assert git.perform_merge(quiet=True) is True
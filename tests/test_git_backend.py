@@ -0,0 +1,73 @@
+import pytest
+
+from src import git, git_backend, trace
+
+FILES = {'src/app.py': 'value = 1\n', 'old.txt': 'old\n'}
+
+
+def answers(path, monkeypatch):
+    monkeypatch.chdir(path)
+    files, subprocess_backend = git_backend.FileBackend(), git_backend.SubprocessBackend()
+    for query in ('git_dir', 'current_branch', 'staged_paths', 'has_staged_changes'):
+        assert getattr(files, query)() == getattr(subprocess_backend, query)(), query
+    return files
+
+
+def test_file_backend_matches_git(git_repo, monkeypatch):
+    repo = git_repo('repo', FILES)
+    assert answers(repo / 'src', monkeypatch).staged_paths() == []
+    (repo / 'src' / 'app.py').write_text('value = 2\n')
+    git_repo.sh('git mv old.txt new.txt && git add .', repo)
+    assert answers(repo, monkeypatch).staged_paths() == ['new.txt', 'old.txt', 'src/app.py']
+    git_repo.sh('git commit -qm second && git pack-refs --all && git checkout -q --detach', repo)
+    assert answers(repo, monkeypatch).current_branch() == 'HEAD'
+
+
+def test_file_backend_follows_worktrees_and_unborn_branches(tmp_path, git_repo, monkeypatch):
+    repo = git_repo('repo', FILES)
+    git_repo.sh(f'git worktree add -q -b feature {tmp_path / "tree"}', repo)
+    assert answers(tmp_path / 'tree', monkeypatch).current_branch() == 'feature'
+
+    empty = tmp_path / 'empty'
+    empty.mkdir()
+    git_repo.sh('git init -q -b start', empty)
+    monkeypatch.chdir(empty)
+    # git cannot resolve HEAD on an unborn branch; the file backend still names it
+    assert git_backend.FileBackend().current_branch() == 'start'
+
+
+def test_file_backend_declines_what_it_does_not_handle(tmp_path, git_repo, monkeypatch):
+    repo = git_repo('repo', FILES)
+    monkeypatch.chdir(repo)
+    monkeypatch.setenv('GIT_DIR', str(repo / '.git'))
+    assert git_backend.FileBackend().current_branch() is None
+    monkeypatch.delenv('GIT_DIR')
+
+    with open(repo / '.git' / 'config', 'a') as f:
+        f.write('[extensions]\n\trefStorage = reftable\n')
+    assert git_backend.FileBackend().git_dir() is None
+
+    broken = tmp_path / 'broken'
+    broken.mkdir()
+    (broken / '.git').write_text(f'gitdir: {tmp_path / "missing"}\n')
+    assert git_backend.FileBackend(start=str(broken)).current_branch() is None
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    assert git_backend.FileBackend(start=str(outside)).git_dir() is None
+
+
+def test_git_falls_back_to_subprocess_backend(git_repo, monkeypatch):
+    repo = git_repo('repo', FILES)
+    monkeypatch.chdir(repo)
+    trace.clear_spans()
+    assert git.get_current_branch() == 'main'
+    assert 'git_backend.fallback' not in trace.get_counters()
+    monkeypatch.setenv('GIT_DIR', str(repo / '.git'))
+    assert git.get_current_branch() == 'main'
+    assert git.has_staged_changes() is False
+    assert trace.get_counters()['git_backend.fallback'] == 1
+
+
+def test_git_backend_is_abstract():
+    with pytest.raises(TypeError):
+        git_backend.GitBackend()
@@ -1,3 +1,5 @@
+import os
+import threading
 from types import SimpleNamespace
 from src import handle_start, handle_save, handle_update
 
@@ -11,21 +13,24 @@ def test_build_branch_name_and_prefix():
 
 def test_build_commit_and_push_command():
     cfg = {'MRKT_NO_VERIFY': 'true'}
-    cmd = handle_save.build_commit_command(cfg, 'msg', wip=False)
-    assert '--no-verify' in cmd
-    cmd2 = handle_save.build_commit_command({}, 'm', wip=True)
-    assert 'WIP:' in cmd2
+    cmd = handle_save.build_commit_command(cfg)
+    assert cmd == ['git', 'commit', '-F', '-', '--no-verify']
+    assert handle_save.build_commit_command({}, ['a.py']) == ['git', 'commit', '-F', '-', '--', 'a.py']
+    assert handle_save.build_commit_message('m', wip=True) == 'WIP: m'
     p = handle_update.build_push_command({'MRKT_NO_VERIFY_PUSH': 'false', 'MRKT_NO_VERIFY': 'false'}, 'branch')
-    assert 'git push origin branch' in p
+    assert p == ['git', 'push', 'origin', 'branch']
 
 
 def test_handle_save_and_update_flow(monkeypatch):
     # monkeypatch run_command and get_ai_commit_message to simulate full flow
     monkeypatch.setattr('src.handle_save.run_command', lambda *a, **k: True)
-    monkeypatch.setattr('src.handle_save.get_git_status_info', lambda *a, **k: None)
+    monkeypatch.setattr('src.handle_save.get_staged_snapshot', lambda *a, **k: None)
+    monkeypatch.setattr('src.handle_save.has_staged_changes', lambda: True)
     monkeypatch.setattr('src.handle_save.perform_rebase', lambda *a, **k: True)
     monkeypatch.setattr('src.handle_save.perform_merge', lambda *a, **k: True)
     monkeypatch.setattr('src.handle_save.get_ai_commit_message', lambda *a, **k: 'feat: ok')
+    # No detached worker fetching from the checkout's real remote
+    monkeypatch.setattr('src.fetch.start_prefetch', lambda *a, **k: None)
     args = SimpleNamespace(rebase=False, merge=False, wip=False, story=None)
     res = handle_save.handle_save_command(args, {}, quiet=True)
     assert res == 0
@@ -36,3 +41,75 @@ def test_handle_save_and_update_flow(monkeypatch):
     args2 = SimpleNamespace(close=False, rebase=False, merge=False, wip=False, story=None)
     res2 = handle_update.handle_update_command(args2, {}, quiet=True)
     assert res2 == 0
+
+
+def test_commit_message_with_quotes_goes_through_stdin(tmp_path, monkeypatch):
+    import subprocess
+    from src import git, trace
+
+    monkeypatch.chdir(tmp_path)
+    subprocess.run('git init -q && git config user.email t@t && git config user.name t', shell=True, check=True)
+    (tmp_path / 'a.txt').write_text('a\n')
+    git.run_command(['git', 'add', '.'])
+    trace.clear_spans()
+    message = 'fix: handle "quotes", `backticks` and $(subshells)'
+    assert git.run_command(handle_save.build_commit_command({}), quiet=True, input=message)
+    log = git.run_command(['git', 'log', '-1', '--format=%s'], capture_output=True)
+    assert log == message
+    spans = trace.get_spans()
+    assert [span['argv'][:2] for span in spans] == [['git', 'commit'], ['git', 'log']]
+    assert all(span['returncode'] == 0 and span['duration'] > 0 for span in spans)
+
+
+def test_save_rebase_drafts_the_message_while_fetching(tmp_path, monkeypatch):
+    from src import fetch
+    from src.git import StagedSnapshot
+
+    drafting = threading.Event()
+    calls = []
+    drafts = []
+
+    def fake_message(config, story, quiet, **kwargs):
+        calls.append('draft' if kwargs.get('cancel') else 'message')
+        if kwargs.get('cancel'):
+            # The draft agent runs away from the tree being rebased, with a copy of the story
+            drafts.append((os.path.realpath(kwargs['workdir']) != os.getcwd(), os.listdir(kwargs['workdir']), story))
+            drafting.set()
+        return 'feat: ok'
+
+    monkeypatch.setattr('src.handle_save.run_command', lambda *a, **k: calls.append(a[0][1]) or True)
+    monkeypatch.setattr('src.handle_save.get_staged_snapshot', lambda *a, **k: StagedSnapshot.from_diff('diff'))
+    monkeypatch.setattr('src.handle_save.has_staged_changes', lambda: True)
+    monkeypatch.setattr('src.handle_save.perform_rebase', lambda *a, **k: calls.append('rebase') or True)
+    monkeypatch.setattr('src.handle_save.get_ai_commit_message', fake_message)
+    # The fetch only succeeds when the agent was called while it ran
+    monkeypatch.setattr(fetch, 'ensure_main_fetched', lambda config, quiet: drafting.wait(2))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'story.md').write_text('story')
+    args = SimpleNamespace(rebase=True, merge=False, wip=False, story='story.md')
+    assert handle_save.handle_save_command(args, {}, quiet=True) == 0
+    assert calls == ['add', 'draft', 'rebase', 'message', 'commit']
+    (away, files, story), = drafts
+    assert away and files == ['story.md'] and os.path.basename(story) == 'story.md'
+    assert not os.path.exists(story)
+
+
+def test_failed_rebase_cancels_the_draft(monkeypatch):
+    from src import fetch
+    from src.git import StagedSnapshot
+
+    cancelled = []
+
+    def fake_message(config, story, quiet, cancel=None, **kwargs):
+        cancelled.append(cancel.wait(2))
+        return None
+
+    monkeypatch.setattr('src.handle_save.run_command', lambda *a, **k: a[0][1] == 'add')
+    monkeypatch.setattr('src.handle_save.get_staged_snapshot', lambda *a, **k: StagedSnapshot.from_diff('diff'))
+    monkeypatch.setattr('src.handle_save.has_staged_changes', lambda: True)
+    monkeypatch.setattr('src.handle_save.perform_merge', lambda *a, **k: False)
+    monkeypatch.setattr('src.handle_save.get_ai_commit_message', fake_message)
+    monkeypatch.setattr(fetch, 'ensure_main_fetched', lambda config, quiet: True)
+    args = SimpleNamespace(rebase=False, merge=True, wip=False, story=None)
+    assert handle_save.handle_save_command(args, {}, quiet=True) == 1
+    assert cancelled == [True]
@@ -0,0 +1,43 @@
+import time
+
+from src import health, message, runner
+from src.git import StagedSnapshot
+
+
+def test_breaker_opens_after_threshold_and_recovers(tmp_path):
+    path = tmp_path / 'health.json'
+    cfg = {'MRKT_BREAKER_THRESHOLD': '2', 'MRKT_BREAKER_COOLDOWN': '60'}
+    health.record_agent_result(cfg, 'codex', False, path=path, now=1000)
+    assert health.is_agent_available(cfg, 'codex', path=path, now=1001)
+    health.record_agent_result(cfg, 'codex', False, path=path, now=1000)
+    assert not health.is_agent_available(cfg, 'codex', path=path, now=1001)
+    assert health.is_agent_available(cfg, 'codex', path=path, now=1061)
+    health.record_agent_result(cfg, 'codex', True, path=path, now=1062)
+    assert health.load_json(path)['codex']['failures'] == 0
+
+
+def test_get_agent_timeout_per_agent_override():
+    cfg = {'MRKT_AGENT_TIMEOUT': '30', 'MRKT_AGENT_TIMEOUT_CODEX': '90'}
+    assert runner.get_agent_timeout(cfg, 'codex') == 90
+    assert runner.get_agent_timeout(cfg, 'copilot') == 30
+    assert runner.get_agent_timeout({'MRKT_AGENT_TIMEOUT': '0'}, 'codex') is None
+
+
+def test_run_agent_process_deadline_kills_command():
+    begin = time.monotonic()
+    assert runner.run_agent_process('sleep 5', timeout=0.2) is None
+    assert time.monotonic() - begin < 3
+
+
+def test_run_agent_skips_agent_with_open_breaker(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        'src.agent_codex.generate_commit_message_with_codex',
+        lambda story, **k: calls.append(story)
+    )
+    cfg = {'MRKT_AGENT': 'codex', 'MRKT_BREAKER_THRESHOLD': '2'}
+    snapshot = StagedSnapshot.from_diff('diff --git a/a b/a\n')
+    assert message.run_agent(cfg, snapshot, quiet=True) is None
+    assert message.run_agent(cfg, snapshot, quiet=True) is None
+    assert message.run_agent(cfg, snapshot, quiet=True) is None
+    assert len(calls) == 2
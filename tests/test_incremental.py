@@ -0,0 +1,57 @@
+import subprocess
+
+from src import handle_update, message
+
+
+def test_second_run_on_same_head_sends_only_the_delta(git_repo, monkeypatch):
+    repo = git_repo('repo')
+    monkeypatch.chdir(repo)
+    sent = []
+
+    def fake_generate(config, snapshot, *args):
+        sent.append(snapshot)
+        return f'feat: message {len(sent)}'
+
+    monkeypatch.setattr(message, 'generate_agent_message', fake_generate)
+
+    def generate():
+        return message.get_ai_commit_message({}, quiet=True, use_cache=False, incremental=True)
+
+    (repo / 'first.txt').write_text('first\n' * 100)
+    git_repo.sh('git add .', repo)
+    assert generate() == 'feat: message 1'
+    assert sent[0].context == ''
+
+    # The commit did not happen; more changes are staged on the same HEAD
+    (repo / 'second.txt').write_text('second\n')
+    git_repo.sh('git add .', repo)
+    assert generate() == 'feat: message 2'
+    assert 'feat: message 1' in sent[1].context
+    assert [file_info['name'] for file_info in sent[1].files] == ['second.txt']
+
+    git_repo.sh('git commit -qm "feat: message 2"', repo)
+    (repo / 'third.txt').write_text('third\n')
+    git_repo.sh('git add .', repo)
+    generate()
+    assert sent[2].context == ''
+    assert [file_info['name'] for file_info in sent[2].files] == ['third.txt']
+
+    (repo / 'third.txt').write_text('third, again\n')
+    git_repo.sh('git add .', repo)
+    message.get_ai_commit_message({'MRKT_INCREMENTAL': 'false'}, quiet=True, use_cache=False, incremental=True)
+    assert sent[3].context == ''
+
+
+def test_close_squash_uses_a_rollup_of_the_branch_messages(git_repo, monkeypatch):
+    repo = git_repo('repo')
+    monkeypatch.chdir(repo)
+    git_repo.sh('git checkout -qb feature', repo)
+    for number, subject in enumerate(['feat: add one', 'fix: repair two']):
+        (repo / f'{number}.txt').write_text(subject)
+        git_repo.sh(f'git add . && git commit -qm "{subject}" -m body', repo)
+
+    assert handle_update.close_branch({'MRKT_AGENT': ''}, 'feature', True, quiet=True)
+    log = subprocess.run(['git', 'log', '--format=%B', '-1'], cwd=repo, capture_output=True, text=True)
+    assert log.stdout.strip() == "Merge branch 'feature'\n\n- feat: add one\n- fix: repair two"
+    count = subprocess.run(['git', 'rev-list', '--count', 'main'], cwd=repo, capture_output=True, text=True)
+    assert count.stdout.strip() == '2'
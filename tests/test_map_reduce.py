@@ -0,0 +1,115 @@
+import os
+
+from src import map_reduce, message
+from src.git import StagedSnapshot
+
+
+def build_snapshot(names, lines=50):
+    diff = ''.join(
+        f'diff --git a/{name} b/{name}\n@@ -0,0 +1,{lines} @@\n' + f'+{name} line\n' * lines
+        for name in names
+    )
+    files = [{'status': 'A', 'name': name, 'additions': lines, 'deletions': 0, 'binary': False} for name in names]
+    return StagedSnapshot.from_diff(diff, files)
+
+
+def test_plan_groups_packs_by_directory():
+    snapshot = build_snapshot(['b/x.py', 'a/y.py', 'b/z.py'])
+    sizes = map_reduce.measure_file_sizes(snapshot)
+    groups = map_reduce.plan_groups(snapshot, sizes, sizes[0] * 2)
+    assert groups == [[1, 0], [2]]
+
+
+def test_run_map_reduce_combines_group_summaries(monkeypatch):
+    snapshot = build_snapshot([f'dir{index}/file.py' for index in range(6)], lines=200)
+    reduced = {}
+
+    def fake_run(command_prompt, cancel=None, timeout=None):
+        path = command_prompt.split('@')[1].split(' ')[0]
+        with open(path) as f:
+            return f"- changed {f.readline().split()[2]}"
+
+    def fake_generate(story_file, reference_file, base_prompt, cancel=None, timeout=None):
+        with open(reference_file) as f:
+            reduced['summaries'] = f.read()
+        return 'feat: combine groups'
+
+    monkeypatch.setattr(map_reduce, 'get_agent_runners', lambda config, name: (fake_run, fake_generate))
+    cfg = {'MRKT_AGENT': 'copilot', 'MRKT_MAX_PROMPT_TOKENS': '1000', 'MRKT_MAP_REDUCE_WORKERS': '3'}
+    assert map_reduce.run_map_reduce(cfg, snapshot, quiet=True) == 'feat: combine groups'
+    assert 'a/dir0/file.py' in reduced['summaries']
+    assert 'a/dir5/file.py' in reduced['summaries']
+
+
+def test_run_map_reduce_passes_references_and_excluded_files(monkeypatch):
+    from src import transport
+
+    snapshot = build_snapshot(['a/x.py', 'b/y.py'], lines=200)
+    snapshot.excluded = [{'status': 'M', 'name': 'yarn.lock', 'additions': 900, 'deletions': 3, 'binary': False}]
+    references = []
+    reduced = {}
+
+    def fake_run(command_prompt, cancel=None, timeout=None):
+        references.append(command_prompt.split('@')[1].split(' ')[0])
+        return '- summary'
+
+    def fake_generate(story_file, reference_file, base_prompt, cancel=None, timeout=None):
+        references.append(reference_file)
+        with open(reference_file) as f:
+            reduced['summaries'] = f.read()
+        return 'feat: combine groups'
+
+    monkeypatch.setattr(map_reduce, 'get_agent_runners', lambda config, name: (fake_run, fake_generate))
+    cfg = {'MRKT_AGENT': 'copilot', 'MRKT_MAX_PROMPT_TOKENS': '100', 'MRKT_REFERENCE_TRANSPORT': 'file'}
+    assert map_reduce.run_map_reduce(cfg, snapshot, quiet=True) == 'feat: combine groups'
+    assert len(references) == 3
+    assert all(os.path.dirname(path) == transport.get_private_dir() for path in references)
+    assert 'yarn.lock | +900 -3' in reduced['summaries']
+
+
+def test_run_map_reduce_uses_the_first_available_agent(monkeypatch):
+    snapshot = build_snapshot(['a/x.py', 'b/y.py'], lines=200)
+    used = []
+    results = []
+
+    def runners(config, name):
+        def run(command_prompt, cancel=None, timeout=None):
+            used.append(name)
+            return '- summary'
+
+        def generate(story_file, reference_file, base_prompt, cancel=None, timeout=None):
+            return f'feat: from {name}'
+        return run, generate
+
+    monkeypatch.setattr(map_reduce, 'get_agent_runners', runners)
+    monkeypatch.setattr(map_reduce, 'is_agent_available', lambda config, name: name != 'codex')
+    monkeypatch.setattr(map_reduce, 'record_agent_result', lambda config, name, ok: results.append((name, ok)))
+    cfg = {'MRKT_AGENT': 'codex, copilot', 'MRKT_MAX_PROMPT_TOKENS': '100'}
+    assert map_reduce.run_map_reduce(cfg, snapshot, quiet=True) == 'feat: from copilot'
+    assert set(used) == {'copilot'} and results == [('copilot', True)]
+
+
+def test_run_map_reduce_stops_when_cancelled(monkeypatch):
+    import threading
+
+    snapshot = build_snapshot(['a/x.py', 'b/y.py'], lines=200)
+    cancel = threading.Event()
+    cancel.set()
+    results = []
+
+    def run(command_prompt, cancel=None, timeout=None):
+        raise AssertionError('a cancelled map-reduce must not call the agent')
+
+    monkeypatch.setattr(map_reduce, 'get_agent_runners', lambda config, name: (run, run))
+    monkeypatch.setattr(map_reduce, 'record_agent_result', lambda config, name, ok: results.append(ok))
+    cfg = {'MRKT_AGENT': 'copilot', 'MRKT_MAX_PROMPT_TOKENS': '100', 'MRKT_BREAKER_THRESHOLD': '0'}
+    assert map_reduce.run_map_reduce(cfg, snapshot, quiet=True, cancel=cancel) is None
+    assert results == []
+
+
+def test_get_ai_commit_message_map_reduce(monkeypatch):
+    snapshot = build_snapshot(['a.py', 'b.py'], lines=400)
+    monkeypatch.setattr('src.map_reduce.run_map_reduce', lambda *a, **k: 'feat: from map reduce')
+    cfg = {'MRKT_AGENT': 'codex', 'MRKT_MAX_PROMPT_TOKENS': '100'}
+    res = message.get_ai_commit_message(cfg, None, quiet=True, use_cache=False, snapshot=snapshot, map_reduce=True)
+    assert res == 'feat: from map reduce'
@@ -1,6 +1,5 @@
-import os
-import subprocess
 from src import message
+from src.git import StagedSnapshot
 
 
 def test_print_message_and_error(capsys):
@@ -12,17 +11,6 @@ def test_print_message_and_error(capsys):
     assert 'Error: boom' in captured.err
 
 
-def test_save_reference_to_file(tmp_path):
-    cwd = os.getcwd()
-    try:
-        os.chdir(tmp_path)
-        message.save_reference_to_file('content')
-        with open('temp_git_message_reference.md', 'r') as f:
-            assert f.read() == 'content'
-    finally:
-        os.chdir(cwd)
-
-
 def test_generate_simple_commit_message_single():
     diff = 'diff --git a/foo b/foo\n'
     assert message.generate_simple_commit_message(diff) == 'Update foo'
@@ -35,8 +23,7 @@ def test_generate_simple_commit_message_multiple():
 
 def test_get_ai_commit_message_fallback(monkeypatch, tmp_path):
     # Simulate no staged diff
-    monkeypatch.setattr(message, 'save_reference_to_file', lambda *a, **k: None)
-    monkeypatch.setattr(message, 'run_command', lambda *a, **k: '')
+    monkeypatch.setattr(message, 'get_staged_snapshot', lambda **kwargs: None)
     cfg = {}
     res = message.get_ai_commit_message(cfg, None, quiet=True)
     assert res is None or isinstance(res, str)
@@ -44,13 +31,13 @@ def test_get_ai_commit_message_fallback(monkeypatch, tmp_path):
 
 def test_get_ai_commit_message_uses_copilot_module(monkeypatch, tmp_path):
     # Simulate staged diff and that copilot module returns a message
-    monkeypatch.setattr(message, 'run_command', lambda *a, **k: 'diff --git a/foo b/foo\n')
-    monkeypatch.setattr(message, 'save_reference_to_file', lambda *a, **k: None)
+    snapshot = StagedSnapshot.from_diff('diff --git a/foo b/foo\n')
+    monkeypatch.setattr(message, 'get_staged_snapshot', lambda **kwargs: snapshot)
 
     # Fake the copilot module function
     monkeypatch.setattr(
         'src.agent_copilot.generate_commit_message_with_copilot',
-        lambda story: 'feat(scope): copilot generated'
+        lambda story, **k: 'feat(scope): copilot generated'
     )
 
     cfg = {'MRKT_AGENT': 'copilot'}
@@ -61,14 +48,48 @@ def test_get_ai_commit_message_uses_copilot_module(monkeypatch, tmp_path):
 
 def test_get_ai_commit_message_uses_codex_module(monkeypatch, tmp_path):
     # Simulate staged diff and that codex module returns a message
-    monkeypatch.setattr(message, 'run_command', lambda *a, **k: 'diff --git a/foo b/foo\n')
+    snapshot = StagedSnapshot.from_diff('diff --git a/foo b/foo\n')
+    monkeypatch.setattr(message, 'get_staged_snapshot', lambda **kwargs: snapshot)
 
     monkeypatch.setattr(
         'src.agent_codex.generate_commit_message_with_codex',
-        lambda story: 'feat(scope): codex generated'
+        lambda story, **k: 'feat(scope): codex generated'
     )
 
     cfg = {'MRKT_AGENT': 'codex'}
     res = message.get_ai_commit_message(cfg, None, quiet=True)
     assert isinstance(res, str)
     assert res.startswith('feat(')
+
+
+def test_generate_simple_commit_message_from_chunks():
+    snapshot = StagedSnapshot.from_diff('diff --git a/foo b/foo\n+x\ndiff --git a/bar b/bar\n+y\n')
+    assert message.generate_simple_commit_message(snapshot.iter_diff_chunks()) == 'Update 2 files'
+
+
+def test_generic_agent_reads_the_changes_from_stdin_as_chunks(tmp_path):
+    import sys
+
+    story = tmp_path / 'story.md'
+    story.write_text('the story')
+    pulled = []
+
+    def chunks():
+        for chunk in (b'diff --git a/foo b/foo\n', b'+bar\n'):
+            pulled.append(chunk)
+            yield chunk
+
+    echo = f'{sys.executable} -c "import sys; sys.stdout.write(sys.stdin.read())"'
+    cfg = {'MRKT_AGENT_PATH': echo}
+    output = message.call_generic_agent(cfg, 'echo', chunks(), str(story), quiet=True)
+    assert output == 'Story context:\nthe story\n\ndiff --git a/foo b/foo\n+bar'
+    assert len(pulled) == 2
+
+
+def test_agent_runs_in_the_given_workdir(tmp_path):
+    import sys
+
+    snapshot = StagedSnapshot.from_diff('diff --git a/foo b/foo\n')
+    pwd = f'{sys.executable} -c "import os; print(\'feat: in \' + os.getcwd())"'
+    cfg = {'MRKT_AGENT_PATH': pwd}
+    assert message.call_agent(cfg, 'pwd', snapshot, None, quiet=True, workdir=str(tmp_path)) == f'feat: in {tmp_path}'
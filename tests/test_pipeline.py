@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from src import trace
+from src.pipeline import Step, run_pipeline
+
+
+def test_independent_steps_run_concurrently():
+    both = threading.Barrier(2, timeout=2)
+
+    def meet(results):
+        both.wait()
+        return True
+
+    pipeline = run_pipeline([
+        Step('a', meet),
+        Step('b', meet),
+        Step('c', lambda results: results['a'] and results['b'] and 'done', ('a', 'b')),
+    ])
+    assert pipeline.ok
+    assert pipeline.results['c'] == 'done'
+
+
+def test_failure_stops_dependents_and_cancels_running_steps():
+    cancel = threading.Event()
+    started = []
+
+    def slow(results):
+        started.append('slow')
+        return 'cancelled' if cancel.wait(2) else 'finished'
+
+    pipeline = run_pipeline([
+        Step('slow', slow),
+        Step('fail', lambda results: False),
+        Step('after', lambda results: started.append('after'), ('fail',)),
+    ], cancel)
+    assert pipeline.failed == 'fail'
+    assert pipeline.results['slow'] == 'cancelled'
+    assert started == ['slow']
+
+
+def test_exceptions_are_raised_after_running_steps_end():
+    finished = []
+
+    def boom(results):
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        run_pipeline([Step('boom', boom), Step('other', lambda results: finished.append(True))])
+    assert finished == [True]
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        run_pipeline([Step('a', lambda results: True, ('missing',))])
+    with pytest.raises(ValueError):
+        run_pipeline([Step('a', lambda results: True, ('b',)), Step('b', lambda results: True, ('a',))])
+
+
+def test_step_spans_nest_under_the_caller_span():
+    trace.clear_spans()
+
+    def traced(results):
+        with trace.span('inner'):
+            return True
+
+    with trace.span('outer'):
+        run_pipeline([Step('a', traced)])
+    spans = {record['name']: record for record in trace.get_spans()}
+    assert spans['inner']['parent'] == spans['outer']['id']
@@ -0,0 +1,46 @@
+import subprocess
+import time
+
+from src import handle_status, push
+from src.runner import CommandResult
+
+
+def test_background_push_reaches_origin_and_is_reported(git_repo, monkeypatch, capsys):
+    repo = git_repo('repo', remote=True)
+    monkeypatch.chdir(repo)
+    assert push.request_push(['git', 'push', 'origin', 'main'], 'main') is True
+    deadline = time.monotonic() + 10
+    while push.get_push_records()['main']['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    head = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, capture_output=True, text=True).stdout.strip()
+    remote = subprocess.run(['git', 'rev-parse', 'main'], cwd=f'{repo}.git', capture_output=True, text=True).stdout.strip()
+    assert remote == head
+    assert 'exit 0' in open(push.get_push_log_path()).read()
+    assert handle_status.handle_status_command(None, {}, quiet=False) == 0
+    assert f'origin/main: pushed {head[:7]}' in capsys.readouterr().out
+
+
+def test_updates_during_a_push_are_coalesced(git_repo, monkeypatch):
+    repo = git_repo('repo', remote=True)
+    monkeypatch.chdir(repo)
+    calls = []
+
+    def fake_run(argv, **kwargs):
+        calls.append(argv)
+        if len(calls) == 1:
+            # Two updates arrive while the first push runs
+            assert push.request_push(argv, 'main') is False
+            assert push.request_push(argv, 'main') is False
+        return CommandResult(argv=argv, returncode=0, stdout=b'', stderr='', duration=0.0)
+
+    monkeypatch.setattr(push, 'run', fake_run)
+    assert push.push_until_done(['git', 'push', 'origin', 'main'], 'main') == 0
+    assert len(calls) == 2
+    assert push.get_push_records()['main']['status'] == 'done'
+
+
+def test_status_reports_failed_and_interrupted_pushes():
+    line, ok = handle_status.describe_push('main', {'status': 'failed', 'returncode': 128, 'finished': 0})
+    assert not ok and 'exit code 128' in line
+    line, ok = handle_status.describe_push('topic', {'status': 'running', 'pid': 0})
+    assert (line, ok) == ('origin/topic: push interrupted', False)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from src import message, race, runner
+from src.git import StagedSnapshot
+
+
+def slow_call(delay, msg, started=None):
+    def call(cancel):
+        if started is not None:
+            started.append(time.monotonic())
+        if cancel.wait(delay):
+            return None
+        return msg
+    return call
+
+
+def test_race_agents_returns_first_success():
+    calls = [('slow', slow_call(2, 'feat: slow')), ('fast', slow_call(0.01, 'feat: fast'))]
+    assert race.race_agents(calls, 'race') == ('fast', 'feat: fast')
+
+
+def test_race_agents_skips_failures():
+    calls = [('broken', lambda cancel: None), ('ok', slow_call(0.05, 'fix: ok'))]
+    assert race.race_agents(calls, 'race') == ('ok', 'fix: ok')
+    assert race.race_agents([('broken', lambda cancel: None)], 'race') == (None, None)
+
+
+def test_race_agents_stops_when_asked():
+    stop = threading.Event()
+    cancelled = []
+
+    def call(cancel):
+        stop.set()
+        cancelled.append(cancel.wait(2))
+        return None
+
+    start = time.monotonic()
+    assert race.race_agents([('slow', call)], 'race', stop=stop) == (None, None)
+    assert time.monotonic() - start < 1
+    deadline = time.monotonic() + 2
+    while not cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cancelled == [True]
+
+
+def test_hedge_starts_next_agent_after_delay():
+    started = []
+    calls = [('stalled', slow_call(5, 'feat: late', started)), ('backup', slow_call(0, 'feat: backup', started))]
+    begin = time.monotonic()
+    assert race.race_agents(calls, 'hedge', hedge_delay=0.1) == ('backup', 'feat: backup')
+    assert started[1] - begin >= 0.1
+
+
+def test_run_agent_process_cancel_kills_command():
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    begin = time.monotonic()
+    assert runner.run_agent_process(['sleep', '5'], cancel=cancel) is None
+    assert time.monotonic() - begin < 2
+    result = runner.run_agent_process(['echo', 'feat: done'])
+    assert result.returncode == 0
+    assert result.stdout == b'feat: done\n'
+
+
+def test_run_agent_races_configured_agents(monkeypatch):
+    monkeypatch.setattr(
+        'src.agent_copilot.generate_commit_message_with_copilot',
+        lambda story, cancel=None, **k: None if cancel.wait(2) else 'feat: copilot'
+    )
+    monkeypatch.setattr(
+        'src.agent_codex.generate_commit_message_with_codex',
+        lambda story, **k: 'feat: codex'
+    )
+    cfg = {'MRKT_AGENT': 'copilot, codex', 'MRKT_AGENT_STRATEGY': 'race'}
+    snapshot = StagedSnapshot.from_diff('diff --git a/a b/a\n')
+    assert message.run_agent(cfg, snapshot, quiet=True) == 'feat: codex'
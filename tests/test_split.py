@@ -0,0 +1,52 @@
+import subprocess
+from types import SimpleNamespace
+
+from src import handle_save, split
+
+
+def names(files, groups):
+    return [[files[index]['name'] for index in group] for group in groups]
+
+
+def test_plan_commit_groups_clusters_related_files():
+    files = [{'name': name} for name in [
+        'README.md', 'docs/usage.md', 'src/cache.py', 'src/git.py', 'src/view.html',
+        'src/view.py', 'tests/test_cache.py', 'tests/test_other.py',
+    ]]
+    groups = split.plan_commit_groups(files)
+    assert names(files, groups) == [
+        ['README.md'],
+        ['docs/usage.md'],
+        ['src/cache.py', 'tests/test_cache.py'],
+        ['src/git.py'],
+        ['src/view.html', 'src/view.py'],
+        ['tests/test_other.py'],
+    ]
+
+
+def test_plan_commit_groups_uses_co_changes():
+    files = [{'name': 'src/a.py'}, {'name': 'src/b.py'}, {'name': 'web/a.js'}]
+    history = [['src/b.py', 'web/a.js'], ['src/b.py', 'web/a.js', 'x'], ['src/a.py', 'web/a.js']]
+    assert names(files, split.plan_commit_groups(files, history)) == [['src/a.py'], ['src/b.py', 'web/a.js']]
+
+
+def test_save_split_commits_each_group(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    subprocess.run('git init -q && git config user.email t@t && git config user.name t', shell=True, check=True)
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'old.py').write_text('x = 1\n')
+    subprocess.run('git add . && git commit -qm init', shell=True, check=True)
+    subprocess.run('git mv src/old.py src/new.py', shell=True, check=True)
+    (tmp_path / 'README.md').write_text('# readme\n')
+
+    def fake_message(config, story, quiet, snapshot=None, **k):
+        return f"chore: update {snapshot.files[0]['name']}"
+
+    monkeypatch.setattr(split, 'get_ai_commit_message', fake_message)
+    args = SimpleNamespace(rebase=False, merge=False, wip=False, story=None, split=True)
+    assert handle_save.handle_save_command(args, {'MRKT_SPLIT_WORKERS': '2'}, quiet=True) == 0
+
+    log = subprocess.run('git log --format=%s --name-status', shell=True, capture_output=True, text=True).stdout
+    assert log.startswith('chore: update src/new.py')
+    assert 'chore: update README.md\n\nA\tREADME.md' in log
+    assert subprocess.run('git status --porcelain', shell=True, capture_output=True, text=True).stdout == ''
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+# Budget in seconds for `mrkt help` in a fresh interpreter, from importing
+# `src.main` to the help being printed. Editor hooks call mrkt many times
+# a day, so start-up must stay cheap.
+START_BUDGET = float(os.environ.get('MRKT_IMPORT_BUDGET', '0.05'))
+
+MEASURE_START = '''
+import contextlib, io, sys, time
+sys.argv = ['mrkt', 'help']
+start = time.perf_counter()
+import src.main
+modules = ','.join(sorted(m for m in sys.modules if m.startswith('src.')))
+eager = ','.join(m for m in ('argparse', 'subprocess') if m in sys.modules)
+with contextlib.redirect_stdout(io.StringIO()) as output:
+    code = src.main.main()
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(modules)
+print(eager)
+print(code == 0 and 'usage: mrkt' in output.getvalue())
+'''
+
+
+def measure_start():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-c', MEASURE_START],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, modules, eager, helped = result.stdout.split('\n')[:4]
+    assert helped == 'True'
+    return float(elapsed), modules.split(','), eager
+
+
+def test_main_import_is_lazy():
+    _, modules, eager = measure_start()
+    assert modules == ['src.input', 'src.main']
+    assert eager == ''
+
+
+def test_help_within_budget():
+    # Best of a few runs to ignore a cold disk cache on the first one.
+    elapsed = min(measure_start()[0] for _ in range(3))
+    assert elapsed < START_BUDGET
+
+
+def test_handlers_do_not_import_the_agent_machinery():
+    result = subprocess.run(
+        [sys.executable, '-c', "import sys, src.handle_status; print(','.join(sorted(m for m in sys.modules if m.startswith('src.'))))"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = result.stdout.strip().split(',')
+    assert not {'src.agents', 'src.condense', 'src.story', 'src.map_reduce', 'src.streaming', 'src.cache'} & set(modules)
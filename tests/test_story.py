@@ -0,0 +1,76 @@
+import os
+
+from src import message, story
+from src.git import StagedSnapshot
+
+STORY = '''# Checkout revamp
+
+Context shared by every task.
+
+## Task 1: Payment provider
+Integrate the payment provider with retries on refused cards.
+''' + ''.join(f'''
+## Task {number}: Filler {number}
+Unrelated work on the newsletter templates and marketing pages, part {number}.
+''' for number in range(2, 30)) + '''
+## Task 30: Story index
+Split the story file into sections and rank them with BM25 so that
+`select_story_excerpt` only sends the relevant sections to the agent.
+'''
+
+DIFF = '''diff --git a/src/story_index.py b/src/story_index.py
+--- a/src/story_index.py
++++ b/src/story_index.py
+@@ -1 +1,2 @@
++def select_story_excerpt(config, story_file, snapshot):
++    return rank_sections_with_bm25(story_file)
+'''
+
+
+def make_snapshot():
+    files = [{'status': 'M', 'name': 'src/story_index.py', 'old_name': None, 'additions': 2, 'deletions': 0, 'binary': False}]
+    return StagedSnapshot.from_diff(DIFF, files)
+
+
+def test_sections_follow_headings():
+    sections = story.split_sections('intro\n# One\na\nTask 2 b\nc\n')
+    assert sections == [(0, 6), (6, 14), (14, 25)]
+    assert story.split_sections('first\n\nsecond\n') == [(0, 7), (7, 14)]
+    assert story.tokenize('parseStoryFile(story_file)') == ['parsestoryfile', 'parse', 'story', 'file', 'story_file', 'story', 'file']
+
+
+def test_only_relevant_sections_within_the_budget(tmp_path):
+    path = tmp_path / 'story.md'
+    path.write_text(STORY)
+    config = {'MRKT_STORY_MAX_TOKENS': '100'}
+    excerpt = story.select_story_excerpt(config, str(path), make_snapshot())
+    assert excerpt.text.startswith('## Task 30: Story index')
+    assert 'Task 1:' not in excerpt.text and 'Filler' not in excerpt.text
+    assert excerpt.size <= 400 and excerpt.total_sections == 31
+    assert story.select_story_excerpt({'MRKT_STORY_MAX_TOKENS': '0'}, str(path), make_snapshot()) is None
+    assert story.select_story_excerpt({}, str(path), make_snapshot()) is None
+
+
+def test_index_is_cached_by_content(tmp_path, monkeypatch):
+    path = tmp_path / 'story.md'
+    path.write_text(STORY)
+    monkeypatch.setattr(story, '_indexes', {})
+    monkeypatch.setattr(story, 'get_state_path', lambda name: tmp_path / name)
+    first = story.get_story_index(str(path), STORY)
+    assert (tmp_path / story.INDEX_FILE_NAME).exists()
+
+    story._indexes.clear()
+    monkeypatch.setattr(story, 'build_index', lambda text: [])
+    os.utime(path, ns=(0, 0))
+    assert story.get_story_index(str(path), STORY) == first
+
+
+def test_agent_gets_the_excerpt(tmp_path):
+    path = tmp_path / 'story.md'
+    path.write_text(STORY)
+    with message.open_story({'MRKT_STORY_MAX_TOKENS': '100'}, str(path), make_snapshot(), quiet=True) as reference:
+        assert reference != str(path)
+        with open(reference) as f:
+            assert f.read().startswith('## Task 30')
+    with message.open_story({}, str(path), make_snapshot(), quiet=True) as reference:
+        assert reference == str(path)
@@ -0,0 +1,85 @@
+import time
+
+from src import runner
+from src.streaming import MessageStream, get_idle_gap
+
+
+def test_message_starts_at_the_header_and_ends_at_the_sentinel():
+    lines = []
+    stream = MessageStream('Total usage', preview=lines.append)
+    assert stream.feed(b'Reading the diff...\nfeat(core): add') is False
+    assert stream.idle_gap is None
+    assert stream.feed(b' streaming\n\n- details\n') is False
+    assert stream.feed(b'Total usage est: 1 request\nmore\n') is True
+    assert lines == ['feat(core): add streaming', '', '- details']
+    assert stream.end == len(b'Reading the diff...\nfeat(core): add streaming\n\n- details\n')
+
+
+def test_idle_gap_applies_once_the_message_started():
+    stream = MessageStream(idle_gap=2.0, require_header=False)
+    assert stream.idle_gap is None
+    stream.feed(b'Update files\n')
+    assert stream.idle_gap == 2.0
+    assert get_idle_gap({'MRKT_AGENT_IDLE_GAP': '0'}) is None
+    assert get_idle_gap({}) is None
+
+
+def test_agent_stopped_after_an_idle_gap_fails():
+    argv = ['sh', '-c', 'echo "tool logs"; echo "fix: stop early"; sleep 5; echo late']
+    start = time.monotonic()
+    with runner.watch_agent_output(MessageStream(idle_gap=0.2)):
+        result = runner.run_agent_process(argv, timeout=10)
+    assert time.monotonic() - start < 3
+    assert result.stopped and result.idle and not result.ok
+    assert result.text == 'tool logs\nfix: stop early\n'
+
+
+def test_agent_pausing_without_idle_gap_is_not_stopped():
+    argv = ['sh', '-c', 'echo "fix: pause"; sleep 0.5; echo; echo "- body"']
+    with runner.watch_agent_output(MessageStream()):
+        result = runner.run_agent_process(argv, timeout=10)
+    assert result.ok and not result.stopped
+    assert result.text == 'fix: pause\n\n- body\n'
+
+
+def test_agent_is_stopped_at_the_sentinel_and_reads_stdin():
+    argv = ['sh', '-c', 'cat; echo "tokens used: 12"; sleep 5']
+    with runner.watch_agent_output(MessageStream('tokens used')):
+        result = runner.run_agent_process(argv, timeout=10, input=b'feat: from stdin\n')
+    assert result.stopped and not result.idle and result.ok
+    assert result.text == 'feat: from stdin\n'
+
+
+def test_agent_that_exits_is_not_stopped():
+    with runner.watch_agent_output(MessageStream(idle_gap=5)):
+        result = runner.run_agent_process(['sh', '-c', 'echo "feat: done"; exit 3'])
+    assert not result.stopped and result.returncode == 3 and not result.ok
+    assert result.text == 'feat: done\n'
+
+
+def test_deadline_still_applies_while_streaming():
+    with runner.watch_agent_output(MessageStream(idle_gap=5)):
+        assert runner.run_agent_process(['sleep', '5'], timeout=0.2) is None
+
+
+def test_default_config_stops_the_stub_agents_at_their_footer(tmp_path, monkeypatch):
+    import os
+
+    from benchmarks.run import STUBS_DIR
+    from src import message, trace
+    from src.git import StagedSnapshot
+    from src.main import load_config
+
+    monkeypatch.setenv('PATH', STUBS_DIR + os.pathsep + os.environ.get('PATH', ''))
+    # The stubs linger after their footer, like a CLI closing its session
+    monkeypatch.setenv('MRKT_STUB_LINGER', '5')
+    config = load_config(str(tmp_path), {})
+    snapshot = StagedSnapshot.from_diff('diff --git a/foo b/foo\n')
+    for agent_name in ('copilot', 'codex'):
+        trace.clear_spans()
+        start = time.monotonic()
+        msg = message.call_agent(config, agent_name, snapshot, None, quiet=True)
+        assert time.monotonic() - start < 3
+        assert msg == 'chore(bench): update generated files'
+        record, = [record for record in trace.get_spans() if record['name'] == agent_name]
+        assert record['stopped'] and record['returncode'] is not None
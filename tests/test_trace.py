@@ -0,0 +1,54 @@
+import json
+
+from src import main, trace
+
+
+def fake_handler(args, config, quiet):
+    with trace.span('outer', files=2):
+        with trace.span('inner'):
+            trace.count('cache.hit')
+    return 0
+
+
+def test_spans_are_nested_per_thread():
+    trace.clear_spans()
+    fake_handler(None, {}, True)
+    inner, outer = trace.get_spans()
+    assert inner['parent'] == outer['id'] and outer['parent'] is None
+    assert outer['duration'] >= inner['duration']
+    text = trace.format_text(trace.get_spans(), trace.get_counters())
+    assert '\n  outer' in text and '\n    inner' in text and 'files=2' in text
+    assert 'cache.hit: 1' in text
+
+
+def test_get_trace_format():
+    assert trace.get_trace_format('true') == 'text'
+    assert trace.get_trace_format('Chrome') == 'chrome'
+    assert trace.get_trace_format('false') is None
+    assert trace.get_trace_format(None) is None
+
+
+def test_main_exports_chrome_trace(tmp_path, monkeypatch):
+    trace.clear_spans()
+    monkeypatch.setattr(main, 'get_command_handler', lambda command: fake_handler)
+    path = tmp_path / 'trace.json'
+    assert main.main(['save', '--trace=chrome'], {'MRKT_TRACE_FILE': str(path)}) == 0
+    events = json.loads(path.read_text())['traceEvents']
+    assert [event['name'] for event in events] == ['inner', 'outer', 'save', 'cache.hit']
+    assert events[2]['ph'] == 'X' and events[2]['args'] == {'exit_code': 0}
+    assert events[3]['ph'] == 'C'
+
+
+def test_main_appends_json_lines_from_config(tmp_path, monkeypatch):
+    trace.clear_spans()
+    monkeypatch.setattr(main, 'get_command_handler', lambda command: fake_handler)
+    path = tmp_path / 'trace.jsonl'
+    config = {'MRKT_TRACE': 'json', 'MRKT_TRACE_FILE': str(path)}
+    main.main(['update'], config)
+    main.main(['update'], config)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    types = [line['type'] for line in lines]
+    # Each run exports its own three spans, then its counters
+    assert types == ['span'] * 3 + ['counters'] + ['span'] * 3 + ['counters']
+    assert [line['name'] for line in lines if line['type'] == 'span'] == ['inner', 'outer', 'update'] * 2
+    assert lines[3]['counters'] == lines[7]['counters'] == {'cache.hit': 1}
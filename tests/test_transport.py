@@ -0,0 +1,43 @@
+import os
+import subprocess
+
+import pytest
+
+from src import message, transport
+from src.git import StagedSnapshot
+
+
+@pytest.mark.parametrize('kind', ['memfd', 'fifo', 'file'])
+def test_reference_is_readable_by_child_processes(kind, tmp_path, monkeypatch):
+    if kind == 'memfd' and not transport.supports_memfd():
+        pytest.skip('memfd is not available')
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+    content = [b'diff --git a/foo b/foo\n', b'+x\n' * 100000]
+    with transport.open_reference(content, kind) as path:
+        assert not path.startswith(str(work_dir))
+        result = subprocess.run(['cat', path], capture_output=True)
+    assert result.stdout == b''.join(content)
+    assert os.listdir(work_dir) == []
+    if kind != 'memfd':
+        assert not os.path.exists(path)
+
+
+def test_fifo_reference_without_reader_does_not_hang():
+    with transport.open_reference('unread', 'fifo') as path:
+        assert os.path.exists(path)
+
+
+def test_generic_agent_reads_large_diff_from_stdin(tmp_path, monkeypatch):
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+    agent = tmp_path / 'agent'
+    agent.write_text('#!/bin/sh\nwc -c\n')
+    agent.chmod(0o755)
+    diff = 'diff --git a/foo b/foo\n' + '+' + 'x' * 1024 * 1024 + '\n'
+    snapshot = StagedSnapshot.from_diff(diff)
+    config = {'MRKT_AGENT': 'agent', 'MRKT_AGENT_PATH': str(agent), 'MRKT_MAX_PROMPT_TOKENS': '0'}
+    assert message.run_agent(config, snapshot, quiet=True) == str(len(diff))
+    assert os.listdir(work_dir) == []
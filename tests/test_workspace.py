@@ -0,0 +1,49 @@
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+
+from src import handle_save, runner, workspace
+
+
+def make_repo(git_repo, name, dirty=True):
+    path = git_repo(name, {'.meerkatrc': 'MRKT_AGENT=\n'})
+    if dirty:
+        (path / 'file.txt').write_text('change\n')
+
+
+def test_find_repos_from_glob_and_file(tmp_path, git_repo):
+    make_repo(git_repo, 'one')
+    make_repo(git_repo, 'two')
+    (tmp_path / 'plain').mkdir()
+    assert workspace.find_repos(str(tmp_path / '*')) == [str(tmp_path / 'one'), str(tmp_path / 'two')]
+    (tmp_path / 'repos.txt').write_text('# workspace\ntwo\nplain\n')
+    assert workspace.find_repos(str(tmp_path / 'repos.txt')) == [str(tmp_path / 'two')]
+
+
+def test_save_runs_in_every_repo(tmp_path, git_repo, capsys):
+    make_repo(git_repo, 'one')
+    make_repo(git_repo, 'two')
+    make_repo(git_repo, 'clean', dirty=False)
+    args = SimpleNamespace(rebase=False, merge=False, wip=False, story=None, repos=str(tmp_path / '*'))
+    assert handle_save.handle_save_command(args, {'MRKT_REPOS_WORKERS': '2'}, quiet=True) == 0
+    for name in ('one', 'two'):
+        log = subprocess.run('git log -1 --format=%s', shell=True, capture_output=True, text=True, cwd=tmp_path / name)
+        assert log.stdout.strip() == 'Update file.txt'
+    out = capsys.readouterr().out
+    assert 'Succeeded (2)' in out
+    assert 'Nothing to commit (1)' in out
+
+
+def test_agent_slots_limit_concurrent_calls():
+    runner.set_agent_slots(threading.BoundedSemaphore(1))
+    try:
+        start = time.monotonic()
+        threads = [threading.Thread(target=runner.run_agent_process, args=(['sleep', '0.2'],)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - start >= 0.4
+    finally:
+        runner.set_agent_slots(None)